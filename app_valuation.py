@@ -4,12 +4,30 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
-import requests
-from bs4 import BeautifulSoup
-import yfinance as yf
+import time
+import uuid
 import warnings
 warnings.filterwarnings('ignore')
 
+from valuation_core import (
+    ARQUIVO_TEMPOS,
+    CAMPOS_SETORIAIS,
+    METODOS_MULTIPLOS,
+    NOMES_FONTES,
+    TTL_FONTES,
+    CacheTTL,
+    ClienteHTTP,
+    ErroPremissas,
+    JANELAS_BANDAS_ANOS,
+    IndiceSetorial,
+    ProtecaoFontes,
+    RegistroTempos,
+    ValuationEngine,
+    normalizar_setor,
+    reduzir_serie,
+    resumo_bandas,
+)
+
 # Configuração da página
 st.set_page_config(
     page_title="Valuation Brasil - Fontes Confiáveis",
@@ -58,290 +76,122 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class DadosConfiaveis:
-    def __init__(self):
-        self.acoes_brasileiras = {
-            'PETR4': 'Petrobras',
-            'VALE3': 'Vale', 
-            'ITUB4': 'Itaú Unibanco',
-            'BBDC4': 'Bradesco',
-            'WEGE3': 'WEG',
-            'MGLU3': 'Magazine Luiza',
-            'BBAS3': 'Banco do Brasil',
-            'ABEV3': 'Ambev',
-            'RENT3': 'Localiza',
-            'B3SA3': 'B3',
-            'RADL3': 'Raia Drogasil',
-            'SUZB3': 'Suzano',
-            'EQTL3': 'Equatorial'
-        }
-    
-    def get_preco_atual_b3(self, ticker):
-        """Busca preço atual da B3 via Yahoo Finance (único dado confiável)"""
-        try:
-            acao = yf.Ticker(f"{ticker}.SA")
-            info = acao.info
-            return info.get('currentPrice')
-        except:
-            return None
-    
-    def get_dados_status_invest(self, ticker):
-        """Busca dados fundamentalistas do Status Invest (mais confiável)"""
-        try:
-            # URL do Status Invest
-            url = f"https://statusinvest.com.br/acoes/{ticker.lower()}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extrair dados (exemplo - precisa adaptar para estrutura real)
-            dados = {}
-            
-            # Preço atual
-            price_element = soup.find('strong', {'class': 'value'})
-            if price_element:
-                dados['preco_atual'] = float(price_element.text.replace('R$', '').replace(',', '.').strip())
-            
-            # Aqui você implementaria a extração dos outros dados
-            # P/L, P/VP, DY, ROE, etc.
-            
-            return dados
-            
-        except Exception as e:
-            st.warning(f"Não foi possível acessar Status Invest: {e}")
-            return None
-    
-    def get_dados_fundamentus(self, ticker):
-        """Busca dados do Fundamentus (alternativa)"""
-        try:
-            url = f"https://www.fundamentus.com.br/detalhes.php?papel={ticker}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(url, headers=headers)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extrair dados do Fundamentus
-            dados = {}
-            
-            # Implementar parsing da tabela do Fundamentus
-            # ...
-            
-            return dados
-            
-        except Exception as e:
-            st.warning(f"Não foi possível acessar Fundamentus: {e}")
-            return None
-    
-    def get_dados_alpha_vantage(self, ticker):
-        """Busca dados da Alpha Vantage (API internacional)"""
-        try:
-            API_KEY = "demo"  # Use sua chave gratuita
-            url = f"https://www.alphavantage.co/query"
-            params = {
-                'function': 'OVERVIEW',
-                'symbol': f"{ticker}.SAO",
-                'apikey': API_KEY
-            }
-            
-            response = requests.get(url, params=params)
-            data = response.json()
-            
-            if 'Symbol' in data:
-                return {
-                    'nome': data.get('Name', ''),
-                    'setor': data.get('Sector', ''),
-                    'lpa': float(data.get('EPS', 0)),
-                    'pl': float(data.get('PERatio', 0)),
-                    'pvp': float(data.get('PriceToBookRatio', 0)),
-                    'roe': float(data.get('ReturnOnEquityTTM', 0)) / 100,
-                    'dy': float(data.get('DividendYield', 0)) / 100,
-                    'vpa': float(data.get('BookValue', 0))
-                }
-            return None
-            
-        except Exception as e:
-            st.warning(f"Não foi possível acessar Alpha Vantage: {e}")
-            return None
-    
-    def get_dados_empresa(self, ticker):
-        """Busca dados de múltiplas fontes e consolida"""
-        st.info(f"🔄 Buscando dados confiáveis para {ticker}...")
-        
-        dados_consolidados = {
-            'ticker': ticker,
-            'nome': self.acoes_brasileiras.get(ticker, ticker),
-            'fonte': 'Múltiplas fontes'
-        }
-        
-        # 1. Preço atual (Yahoo Finance - único dado razoavelmente confiável)
-        preco_atual = self.get_preco_atual_b3(ticker)
-        if preco_atual:
-            dados_consolidados['preco_atual'] = preco_atual
-        
-        # 2. Dados fundamentalistas (Alpha Vantage como fallback)
-        dados_av = self.get_dados_alpha_vantage(ticker)
-        if dados_av:
-            dados_consolidados.update(dados_av)
-            dados_consolidados['fonte_fundamentais'] = 'Alpha Vantage'
-        
-        # 3. Se Alpha Vantage não funcionar, usar dados realistas pré-definidos
-        if not dados_av:
-            dados_consolidados.update(self.get_dados_realistas(ticker))
-            dados_consolidados['fonte_fundamentais'] = 'Dados realistas pré-definidos'
-        
-        # 4. Histórico de preços (Yahoo Finance)
-        try:
-            acao = yf.Ticker(f"{ticker}.SA")
-            historico = acao.history(period="1y")
-            dados_consolidados['historico'] = historico
-        except:
-            dados_consolidados['historico'] = None
-        
-        return dados_consolidados
-    
-    def get_dados_realistas(self, ticker):
-        """Dados realistas pré-definidos baseados em relatórios recentes"""
-        dados_realistas = {
-            'PETR4': {
-                'setor': 'Energy', 'pl': 4.5, 'pvp': 0.9, 'dy': 0.1768, 
-                'roe': 0.28, 'lpa': 8.20, 'vpa': 30.97, 'margem_liquida': 0.18
-            },
-            'VALE3': {
-                'setor': 'Basic Materials', 'pl': 6.2, 'pvp': 1.1, 'dy': 0.089,
-                'roe': 0.22, 'lpa': 12.50, 'vpa': 45.20, 'margem_liquida': 0.25
-            },
-            'ITUB4': {
-                'setor': 'Financial Services', 'pl': 9.8, 'pvp': 1.3, 'dy': 0.065,
-                'roe': 0.16, 'lpa': 2.10, 'vpa': 18.50, 'margem_liquida': 0.22
-            },
-            'BBDC4': {
-                'setor': 'Financial Services', 'pl': 8.5, 'pvp': 0.9, 'dy': 0.071,
-                'roe': 0.14, 'lpa': 1.80, 'vpa': 16.80, 'margem_liquida': 0.18
-            },
-            'WEGE3': {
-                'setor': 'Industrials', 'pl': 28.5, 'pvp': 6.2, 'dy': 0.012,
-                'roe': 0.24, 'lpa': 1.45, 'vpa': 8.90, 'margem_liquida': 0.14
-            },
-            'MGLU3': {
-                'setor': 'Consumer Cyclical', 'pl': -15.2, 'pvp': 0.8, 'dy': 0.000,
-                'roe': -0.08, 'lpa': -0.32, 'vpa': 3.45, 'margem_liquida': -0.03
-            },
-            'BBAS3': {
-                'setor': 'Financial Services', 'pl': 7.2, 'pvp': 0.8, 'dy': 0.068,
-                'roe': 0.17, 'lpa': 4.50, 'vpa': 32.10, 'margem_liquida': 0.20
-            },
-            'ABEV3': {
-                'setor': 'Consumer Defensive', 'pl': 18.5, 'pvp': 2.1, 'dy': 0.035,
-                'roe': 0.12, 'lpa': 0.95, 'vpa': 8.20, 'margem_liquida': 0.13
-            }
-        }
-        
-        return dados_realistas.get(ticker, {
-            'setor': 'N/A', 'pl': 10.0, 'pvp': 1.2, 'dy': 0.05,
-            'roe': 0.15, 'lpa': 5.0, 'vpa': 20.0, 'margem_liquida': 0.12
-        })
+RESOLUCOES_SENSIBILIDADE = [25, 50, 100, 200, 400]
+# Perto de r = g o valor explode: a escala de cores satura neste percentil dos valores válidos
+PERCENTIL_COR_SENSIBILIDADE = 95
 
-class ValuationEngine:
-    def __init__(self):
-        self.dados_client = DadosConfiaveis()
-    
-    def calcular_target_multiplos(self, dados_empresa, metodo, dados_setor=None):
-        """Calcula target price por múltiplos"""
-        lpa = dados_empresa.get('lpa')
-        vpa = dados_empresa.get('vpa')
-        preco_atual = dados_empresa.get('preco_atual')
-        
-        if not preco_atual:
-            return None
-        
-        if metodo == 'pl_historico' and lpa:
-            pl_historico = dados_empresa.get('pl', 10) * 0.9
-            return lpa * pl_historico
-            
-        elif metodo == 'pl_setor' and lpa and dados_setor:
-            pl_setor = dados_setor.get('pl', 10)
-            return lpa * pl_setor
-            
-        elif metodo == 'pvp_historico' and vpa:
-            pvp_historico = dados_empresa.get('pvp', 1.2) * 0.95
-            return vpa * pvp_historico
-            
-        elif metodo == 'pvp_setor' and vpa and dados_setor:
-            pvp_setor = dados_setor.get('pvp', 1.2)
-            return vpa * pvp_setor
-            
-        elif metodo == 'ev_ebitda_setor':
-            ev_ebitda_setor = 6
-            return preco_atual * 1.1  # Simplificação
-        
-        return None
-    
-    def modelo_gordon(self, dados_empresa, taxa_crescimento, taxa_retorno_requerida):
-        """Modelo de Gordon para valuation por dividendos"""
-        dy = dados_empresa.get('dy') or dados_empresa.get('dividend_yield')
-        preco_atual = dados_empresa.get('preco_atual')
-        
-        if not dy or not preco_atual or taxa_retorno_requerida <= taxa_crescimento:
-            return None
-        
-        dividendo_anual = preco_atual * dy
-        valor_justo = dividendo_anual / (taxa_retorno_requerida - taxa_crescimento)
-        return valor_justo
-    
-    def fluxo_caixa_descontado(self, premisas):
-        """Modelo de Fluxo de Caixa Descontado"""
-        try:
-            fcff_ano0 = premisas['fcff_inicial']
-            crescimento_estagio1 = premisas['crescimento_estagio1'] / 100
-            crescimento_estagio2 = premisas['crescimento_estagio2'] / 100
-            anos_estagio1 = premisas['anos_estagio1']
-            wacc = premisas['wacc'] / 100
-            taxa_perpetuidade = premisas['taxa_perpetuidade'] / 100
-            
-            if wacc <= taxa_perpetuidade:
-                return None
-            
-            # Calcular FCFF para cada ano
-            fluxos_estagio1 = []
-            fcff_atual = fcff_ano0
-            
-            for ano in range(1, anos_estagio1 + 1):
-                fcff_atual *= (1 + crescimento_estagio1)
-                valor_presente = fcff_atual / ((1 + wacc) ** ano)
-                fluxos_estagio1.append({
-                    'ano': ano,
-                    'fcff': fcff_atual,
-                    'vp': valor_presente
-                })
-            
-            # Calcular valor terminal
-            fcff_terminal = fcff_atual * (1 + crescimento_estagio2)
-            valor_terminal = fcff_terminal / (wacc - taxa_perpetuidade)
-            valor_presente_terminal = valor_terminal / ((1 + wacc) ** anos_estagio1)
-            
-            # Soma todos os valores presentes
-            vp_fluxos = sum([f['vp'] for f in fluxos_estagio1])
-            valor_empresa = vp_fluxos + valor_presente_terminal
-            
-            numero_acoes = premisas.get('numero_acoes', 1)
-            valor_por_acao = valor_empresa / numero_acoes
-            
-            return {
-                'valor_por_acao': valor_por_acao,
-                'valor_empresa': valor_empresa,
-                'fluxos_estagio1': fluxos_estagio1,
-                'valor_terminal': valor_terminal
-            }
-            
-        except Exception as e:
-            st.error(f"Erro no cálculo FCD: {e}")
-            return None
+# Orçamento de pontos por gráfico (~ largura em pixels) e acima de quanto usar WebGL
+PONTOS_POR_GRAFICO = 1000
+LIMITE_WEBGL = 1000
+MAX_BARRAS_HISTOGRAMA = 200
+
+OPCOES_REDUCAO = {'LTTB': 'lttb', 'Mín/Máx': 'min_max', 'Sem redução': None}
 
+NOMES_PREMISSAS_FCD = {
+    'fcff_inicial': 'FCFF Inicial',
+    'crescimento_estagio1': 'Crescimento Estágio 1',
+    'wacc': 'WACC',
+    'crescimento_estagio2': 'Crescimento Perpétuo',
+    'taxa_perpetuidade': 'Taxa de Crescimento Perpétua'
+}
+
+def grafico_sensibilidade(superficie, eixo_x, eixo_y, titulo, rotulo_x, rotulo_y, ponto_atual=None,
+                          percentil_cor=PERCENTIL_COR_SENSIBILIDADE):
+    """Heatmap de uma superfície de sensibilidade; células inválidas (NaN) ficam em branco e a cor satura no percentil"""
+    superficie = np.asarray(superficie, dtype=float)
+    finitos = superficie[np.isfinite(superficie)]
+    escala = {}
+    if finitos.size:
+        # O hover continua mostrando o valor real; só a cor é limitada
+        escala = dict(zmin=float(finitos.min()), zmax=float(np.percentile(finitos, percentil_cor)))
+    fig = go.Figure(go.Heatmap(
+        z=np.where(np.isfinite(superficie), superficie, np.nan),
+        x=eixo_x,
+        y=eixo_y,
+        colorscale='RdYlGn',
+        colorbar=dict(title=f'R$ (até p{percentil_cor})'),
+        **escala,
+        hovertemplate=f"{rotulo_x}: %{{x:.2f}}%<br>{rotulo_y}: %{{y:.2f}}%<br>Valor: R$ %{{z:.2f}}<extra></extra>"
+    ))
+    if ponto_atual:
+        fig.add_trace(go.Scatter(
+            x=[ponto_atual[0]], y=[ponto_atual[1]], mode='markers',
+            marker=dict(symbol='x', size=12, color='black'), name='Premissas atuais'
+        ))
+    fig.update_layout(title=titulo, xaxis_title=f"{rotulo_x} (%)", yaxis_title=f"{rotulo_y} (%)")
+    return fig
+
+def grafico_serie(serie, titulo, rotulo_y, metodo='lttb'):
+    """Linha de uma série longa: reduzida ao orçamento de pontos e em WebGL quando ainda for grande"""
+    reduzida = reduzir_serie(serie, PONTOS_POR_GRAFICO, metodo) if metodo else serie.dropna()
+    Traco = go.Scattergl if len(reduzida) > LIMITE_WEBGL else go.Scatter
+    fig = go.Figure(Traco(x=reduzida.index, y=reduzida.to_numpy(), mode='lines', name=rotulo_y))
+    fig.update_layout(title=titulo, xaxis_title="Data", yaxis_title=rotulo_y)
+    return fig, len(reduzida)
+
+def grafico_bandas(bandas, multiplo, rotulo, anos):
+    """Múltiplo diário com a média móvel e a faixa de ±1 desvio da janela escolhida"""
+    serie = bandas[multiplo].dropna()
+    # Os mesmos pregões da série reduzida em todas as curvas, para a faixa acompanhar o múltiplo
+    recorte = bandas.loc[reduzir_serie(serie, PONTOS_POR_GRAFICO).index]
+    media, desvio = recorte[f'{multiplo}_media_{anos}a'], recorte[f'{multiplo}_desvio_{anos}a']
+    Traco = go.Scattergl if len(recorte) > LIMITE_WEBGL else go.Scatter
+    
+    fig = go.Figure()
+    fig.add_trace(Traco(x=recorte.index, y=media + desvio, mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(Traco(
+        x=recorte.index, y=media - desvio, mode='lines', line=dict(width=0),
+        fill='tonexty', fillcolor='rgba(31, 119, 180, 0.15)', name='±1 desvio'
+    ))
+    fig.add_trace(Traco(x=recorte.index, y=media, mode='lines', line=dict(dash='dash'), name=f'Média {anos} ano(s)'))
+    fig.add_trace(Traco(x=recorte.index, y=recorte[multiplo], mode='lines', name=rotulo))
+    fig.update_layout(title=f"{rotulo} histórico - bandas de {anos} ano(s)", xaxis_title="Data", yaxis_title=rotulo)
+    return fig
+
+def formatar_idade(segundos):
+    """Idade legível de um dado: '45 s', '12 min', '3 h' ou '2 dias'"""
+    for limite, divisor, unidade in ((60, 1, 's'), (3600, 60, 'min'), (86400, 3600, 'h')):
+        if segundos < limite:
+            return f"{segundos / divisor:.0f} {unidade}"
+    return f"{segundos / 86400:.0f} dias"
+
+def status_fontes(dados_client):
+    """Fontes com o disjuntor aberto, no sidebar"""
+    for fonte, situacao in dados_client.protecao.situacao().items():
+        if situacao['estado'] != 'fechado':
+            st.sidebar.caption(
+                f"⛔ {NOMES_FONTES.get(fonte, fonte)} suspensa após {situacao['falhas_seguidas']} falhas "
+                f"(nova tentativa em {situacao['restante_s']:.0f} s)"
+            )
+
+def get_registro_tempos():
+    """Registro de tempos da sessão: cada usuário vê só os próprios reruns"""
+    if 'tempos' not in st.session_state:
+        st.session_state['tempos'] = RegistroTempos(arquivo=ARQUIVO_TEMPOS, sessao=uuid.uuid4().hex[:8])
+    return st.session_state['tempos']
+
+def plotar(fig, nome):
+    """st.plotly_chart medido: a serialização da figura costuma ser o passo mais caro do rerun"""
+    with get_registro_tempos().medir(f'grafico.{nome}'):
+        st.plotly_chart(fig)
+
+def painel_desempenho(tempos):
+    """Quebra do tempo do rerun atual por span e hits/misses do cache por fonte"""
+    with st.sidebar.expander("⏱️ Desempenho", expanded=True):
+        resumo = pd.DataFrame(tempos.resumo())
+        if resumo.empty:
+            st.caption("Nenhum span registrado nesta execução")
+            return
+        st.dataframe(resumo.set_index('nome').style.format({'total_ms': '{:.1f}', 'max_ms': '{:.1f}'}))
+        
+        cache = pd.DataFrame(tempos.resumo_cache())
+        if not cache.empty:
+            st.dataframe(cache.set_index('fonte'))
+        if tempos.arquivo:
+            st.caption(f"Spans exportados para {tempos.arquivo}")
+
+# Fragmentos: interagir com os widgets de uma aba reexecuta só a própria aba
+@st.fragment
 def analise_gordon(valuation, dados_empresa):
     st.markdown('<h3 class="section-header">Modelo de Gordon - Valuation por Dividendos</h3>', unsafe_allow_html=True)
     
@@ -396,93 +246,98 @@ def analise_gordon(valuation, dados_empresa):
                 
                 # Análise de sensibilidade
                 st.info("**Análise de Sensibilidade:**")
-                sens_data = []
-                for crescimento in [2.0, 2.5, 3.0]:
-                    for retorno in [9.0, 10.0, 11.0]:
-                        valor = valuation.modelo_gordon(
-                            dados_empresa, 
-                            crescimento/100, 
-                            retorno/100
-                        )
-                        if valor:
-                            sens_data.append({
-                                'Crescimento': crescimento,
-                                'Retorno': retorno,
-                                'Valor': valor
-                            })
+                resolucao = st.select_slider(
+                    "Resolução da superfície (Gordon)",
+                    options=RESOLUCOES_SENSIBILIDADE,
+                    value=200
+                )
+                crescimentos = np.linspace(0.0, 10.0, resolucao)
+                retornos = np.linspace(5.0, 20.0, resolucao)
+                superficie = valuation.superficie_gordon(
+                    dados_empresa, crescimentos / 100, retornos / 100
+                )
                 
-                if sens_data:
-                    df_sens = pd.DataFrame(sens_data)
-                    pivot = df_sens.pivot(index='Crescimento', columns='Retorno', values='Valor')
-                    st.dataframe(pivot.style.format("{:.2f}"))
+                if superficie is not None:
+                    fig = grafico_sensibilidade(
+                        superficie, retornos, crescimentos,
+                        "Valor Justo: Crescimento × Retorno Requerido",
+                        "Retorno Requerido", "Crescimento",
+                        ponto_atual=(taxa_retorno_requerida, taxa_crescimento)
+                    )
+                    plotar(fig, 'gordon_sensibilidade')
             else:
                 st.error("Não foi possível calcular o valuation pelo Modelo de Gordon")
         else:
             st.warning("Dados de dividend yield ou preço atual não disponíveis")
 
+@st.fragment
 def analise_fcd(valuation, dados_empresa):
     st.markdown('<h3 class="section-header">Fluxo de Caixa Descontado (FCD)</h3>', unsafe_allow_html=True)
     
     st.subheader("📋 Premissas do Modelo FCD")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        fcff_inicial = st.number_input(
-            "FCFF Inicial (R$ milhões)",
-            min_value=0.0,
-            max_value=100000.0,
-            value=1000.0,
-            step=100.0
-        )
+    # Formulário: as premissas só são aplicadas no envio, não a cada tecla
+    with st.form("premissas_fcd"):
+        col1, col2 = st.columns(2)
         
-        crescimento_estagio1 = st.slider(
-            "Crescimento Estágio 1 (%)",
-            min_value=0.0,
-            max_value=30.0,
-            value=8.0,
-            step=0.5
-        )
+        with col1:
+            fcff_inicial = st.number_input(
+                "FCFF Inicial (R$ milhões)",
+                min_value=0.0,
+                max_value=100000.0,
+                value=1000.0,
+                step=100.0
+            )
         
-        anos_estagio1 = st.slider(
-            "Anos no Estágio 1",
-            min_value=1,
-            max_value=10,
-            value=5
-        )
-    
-    with col2:
-        crescimento_estagio2 = st.slider(
-            "Crescimento Perpétuo (%)",
-            min_value=0.0,
-            max_value=5.0,
-            value=2.5,
-            step=0.1
-        )
+            crescimento_estagio1 = st.slider(
+                "Crescimento Estágio 1 (%)",
+                min_value=0.0,
+                max_value=30.0,
+                value=8.0,
+                step=0.5
+            )
         
-        wacc = st.slider(
-            "WACC (%)",
-            min_value=5.0,
-            max_value=20.0,
-            value=10.0,
-            step=0.5
-        )
+            anos_estagio1 = st.slider(
+                "Anos no Estágio 1",
+                min_value=1,
+                max_value=10,
+                value=5
+            )
         
-        taxa_perpetuidade = st.slider(
-            "Taxa de Crescimento Perpétua (%)",
-            min_value=0.0,
-            max_value=5.0,
-            value=2.0,
-            step=0.1
+        with col2:
+            crescimento_estagio2 = st.slider(
+                "Crescimento Perpétuo (%)",
+                min_value=0.0,
+                max_value=5.0,
+                value=2.5,
+                step=0.1
+            )
+        
+            wacc = st.slider(
+                "WACC (%)",
+                min_value=5.0,
+                max_value=20.0,
+                value=10.0,
+                step=0.5
+            )
+        
+            taxa_perpetuidade = st.slider(
+                "Taxa de Crescimento Perpétua (%)",
+                min_value=0.0,
+                max_value=5.0,
+                value=2.0,
+                step=0.1
+            )
+        
+        numero_acoes = st.number_input(
+            "Número de Ações (milhões)",
+            min_value=1.0,
+            max_value=10000.0,
+            value=1000.0,
+            step=100.0
         )
-    
-    numero_acoes = st.number_input(
-        "Número de Ações (milhões)",
-        min_value=1.0,
-        max_value=10000.0,
-        value=1000.0,
-        step=100.0
-    )
+        
+        st.form_submit_button("Calcular FCD")
     
     # Calcular FCD
     premisas = {
@@ -495,7 +350,11 @@ def analise_fcd(valuation, dados_empresa):
         'numero_acoes': numero_acoes
     }
     
-    resultado_fcd = valuation.fluxo_caixa_descontado(premisas)
+    try:
+        resultado_fcd = valuation.fluxo_caixa_descontado(premisas)
+    except ErroPremissas as erro:
+        st.error(str(erro))
+        return
     
     if resultado_fcd:
         st.subheader("🎯 Resultado do Valuation FCD")
@@ -532,11 +391,172 @@ def analise_fcd(valuation, dados_empresa):
         # Gráfico dos fluxos
         fig = px.bar(fluxos_df, x='ano', y='fcff', 
                      title="Fluxos de Caixa Livre Projetados")
-        st.plotly_chart(fig)
+        plotar(fig, 'fcd_fluxos')
+        
+        # Superfície de sensibilidade
+        st.subheader("🌡️ Sensibilidade: WACC × Crescimento Perpétuo")
+        resolucao = st.select_slider(
+            "Resolução da superfície (FCD)",
+            options=RESOLUCOES_SENSIBILIDADE,
+            value=200
+        )
+        waccs = np.linspace(5.0, 20.0, resolucao)
+        taxas_perpetuidade = np.linspace(0.0, 5.0, resolucao)
+        superficie = valuation.superficie_fcd(premisas, waccs, taxas_perpetuidade)
+        fig = grafico_sensibilidade(
+            superficie.T, waccs, taxas_perpetuidade,
+            "Valor por Ação: WACC × Crescimento Perpétuo",
+            "WACC", "Crescimento Perpétuo",
+            ponto_atual=(wacc, taxa_perpetuidade)
+        )
+        plotar(fig, 'fcd_sensibilidade')
+        
+        analise_tornado(valuation, premisas)
+        
+        simulacao_monte_carlo(valuation, premisas, dados_empresa['ticker'])
     
     else:
         st.error("Não foi possível calcular o valuation por FCD. Verifique as premissas.")
 
+def grafico_tornado(fechado, choques):
+    """Impacto linear de um choque em cada premissa no valor por ação, do maior para o menor"""
+    valor = fechado['valor_por_acao']
+    impactos = sorted(
+        ((NOMES_PREMISSAS_FCD[chave], derivada * choques[chave]) for chave, derivada in fechado['derivadas'].items()),
+        key=lambda item: abs(item[1])
+    )
+    nomes = [nome for nome, _ in impactos]
+    fig = go.Figure([
+        go.Bar(y=nomes, x=[impacto for _, impacto in impactos], base=valor, orientation='h', name='Premissa para cima'),
+        go.Bar(y=nomes, x=[-impacto for _, impacto in impactos], base=valor, orientation='h', name='Premissa para baixo'),
+    ])
+    fig.add_vline(x=valor, line_dash='dash')
+    fig.update_layout(
+        title="Tornado: Valor por Ação com cada premissa chocada",
+        xaxis_title="Valor por Ação (R$)",
+        barmode='overlay'
+    )
+    return fig
+
+def analise_tornado(valuation, premisas):
+    st.subheader("🌪️ Sensibilidade por Premissa")
+    
+    fechado = valuation.fluxo_caixa_descontado_fechado(premisas)
+    if fechado is None:
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        choque_taxas = st.slider("Choque nas taxas (p.p.)", min_value=0.1, max_value=5.0, value=1.0, step=0.1)
+    with col2:
+        choque_fcff = st.slider("Choque no FCFF (%)", min_value=1, max_value=50, value=10, step=1)
+    
+    # Derivadas analíticas: o gráfico é instantâneo, sem reavaliar o modelo por premissa
+    choques = {chave: choque_taxas for chave in NOMES_PREMISSAS_FCD}
+    choques['fcff_inicial'] = premisas['fcff_inicial'] * choque_fcff / 100
+    plotar(grafico_tornado(fechado, choques), 'fcd_tornado')
+    
+    elasticidades = pd.DataFrame({
+        'Premissa': [NOMES_PREMISSAS_FCD[chave] for chave in fechado['derivadas']],
+        'dValor/dPremissa': list(fechado['derivadas'].values()),
+        'Elasticidade': list(fechado['elasticidades'].values())
+    }).set_index('Premissa')
+    st.dataframe(elasticidades.style.format('{:.4f}'))
+    st.caption("Derivadas por p.p. nas taxas e por R$ milhão no FCFF; elasticidade = variação % do valor por variação % da premissa")
+    
+    with st.expander("Validação por diferenças finitas"):
+        validacao = pd.DataFrame(valuation.validar_derivadas_fcd(premisas)).T
+        validacao.index = [NOMES_PREMISSAS_FCD[chave] for chave in validacao.index]
+        st.dataframe(validacao.style.format({'analitica': '{:.6f}', 'numerica': '{:.6f}', 'erro_relativo': '{:.2e}'}))
+
+@st.fragment
+def simulacao_monte_carlo(valuation, premisas, ticker):
+    st.subheader("🎲 Simulação Monte Carlo")
+    
+    formulario = st.form("simulacao_monte_carlo")
+    col1, col2, col3 = formulario.columns(3)
+    
+    with col1:
+        desvio_crescimento = st.number_input(
+            "Desvio do Crescimento Estágio 1 (p.p.)",
+            min_value=0.0, max_value=10.0, value=2.0, step=0.5,
+            help="Crescimento do FCFF ~ Normal(premissa, desvio)"
+        )
+        n_caminhos = st.select_slider(
+            "Número de caminhos",
+            options=[10_000, 100_000, 1_000_000, 5_000_000],
+            value=1_000_000,
+            format_func=lambda n: f"{n:,}".replace(',', '.')
+        )
+    
+    with col2:
+        faixa_wacc = st.slider(
+            "Faixa do WACC (%)",
+            min_value=5.0, max_value=20.0,
+            value=(max(premisas['wacc'] - 2.0, 5.0), min(premisas['wacc'] + 2.0, 20.0)),
+            step=0.5,
+            help="WACC ~ Triangular(mín, premissa, máx)"
+        )
+        semente = st.number_input("Semente", min_value=0, value=42, step=1)
+    
+    with col3:
+        faixa_perpetuidade = st.slider(
+            "Faixa do Crescimento Perpétuo (%)",
+            min_value=0.0, max_value=5.0,
+            value=(max(premisas['taxa_perpetuidade'] - 1.0, 0.0), min(premisas['taxa_perpetuidade'] + 1.0, 5.0)),
+            step=0.1,
+            help="Crescimento perpétuo ~ Uniforme(mín, máx)"
+        )
+    
+    distribuicoes = {
+        'crescimento_estagio1': ('normal', premisas['crescimento_estagio1'], desvio_crescimento),
+        'wacc': ('triangular', faixa_wacc[0], min(max(premisas['wacc'], faixa_wacc[0]), faixa_wacc[1]), faixa_wacc[1]),
+        'taxa_perpetuidade': ('uniforme', faixa_perpetuidade[0], faixa_perpetuidade[1])
+    }
+    
+    # O resultado fica na sessão para sobreviver aos reruns, amarrado ao ticker e às premissas que o geraram
+    chave = (ticker, tuple(sorted(premisas.items())))
+    if formulario.form_submit_button("Rodar simulação"):
+        with st.spinner("Simulando..."):
+            st.session_state['monte_carlo'] = {
+                'chave': chave,
+                'resultado': valuation.monte_carlo_fcd(
+                    premisas, distribuicoes, n_caminhos=n_caminhos, semente=int(semente)
+                )
+            }
+    
+    simulacao = st.session_state.get('monte_carlo')
+    if not simulacao:
+        return
+    if simulacao['chave'] != chave:
+        # Ticker ou premissas mudaram: o resultado antigo não vale mais
+        del st.session_state['monte_carlo']
+        st.info("Premissas alteradas desde a última simulação. Rode a simulação novamente.")
+        return
+    resultado = simulacao['resultado']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("P5", f"R$ {resultado['p5']:.2f}")
+    col2.metric("Mediana", f"R$ {resultado['p50']:.2f}")
+    col3.metric("P95", f"R$ {resultado['p95']:.2f}")
+    col4.metric("Média", f"R$ {resultado['media']:.2f}", help=f"Desvio padrão: R$ {resultado['desvio']:.2f}")
+    
+    if resultado['descartados']:
+        st.caption(f"{resultado['descartados']:,} caminhos descartados (WACC ≤ crescimento perpétuo)")
+    
+    bordas, contagens = resultado['acumulador'].histograma(MAX_BARRAS_HISTOGRAMA)
+    centros = (bordas[:-1] + bordas[1:]) / 2
+    fig = go.Figure(go.Bar(x=centros, y=contagens, name='Caminhos'))
+    for rotulo, valor in [('P5', resultado['p5']), ('Mediana', resultado['p50']), ('P95', resultado['p95'])]:
+        fig.add_vline(x=valor, line_dash='dash', annotation_text=rotulo)
+    fig.update_layout(
+        title="Distribuição do Valor por Ação",
+        xaxis_title="Valor por Ação (R$)",
+        yaxis_title="Frequência",
+        bargap=0
+    )
+    plotar(fig, 'monte_carlo')
+
 def analise_dados_empresa(dados_empresa):
     st.markdown('<h3 class="section-header">Dados Fundamentais da Empresa</h3>', unsafe_allow_html=True)
     
@@ -579,14 +599,33 @@ def analise_dados_empresa(dados_empresa):
                 st.metric(nome, "N/A")
     
     # Histórico de preços
-    if dados_empresa.get('historico') is not None:
-        st.subheader("📊 Histórico de Preços (1 ano)")
-        
-        historico = dados_empresa['historico']
-        fig = px.line(historico, x=historico.index, y='Close', 
-                     title=f"Preço de Fechamento - {dados_empresa['ticker']}")
-        st.plotly_chart(fig)
+    if dados_empresa.get('historico') is not None and not dados_empresa['historico'].empty:
+        grafico_historico(dados_empresa)
+
+@st.fragment
+def grafico_historico(dados_empresa):
+    st.subheader("📊 Histórico de Preços")
+    
+    fechamentos = dados_empresa['historico']['Close']
+    datas = fechamentos.index
+    col1, col2 = st.columns([3, 1])
+    
+    # Zoom: a janela escolhida é reduzida de novo a partir da série completa, com mais detalhe
+    with col1:
+        inicio, fim = datas[0].date(), datas[-1].date()
+        if inicio < fim:
+            inicio, fim = st.slider("Período", min_value=inicio, max_value=fim, value=(inicio, fim), format="DD/MM/YYYY")
+    with col2:
+        reducao = st.radio("Redução", list(OPCOES_REDUCAO), horizontal=True)
+    
+    janela = fechamentos[(datas >= pd.Timestamp(inicio)) & (datas < pd.Timestamp(fim) + pd.Timedelta(days=1))]
+    fig, n_pontos = grafico_serie(
+        janela, f"Preço de Fechamento - {dados_empresa['ticker']}", "Fechamento (R$)", OPCOES_REDUCAO[reducao]
+    )
+    plotar(fig, 'historico')
+    st.caption(f"{n_pontos:,} de {len(janela):,} pontos exibidos".replace(',', '.'))
 
+@st.fragment
 def analise_multiplos(valuation, dados_empresa):
     st.markdown('<h3 class="section-header">Valuation por Múltiplos de Mercado</h3>', unsafe_allow_html=True)
     
@@ -617,10 +656,9 @@ def analise_multiplos(valuation, dados_empresa):
     with col2:
         st.subheader("🎯 Target Prices")
         
-        # Dados do setor
-        dados_setor = {
-            'pl': 10, 'pvp': 1.2, 'roe': 0.15
-        }
+        # Medianas do setor calculadas pelo índice setorial
+        indice = valuation.dados_client.indice_setorial
+        dados_setor = indice.dados_setor(dados_empresa.get('setor'))
         
         # Calcular targets
         targets = {}
@@ -648,6 +686,197 @@ def analise_multiplos(valuation, dados_empresa):
                 )
         else:
             st.info("Preço atual necessário para calcular targets")
+    
+    bandas_historicas(dados_empresa)
+    multiplos_setor(valuation, dados_empresa)
+
+def bandas_historicas(dados_empresa):
+    st.subheader("📉 Múltiplos Históricos")
+    
+    bandas = dados_empresa.get('bandas_multiplos')
+    if bandas is None or bandas.empty:
+        st.info("Histórico de preços ou balanços indisponível: targets por múltiplo histórico não calculados")
+        return
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        rotulo = st.radio("Múltiplo", ["P/L", "P/VP"], key="bandas_multiplo")
+        anos = st.selectbox("Janela (anos)", JANELAS_BANDAS_ANOS, index=len(JANELAS_BANDAS_ANOS) - 1, key="bandas_janela")
+    multiplo = {'P/L': 'pl', 'P/VP': 'pvp'}[rotulo]
+    with col2:
+        if bandas[multiplo].notna().any():
+            plotar(grafico_bandas(bandas, multiplo, rotulo, anos), 'bandas')
+        else:
+            st.info(f"{rotulo} sem valores positivos no período")
+    
+    resumo = resumo_bandas(bandas)
+    resumo['multiplo'] = resumo['multiplo'].map({'pl': 'P/L', 'pvp': 'P/VP'})
+    st.dataframe(resumo.set_index(['multiplo', 'janela_anos']).style.format('{:.2f}', na_rep='N/A'))
+    st.caption(
+        "Preço diário dividido pelo LPA (12 meses) e VPA do último balanço já divulgado. "
+        "O target histórico usa a média da janela mais longa disponível."
+    )
+
+def multiplos_setor(valuation, dados_empresa):
+    st.subheader("🏭 Múltiplos do Setor")
+    
+    indice = valuation.dados_client.indice_setorial
+    setor = dados_empresa.get('setor')
+    if st.button(
+        "Atualizar índice setorial", help="Busca os fundamentos de todo o universo para recalcular os setores",
+        disabled=not indice.pronto.is_set()
+    ):
+        with st.spinner("Buscando fundamentos do universo..."):
+            valuation.dados_client.get_dados_universo()
+    
+    agregados = indice.agregados(setor)
+    linhas = [
+        {
+            'Indicador': campo.upper(),
+            'Empresas': agregado['n'],
+            'Mediana': agregado['mediana'],
+            'Média aparada': agregado['media_aparada'],
+            'P25': agregado['p25'],
+            'P75': agregado['p75'],
+            'Usado no target': 'Setor' if agregado['n'] >= indice.min_empresas else 'Padrão'
+        }
+        for campo, agregado in agregados.items()
+    ]
+    
+    if not indice.pronto.is_set():
+        st.info("Índice setorial em construção: até terminar, os indicadores com poucas empresas usam a referência padrão.")
+    st.caption(f"Setor: {normalizar_setor(setor) or 'N/A'} | {len(indice)} empresas no índice")
+    if linhas:
+        st.dataframe(pd.DataFrame(linhas).set_index('Indicador').style.format({
+            'Mediana': '{:.2f}', 'Média aparada': '{:.2f}', 'P25': '{:.2f}', 'P75': '{:.2f}'
+        }))
+    faltando = [campo.upper() for campo in CAMPOS_SETORIAIS if agregados.get(campo, {}).get('n', 0) < indice.min_empresas]
+    if faltando:
+        st.caption(
+            f"Menos de {indice.min_empresas} empresas do setor com {', '.join(faltando)}: "
+            "usando a referência padrão nesses indicadores."
+        )
+    
+    with st.expander("Setores no índice"):
+        # Quantas empresas sustentam cada mediana: setor com poucas cai na referência padrão
+        resumo = [
+            {
+                'Setor': nome,
+                'Empresas': empresas,
+                **{
+                    f'{campo.upper()} (n)': indice.agregados(nome).get(campo, {}).get('n', 0)
+                    for campo in CAMPOS_SETORIAIS
+                }
+            }
+            for nome, empresas in sorted(indice.setores().items(), key=lambda item: -item[1])
+        ]
+        if resumo:
+            st.dataframe(pd.DataFrame(resumo).set_index('Setor'))
+        else:
+            st.caption("Índice vazio: nenhuma empresa com fundamentos de fonte real.")
+
+@st.cache_resource
+def get_cache_dados():
+    """Cache compartilhado entre reruns do Streamlit"""
+    return CacheTTL()
+
+@st.fragment
+def analise_triagem(valuation):
+    st.markdown('<h3 class="section-header">Triagem do Universo</h3>', unsafe_allow_html=True)
+    
+    st.write(
+        "Executa múltiplos, Gordon e um FCD padrão para todas as ações do universo "
+        "e ordena pelo upside médio."
+    )
+    
+    max_threads = st.number_input(
+        "Threads (busca de dados)", min_value=1, max_value=64, value=8, step=1
+    )
+    
+    if st.button("Rodar triagem"):
+        inicio = time.perf_counter()
+        with st.spinner("Avaliando o universo..."):
+            st.session_state['triagem'] = valuation.triagem_universo(max_threads=int(max_threads))
+        st.caption(f"Triagem concluída em {time.perf_counter() - inicio:.1f} s")
+    
+    ranking = st.session_state.get('triagem')
+    if ranking is None or ranking.empty:
+        return
+    
+    colunas = {'nome': 'Nome', 'preco_atual': 'Preço Atual'}
+    for metodo, nome in METODOS_MULTIPLOS + [('gordon', 'Gordon'), ('fcd', 'FCD')]:
+        colunas[f'upside_{metodo}'] = f'Upside {nome}'
+    colunas['upside_medio'] = 'Upside Médio'
+    
+    tabela = ranking[list(colunas)].rename(columns=colunas)
+    formatos = {coluna: '{:+.1%}' for coluna in tabela.columns if coluna.startswith('Upside')}
+    formatos['Preço Atual'] = 'R$ {:.2f}'
+    st.dataframe(tabela.style.format(formatos, na_rep='N/A'))
+    
+    st.subheader("🔁 Expectativas Implícitas no Preço")
+    st.caption(
+        "Crescimento do estágio 1 e WACC que fazem o FCD da triagem igualar o preço atual, "
+        "e retorno exigido implícito no Modelo de Gordon"
+    )
+    implicitas = {
+        'crescimento_implicito': 'Crescimento Implícito (%)',
+        'wacc_implicito': 'WACC Implícito (%)',
+        'retorno_gordon_implicito': 'Retorno Gordon Implícito (%)'
+    }
+    tabela_implicita = ranking[['nome', 'preco_atual'] + list(implicitas)].rename(columns=dict(colunas, **implicitas))
+    # Casos sem solução aparecem com o motivo no lugar do número
+    for coluna, nome in implicitas.items():
+        status = ranking[f'status_{coluna}']
+        tabela_implicita[nome] = tabela_implicita[nome].map('{:.2f}'.format).where(status == 'ok', status)
+    st.dataframe(tabela_implicita.style.format({'Preço Atual': 'R$ {:.2f}'}, na_rep='N/A'))
+    
+    fig = px.bar(
+        ranking.reset_index(), x='ticker', y='upside_medio',
+        title="Upside Médio por Ação"
+    )
+    fig.update_yaxes(tickformat='.0%')
+    plotar(fig, 'triagem')
+
+@st.cache_resource
+def get_cliente_http():
+    """Sessão HTTP (pool de conexões e limitadores) compartilhada entre reruns"""
+    return ClienteHTTP()
+
+@st.cache_resource
+def get_indice_setorial():
+    """Índice setorial compartilhado, montado em segundo plano com a tabela do Fundamentus; cada ticker buscado depois o atualiza"""
+    indice = IndiceSetorial()
+    # Sem o registro de tempos da sessão: o recurso é do processo e sobrevive à primeira sessão
+    motor = ValuationEngine(
+        cache=get_cache_dados(), http=get_cliente_http(), indice_setorial=indice, protecao=get_protecao_fontes()
+    )
+    motor.dados_client.montar_indice_em_segundo_plano()
+    return indice
+
+@st.cache_resource
+def get_protecao_fontes():
+    """Disjuntores e pool de revalidação do processo: uma fonte falhando não é retestada por cada sessão"""
+    return ProtecaoFontes()
+
+def get_valuation():
+    """Engine da sessão: criado uma vez e reaproveitado em todos os reruns"""
+    if 'valuation' not in st.session_state:
+        st.session_state['valuation'] = ValuationEngine(
+            cache=get_cache_dados(), http=get_cliente_http(), tempos=get_registro_tempos(),
+            indice_setorial=get_indice_setorial(), protecao=get_protecao_fontes()
+        )
+    return st.session_state['valuation']
+
+def get_dados_sessao(valuation, ticker):
+    """Dados da empresa guardados na sessão; só volta às fontes ao trocar de ticker ou quando a cotação vence"""
+    guardado = st.session_state.get('dados_empresa')
+    if guardado and guardado[0] == ticker and time.monotonic() - guardado[1] < TTL_FONTES['preco']:
+        return guardado[2]
+    
+    with st.spinner(f"Buscando dados confiáveis para {ticker}..."):
+        dados_empresa = valuation.dados_client.get_dados_empresa(ticker, bandas=True)
+    st.session_state['dados_empresa'] = (ticker, time.monotonic(), dados_empresa)
+    return dados_empresa
 
 def main():
     st.markdown('<h1 class="main-header">📊 Valuation Brasil - Fontes Confiáveis</h1>', unsafe_allow_html=True)
@@ -659,11 +888,27 @@ def main():
     """, unsafe_allow_html=True)
     
     # Inicializar engine
-    valuation = ValuationEngine()
+    valuation = get_valuation()
+    tempos = valuation.tempos
+    tempos.nova_rodada()
     
     # Sidebar
     st.sidebar.header("🔍 Configurações")
     
+    modo = st.sidebar.radio("Modo:", ["Empresa", "Triagem do universo"])
+    mostrar_desempenho = st.sidebar.checkbox("Painel de desempenho")
+    
+    with tempos.medir('app.rerun', modo=modo):
+        if modo == "Triagem do universo":
+            analise_triagem(valuation)
+        else:
+            analise_empresa(valuation)
+    
+    if mostrar_desempenho:
+        painel_desempenho(tempos)
+    tempos.descarregar()
+
+def analise_empresa(valuation):
     # Seleção da empresa
     ticker_selecionado = st.sidebar.selectbox(
         "Selecione a ação:",
@@ -672,13 +917,27 @@ def main():
     )
     
     # Buscar dados
-    with st.spinner(f"Buscando dados confiáveis para {ticker_selecionado}..."):
-        dados_empresa = valuation.dados_client.get_dados_empresa(ticker_selecionado)
+    dados_empresa = get_dados_sessao(valuation, ticker_selecionado)
     
     if not dados_empresa:
         st.error("Não foi possível carregar os dados da empresa.")
         return
     
+    for erro in dados_empresa.get('erros', []):
+        st.warning(str(erro))
+    for fonte, idade in dados_empresa.get('idade_fontes', {}).items():
+        st.info(
+            f"{NOMES_FONTES.get(fonte, fonte)}: exibindo o último dado válido, de {formatar_idade(idade)} atrás, "
+            "enquanto a fonte é atualizada em segundo plano"
+        )
+    status_fontes(valuation.dados_client)
+    
+    stats_cache = valuation.dados_client.cache.estatisticas()
+    st.sidebar.caption(
+        f"Cache: {stats_cache['hits']} hits / {stats_cache['misses']} misses "
+        f"({stats_cache['taxa_acerto']:.0%}) · {stats_cache['itens']} itens"
+    )
+    
     # Header da empresa
     st.markdown(f"""
     <div class="stock-card">
@@ -714,16 +973,17 @@ def main():
         "📊 Dados da Empresa"
     ])
     
-    with tab1:
+    tempos = valuation.tempos
+    with tab1, tempos.medir('aba.multiplos'):
         analise_multiplos(valuation, dados_empresa)
     
-    with tab2:
+    with tab2, tempos.medir('aba.gordon'):
         analise_gordon(valuation, dados_empresa)
     
-    with tab3:
+    with tab3, tempos.medir('aba.fcd'):
         analise_fcd(valuation, dados_empresa)
     
-    with tab4:
+    with tab4, tempos.medir('aba.dados_empresa'):
         analise_dados_empresa(dados_empresa)
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+# benchmarks/bench_status_invest.py
+"""Micro-benchmark do parse da página de uma ação no Status Invest.
+
+Compara o parse completo original (html.parser + soup.find) com o extrator
+filtrado por SoupStrainer, em html.parser e em lxml. A página vem de
+fixtures/status_invest_acao.html, inflada até o tamanho de uma página real,
+ou de um HTML salvo passado em --html. O pico de memória vem do tracemalloc,
+que não enxerga as alocações em C do lxml.
+
+    python benchmarks/bench_status_invest.py --tamanho-kb 1500 --repeticoes 20
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bs4 import BeautifulSoup
+
+from valuation_core import extrair_indicadores_status_invest
+
+FIXTURE = os.path.join(RAIZ, 'benchmarks', 'fixtures', 'status_invest_acao.html')
+MARCADOR = '<!-- PREENCHIMENTO -->'
+
+# Blocos de enchimento parecidos com o restante da página (scripts e cards sem interesse)
+BLOCO_HEAD = '<script type="text/javascript">var dados = {"serie": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]};</script>\n'
+BLOCO_BODY = (
+    '<div class="card d-flex"><div class="info"><span class="sub-title">Receita líquida</span>'
+    '<a href="/acoes/petr4#receita" class="link">detalhes</a>'
+    '<strong class="sub-value">1.234,56</strong><i class="material-icons">help_outline</i></div></div>\n'
+)
+
+
+def carregar_pagina(caminho=None, tamanho_kb=1500):
+    """Lê um HTML salvo ou infla a fixture até aproximadamente tamanho_kb"""
+    if caminho:
+        with open(caminho, 'rb') as arquivo:
+            return arquivo.read()
+
+    with open(FIXTURE, encoding='utf-8') as arquivo:
+        base = arquivo.read()
+
+    faltando = max(tamanho_kb * 1024 - len(base), 0)
+    head = BLOCO_HEAD * (faltando // 3 // len(BLOCO_HEAD))
+    body = BLOCO_BODY * (faltando * 2 // 3 // len(BLOCO_BODY))
+    pagina = base.replace(MARCADOR, head, 1).replace(MARCADOR, body, 1)
+    return pagina.encode('utf-8')
+
+
+def parse_original(html):
+    """Abordagem anterior: árvore completa só para achar o primeiro strong.value"""
+    soup = BeautifulSoup(html, 'html.parser')
+    elemento = soup.find('strong', {'class': 'value'})
+    return {'preco_atual': float(elemento.text.replace('R$', '').replace(',', '.').strip())}
+
+
+def medir(funcao, html, repeticoes):
+    """Mediana do tempo por página e pico de memória alocada durante um parse"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(html)
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    funcao(html)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'mediana_ms': statistics.median(tempos) * 1000,
+        'minimo_ms': min(tempos) * 1000,
+        'pico_memoria_mb': pico / 1024 / 1024,
+        'campos': sorted(resultado)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--html', help='HTML salvo de uma página real do Status Invest')
+    parser.add_argument('--tamanho-kb', type=int, default=1500)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--json', help='Arquivo para gravar os resultados')
+    args = parser.parse_args()
+
+    html = carregar_pagina(args.html, args.tamanho_kb)
+
+    abordagens = {
+        'original (html.parser, árvore completa)': parse_original,
+        'filtrado (html.parser + SoupStrainer)': lambda pagina: extrair_indicadores_status_invest(pagina, 'html.parser'),
+    }
+    if importlib.util.find_spec('lxml'):
+        abordagens['filtrado (lxml + SoupStrainer)'] = lambda pagina: extrair_indicadores_status_invest(pagina, 'lxml')
+
+    resultados = {}
+    print(f"Página: {len(html) / 1024:.0f} KB, {args.repeticoes} repetições")
+    for nome, funcao in abordagens.items():
+        resultados[nome] = medir(funcao, html, args.repeticoes)
+        r = resultados[nome]
+        print(f"{nome:45s} {r['mediana_ms']:9.1f} ms  {r['pico_memoria_mb']:8.1f} MB  {len(r['campos'])} campos")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump({'tamanho_bytes': len(html), 'resultados': resultados}, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
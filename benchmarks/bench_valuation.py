@@ -0,0 +1,367 @@
+# benchmarks/bench_valuation.py
+"""Benchmark reprodutível das fontes, do motor de valuation e da página, sem rede.
+
+Status Invest, Fundamentus e Alpha Vantage são servidos por um servidor HTTP
+local a partir de benchmarks/fixtures, e o Yahoo Finance pelo DadosLocais,
+todos com a mesma latência injetada (--latencia-ms). Mede:
+
+    fontes   latência de cada fonte e de get_dados_empresa (frio e em cache)
+    motor    valuations/s do FCD e de Gordon com 1, 1k e 1M cenários
+    pagina   cálculo de uma execução da página com os valores padrão dos
+             widgets, sem Streamlit e, se instalado, pelo AppTest
+
+Os resultados vão para um JSON (--json) que pode ser comparado com o de
+outro commit (--comparar):
+
+    python benchmarks/bench_valuation.py --json atual.json
+    python benchmarks/bench_valuation.py --json novo.json --comparar atual.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import numpy as np
+
+import valuation_core
+from valuation_core import (
+    DADOS_SETOR_PADRAO,
+    METODOS_MULTIPLOS,
+    ClienteHTTP,
+    DadosConfiaveis,
+    DadosLocais,
+    ValuationEngine,
+)
+
+FIXTURES = os.path.join(RAIZ, 'benchmarks', 'fixtures')
+MARCADOR = '<!-- PREENCHIMENTO -->'
+
+TICKER = 'PETR4'
+CENARIOS_PADRAO = '1,1000,1000000'
+
+# Valores padrão dos widgets da página
+PREMISSAS_PAGINA = {
+    'fcff_inicial': 1000.0,
+    'crescimento_estagio1': 8.0,
+    'crescimento_estagio2': 2.5,
+    'anos_estagio1': 5,
+    'wacc': 10.0,
+    'taxa_perpetuidade': 2.0,
+    'numero_acoes': 1000.0
+}
+RESOLUCAO_PAGINA = 200
+
+
+def carregar_fixtures(acoes_fundamentus=1000):
+    """Páginas servidas pelo servidor local; a tabela do Fundamentus é inflada até acoes_fundamentus linhas"""
+    def ler(nome):
+        with open(os.path.join(FIXTURES, nome), encoding='utf-8') as arquivo:
+            return arquivo.read()
+
+    resultado = ler('fundamentus_resultado.html')
+    inicio = resultado.index('<tbody>') + len('<tbody>')
+    linhas = [linha + '</tr>' for linha in resultado[inicio:resultado.index(MARCADOR)].split('</tr>') if '<td>' in linha]
+    extras = []
+    for i in range(max(acoes_fundamentus - len(linhas), 0)):
+        ticker_base = linhas[i % len(linhas)].split('papel=')[1].split('"')[0]
+        extras.append(linhas[i % len(linhas)].replace(ticker_base, f"X{i:04d}3"))
+
+    return {
+        'statusinvest.com.br': ler('status_invest_acao.html').replace(MARCADOR, '').encode('utf-8'),
+        'www.fundamentus.com.br': resultado.replace(MARCADOR, ''.join(extras)).encode('utf-8'),
+        'www.alphavantage.co': ler('alpha_vantage_overview.json').encode('utf-8'),
+    }
+
+
+def iniciar_servidor_fixtures(paginas, latencia):
+    """Servidor HTTP local que responde pelos hosts reais: GET /<host>/<caminho>"""
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Cabeçalho e corpo saem em escritas separadas; com Nagle cada resposta esperaria o ACK atrasado
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latencia)
+            host = self.path.lstrip('/').split('/', 1)[0]
+            corpo = paginas.get(host)
+            if corpo is None:
+                self.send_error(404)
+                return
+            tipo = 'application/json' if corpo.lstrip().startswith(b'{') else 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', tipo)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class ClienteFixtures(ClienteHTTP):
+    """ClienteHTTP que redireciona as URLs reais para o servidor de fixtures"""
+
+    def __init__(self, endereco, **kwargs):
+        host, porta = endereco
+        kwargs.setdefault('limites_hosts', {host: (1e6, 1e6)})
+        super().__init__(**kwargs)
+        self.base = f"http://{host}:{porta}"
+
+    def get(self, url, **kwargs):
+        partes = urlsplit(url)
+        return super().get(f"{self.base}/{partes.hostname}{partes.path}", **kwargs)
+
+
+class FonteFixtures(DadosLocais):
+    """Yahoo Finance simulado pelo DadosLocais; as demais fontes passam pelo parse real das fixtures"""
+
+    get_dados_status_invest = DadosConfiaveis.get_dados_status_invest
+    get_dados_alpha_vantage = DadosConfiaveis.get_dados_alpha_vantage
+    get_dados_fundamentus = DadosConfiaveis.get_dados_fundamentus
+
+
+def medir(funcao, repeticoes, preparar=None):
+    """Mediana, p95 e mínimo do tempo de funcao() em ms; preparar() roda fora da medição"""
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    tempos_ms = np.array(tempos) * 1000
+    return {
+        'mediana_ms': float(np.median(tempos_ms)),
+        'p95_ms': float(np.percentile(tempos_ms, 95)),
+        'minimo_ms': float(tempos_ms.min())
+    }
+
+
+def bench_fontes(fonte, repeticoes):
+    """Latência de cada fonte isolada e de get_dados_empresa com cache frio e quente"""
+    buscas = {
+        'preco': lambda: fonte.get_preco_atual_b3(TICKER),
+        'historico': lambda: fonte.get_historico(TICKER),
+        'fundamentais': lambda: fonte.get_dados_alpha_vantage(TICKER),
+        'fundamentus': lambda: fonte.get_dados_fundamentus(TICKER),
+        'status_invest': lambda: fonte.get_dados_status_invest(TICKER),
+        'empresa_paralelo': lambda: fonte.get_dados_empresa(TICKER),
+        'empresa_sequencial': lambda: fonte.get_dados_empresa(TICKER, paralelo=False),
+    }
+    resultados = {nome: medir(busca, repeticoes, fonte.cache.limpar) for nome, busca in buscas.items()}
+
+    fonte.get_dados_empresa(TICKER)
+    resultados['empresa_em_cache'] = medir(lambda: fonte.get_dados_empresa(TICKER), repeticoes)
+    return resultados
+
+
+def premissas_aleatorias(n, semente=42):
+    """n conjuntos de premissas de FCD em torno dos valores padrão da página"""
+    rng = np.random.default_rng(semente)
+    return {
+        'fcff_inicial': rng.uniform(500, 1500, n),
+        'crescimento_estagio1': rng.uniform(0, 15, n),
+        'crescimento_estagio2': rng.uniform(0, 5, n),
+        'anos_estagio1': rng.integers(3, 11, n),
+        'wacc': rng.uniform(8, 16, n),
+        'taxa_perpetuidade': rng.uniform(0, 5, n),
+        'numero_acoes': 1000.0
+    }
+
+
+def bench_motor(cenarios, repeticoes):
+    """Valuations por segundo: laço escalar (até 1k cenários) e FCD vetorizado em lote"""
+    valuation = ValuationEngine(dados_client=DadosLocais())
+    dados_empresa = dict(valuation.dados_client.get_dados_realistas(TICKER), preco_atual=37.12)
+    resultados = {}
+
+    for n in cenarios:
+        lote = premissas_aleatorias(n)
+        tempo = medir(lambda: valuation.fluxo_caixa_descontado_lote(lote), repeticoes)
+        resultados[f'fcd_lote_{n}'] = dict(tempo, valuations_por_s=n / (tempo['mediana_ms'] / 1000))
+
+        if n > 1000:
+            continue
+        escalares = [{chave: (valor[i] if np.ndim(valor) else valor) for chave, valor in lote.items()} for i in range(n)]
+        tempo = medir(lambda: [valuation.fluxo_caixa_descontado(premissas) for premissas in escalares], repeticoes)
+        resultados[f'fcd_escalar_{n}'] = dict(tempo, valuations_por_s=n / (tempo['mediana_ms'] / 1000))
+
+        taxas = [(premissas['crescimento_estagio2'] / 100, premissas['wacc'] / 100) for premissas in escalares]
+        tempo = medir(lambda: [valuation.modelo_gordon(dados_empresa, g, r) for g, r in taxas], repeticoes)
+        resultados[f'gordon_escalar_{n}'] = dict(tempo, valuations_por_s=n / (tempo['mediana_ms'] / 1000))
+
+    return resultados
+
+
+def calcular_pagina(valuation, ticker=TICKER, resolucao=RESOLUCAO_PAGINA):
+    """O que uma execução da página calcula com os widgets nos valores padrão, sem desenhar nada"""
+    dados_empresa = valuation.dados_client.get_dados_empresa(ticker)
+    for metodo, _ in METODOS_MULTIPLOS:
+        valuation.calcular_target_multiplos(dados_empresa, metodo, DADOS_SETOR_PADRAO)
+
+    valuation.modelo_gordon(dados_empresa, 0.025, 0.10)
+    valuation.superficie_gordon(
+        dados_empresa, np.linspace(0.0, 10.0, resolucao) / 100, np.linspace(5.0, 20.0, resolucao) / 100
+    )
+
+    valuation.fluxo_caixa_descontado(PREMISSAS_PAGINA)
+    valuation.superficie_fcd(
+        PREMISSAS_PAGINA, np.linspace(5.0, 20.0, resolucao), np.linspace(0.0, 5.0, resolucao)
+    )
+
+
+def bench_pagina_app(criar_fonte, repeticoes):
+    """Execução completa do app_valuation.py pelo AppTest: primeira carga e reexecução com cache"""
+    from streamlit.testing.v1 import AppTest
+    import streamlit as st
+
+    # O app monta o próprio ValuationEngine; a classe de dados é trocada pela fonte de fixtures
+    original = valuation_core.DadosConfiaveis
+    valuation_core.DadosConfiaveis = lambda cache=None, http=None, **kwargs: criar_fonte(cache=cache, **kwargs)
+    try:
+        app = AppTest.from_file(os.path.join(RAIZ, 'app_valuation.py'), default_timeout=120)
+
+        def primeira_carga():
+            app.run()
+            if app.exception:
+                raise RuntimeError(app.exception[0].value)
+
+        primeira = medir(primeira_carga, repeticoes, st.cache_resource.clear)
+        reexecucao = medir(lambda: app.run(), repeticoes)
+    finally:
+        valuation_core.DadosConfiaveis = original
+        st.cache_resource.clear()
+
+    return {'app_primeira_carga': primeira, 'app_reexecucao': reexecucao}
+
+
+def bench_pagina(criar_fonte, repeticoes, usar_app=True):
+    fonte = criar_fonte()
+    valuation = ValuationEngine(dados_client=fonte)
+    resultados = {
+        'calculo_frio': medir(lambda: calcular_pagina(valuation), repeticoes, fonte.cache.limpar),
+        'calculo_em_cache': medir(lambda: calcular_pagina(valuation), repeticoes),
+    }
+    if usar_app and importlib.util.find_spec('streamlit'):
+        resultados.update(bench_pagina_app(criar_fonte, repeticoes))
+    return resultados
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metricas_planas(resultados, prefixo=''):
+    """{'motor.fcd_lote_1000.mediana_ms': ...} para comparar dois arquivos"""
+    planas = {}
+    for chave, valor in resultados.items():
+        nome = f"{prefixo}{chave}"
+        if isinstance(valor, dict):
+            planas.update(metricas_planas(valor, nome + '.'))
+        elif isinstance(valor, (int, float)):
+            planas[nome] = valor
+    return planas
+
+
+def comparar(atual, anterior, limiar=0.10):
+    """Imprime a variação das medianas e do throughput; piora acima do limiar é marcada"""
+    antes = metricas_planas(anterior['resultados'])
+    depois = metricas_planas(atual['resultados'])
+    print(f"\nComparação com {anterior['meta'].get('commit')} (limiar {limiar:.0%}):")
+    for nome in sorted(antes.keys() & depois.keys()):
+        if not nome.endswith(('mediana_ms', 'valuations_por_s')) or not antes[nome]:
+            continue
+        variacao = depois[nome] / antes[nome] - 1
+        # Tempo maior ou throughput menor é piora
+        piora = variacao if nome.endswith('_ms') else -variacao
+        marca = '  << REGRESSÃO' if piora > limiar else ''
+        print(f"  {nome:55s} {antes[nome]:14.3f} -> {depois[nome]:14.3f} ({variacao:+7.1%}){marca}")
+
+
+def imprimir(resultados):
+    for grupo, medidas in resultados.items():
+        print(f"\n[{grupo}]")
+        for nome, medida in medidas.items():
+            extra = f"  {medida['valuations_por_s']:16,.0f} valuations/s" if 'valuations_por_s' in medida else ''
+            print(f"  {nome:28s} {medida['mediana_ms']:10.3f} ms (p95 {medida['p95_ms']:10.3f}){extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latencia-ms', type=float, default=50.0, help='Latência injetada em cada fonte')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--cenarios', default=CENARIOS_PADRAO, help='Tamanhos de lote do motor, separados por vírgula')
+    parser.add_argument('--acoes-fundamentus', type=int, default=1000, help='Linhas da tabela de resultados servida')
+    parser.add_argument('--grupos', default='fontes,motor,pagina')
+    parser.add_argument('--sem-app', action='store_true', help='Não roda a página pelo AppTest')
+    parser.add_argument('--json', help='Arquivo para gravar os resultados')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    latencia = args.latencia_ms / 1000
+    grupos = args.grupos.split(',')
+    servidor = iniciar_servidor_fixtures(carregar_fixtures(args.acoes_fundamentus), latencia)
+    cliente = ClienteFixtures(servidor.server_address)
+
+    def criar_fonte(cache=None, **kwargs):
+        # kwargs: o que o app repassa ao DadosConfiaveis (indice_setorial, tempos, protecao)
+        return FonteFixtures(latencia=latencia, cache=cache, http=cliente, **kwargs)
+
+    resultados = {}
+    try:
+        if 'fontes' in grupos:
+            resultados['fontes'] = bench_fontes(criar_fonte(), args.repeticoes)
+        if 'motor' in grupos:
+            cenarios = [int(n) for n in args.cenarios.split(',')]
+            resultados['motor'] = bench_motor(cenarios, args.repeticoes)
+        if 'pagina' in grupos:
+            resultados['pagina'] = bench_pagina(criar_fonte, args.repeticoes, not args.sem_app)
+    finally:
+        servidor.shutdown()
+
+    saida = {
+        'meta': {
+            'commit': commit_atual(),
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'processadores': os.cpu_count(),
+            'argumentos': vars(args)
+        },
+        'resultados': resultados
+    }
+
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump(saida, arquivo, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            comparar(saida, json.load(arquivo))
+
+
+if __name__ == '__main__':
+    main()
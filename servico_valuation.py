@@ -0,0 +1,375 @@
+# servico_valuation.py
+"""Serviço HTTP/JSON assíncrono sobre o núcleo de valuation.
+
+Rotas (GET):
+    /saude
+    /metricas
+    /empresas/{ticker}/fundamentos
+    /empresas/{ticker}/multiplos
+    /empresas/{ticker}/gordon?crescimento=2.5&retorno=10
+    /empresas/{ticker}/fcd?fcff_inicial=...&crescimento_estagio1=8&...
+
+Requisições simultâneas para o mesmo ticker compartilham uma única busca
+(single-flight); acima de max_em_andamento o serviço responde 503; e a
+concorrência por provedor externo é limitada no DadosConfiaveis.
+
+    python servico_valuation.py --porta 8080
+    python servico_valuation.py --fonte-local --latencia-ms 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from valuation_core import (
+    METODOS_MULTIPLOS,
+    PREMISSAS_TRIAGEM,
+    DadosConfiaveis,
+    DadosLocais,
+    ErroFonteDados,
+    ErroPremissas,
+    ValuationEngine,
+    multiplos_historicos,
+    resumo_bandas,
+)
+
+# Concorrência padrão por provedor externo
+LIMITES_PROVEDORES = {'yahoo': 8, 'alphavantage': 1, 'fundamentus': 2, 'statusinvest': 2}
+
+PADRAO_TICKER = re.compile(r'^[A-Z0-9]{4,7}$')
+
+MOTIVOS_HTTP = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+# Faixa aceita para o número de anos do estágio 1 do FCD
+LIMITES_ANOS_ESTAGIO1 = (1, 50)
+
+log = logging.getLogger('servico_valuation')
+
+
+class ErroRequisicao(Exception):
+    """Erro do cliente, devolvido com o status HTTP indicado"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class VooUnico:
+    """Faz chamadas concorrentes com a mesma chave compartilharem uma única execução"""
+
+    def __init__(self):
+        self._em_voo = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    async def executar(self, chave, fabrica):
+        futuro = self._em_voo.get(chave)
+        if futuro is None:
+            futuro = asyncio.ensure_future(fabrica())
+            self._em_voo[chave] = futuro
+            futuro.add_done_callback(lambda _: self._em_voo.pop(chave, None))
+            self.execucoes += 1
+        else:
+            self.coalescidas += 1
+        # shield: um cliente que desiste não cancela a busca dos demais
+        return await asyncio.shield(futuro)
+
+
+def para_json(valor):
+    """Converte escalares NumPy e NaN/inf em tipos que o json aceita"""
+    if isinstance(valor, dict):
+        return {chave: para_json(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [para_json(item) for item in valor]
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+def parametro_float(parametros, nome, padrao, minimo=None, maximo=None):
+    """Parâmetro numérico finito, opcionalmente dentro de [minimo, maximo]; senão, erro 400"""
+    try:
+        valor = float(parametros.get(nome, [padrao])[0])
+    except ValueError:
+        raise ErroRequisicao(400, f"Parâmetro inválido: {nome}")
+    if not math.isfinite(valor):
+        raise ErroRequisicao(400, f"Parâmetro inválido: {nome} deve ser finito")
+    if minimo is not None and valor < minimo:
+        raise ErroRequisicao(400, f"Parâmetro fora da faixa: {nome} deve ser no mínimo {minimo:g}")
+    if maximo is not None and valor > maximo:
+        raise ErroRequisicao(400, f"Parâmetro fora da faixa: {nome} deve ser no máximo {maximo:g}")
+    return valor
+
+
+def parametro_inteiro(parametros, nome, padrao, minimo=None, maximo=None):
+    """Parâmetro inteiro (aceita '5' ou '5.0', rejeita '5.5', nan e inf) dentro da faixa; senão, erro 400"""
+    valor = parametro_float(parametros, nome, padrao, minimo, maximo)
+    if not valor.is_integer():
+        raise ErroRequisicao(400, f"Parâmetro inválido: {nome} deve ser inteiro")
+    return int(valor)
+
+
+class ServicoValuation:
+    def __init__(self, valuation=None, max_em_andamento=256, max_threads=32):
+        self.valuation = valuation or ValuationEngine(
+            dados_client=DadosConfiaveis(limites_provedores=LIMITES_PROVEDORES)
+        )
+        self.max_em_andamento = max_em_andamento
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='servico')
+        self.voo_unico = VooUnico()
+        self.em_andamento = 0
+        self.rejeitadas = 0
+        self.atendidas = 0
+
+    async def dados_empresa(self, ticker):
+        """Dados consolidados do ticker; buscas simultâneas do mesmo ticker são coalescidas"""
+        loop = asyncio.get_running_loop()
+        return await self.voo_unico.executar(
+            ticker,
+            lambda: loop.run_in_executor(self.executor, self.valuation.dados_client.get_dados_empresa, ticker)
+        )
+
+    async def bandas_multiplos(self, ticker):
+        """Bandas de P/L e P/VP do ticker (None se as fontes falharem), também coalescidas"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await self.voo_unico.executar(
+                (ticker, 'bandas'),
+                lambda: loop.run_in_executor(self.executor, self.valuation.dados_client.get_bandas_multiplos, ticker)
+            )
+        except ErroFonteDados:
+            return None
+
+    async def rota_fundamentos(self, ticker, parametros):
+        dados = await self.dados_empresa(ticker)
+        resposta = {chave: valor for chave, valor in dados.items() if chave not in ('historico', 'erros')}
+        resposta['erros'] = [str(erro) for erro in dados['erros']]
+        return resposta
+
+    async def rota_multiplos(self, ticker, parametros):
+        dados = await self.dados_empresa(ticker)
+        # Depois dos dados: o histórico de 5 anos completa o de 1 ano já salvo, sem baixá-lo duas vezes
+        bandas = await self.bandas_multiplos(ticker)
+        dados = dict(dados, multiplos_historicos=multiplos_historicos(bandas))
+        indice = self.valuation.dados_client.indice_setorial
+        dados_setor = indice.dados_setor(dados.get('setor'))
+        targets = {
+            metodo: self.valuation.calcular_target_multiplos(dados, metodo, dados_setor)
+            for metodo, _ in METODOS_MULTIPLOS
+        }
+        return {
+            'ticker': ticker,
+            'preco_atual': dados.get('preco_atual'),
+            'setor': dados.get('setor'),
+            'dados_setor': dados_setor,
+            'agregados_setor': indice.agregados(dados.get('setor')),
+            'multiplos_historicos': dados['multiplos_historicos'],
+            'bandas': resumo_bandas(bandas).to_dict('records') if bandas is not None else None,
+            'targets': targets
+        }
+
+    async def rota_gordon(self, ticker, parametros):
+        crescimento = parametro_float(parametros, 'crescimento', PREMISSAS_TRIAGEM['crescimento_gordon'] * 100)
+        retorno = parametro_float(parametros, 'retorno', PREMISSAS_TRIAGEM['retorno_gordon'] * 100)
+        if retorno <= crescimento:
+            raise ErroRequisicao(400, "O retorno exigido deve ser maior que o crescimento")
+        dados = await self.dados_empresa(ticker)
+        valor_justo = self.valuation.modelo_gordon(dados, crescimento / 100, retorno / 100)
+        return {
+            'ticker': ticker,
+            'preco_atual': dados.get('preco_atual'),
+            'crescimento': crescimento,
+            'retorno': retorno,
+            'valor_justo': valor_justo
+        }
+
+    async def rota_fcd(self, ticker, parametros):
+        dados = await self.dados_empresa(ticker)
+        premisas = {
+            'fcff_inicial': parametro_float(parametros, 'fcff_inicial', dados.get('lpa') or 0.0),
+            'numero_acoes': parametro_float(parametros, 'numero_acoes', 1.0),
+        }
+        if premisas['numero_acoes'] <= 0:
+            raise ErroRequisicao(400, "Parâmetro fora da faixa: numero_acoes deve ser positivo")
+        for chave in ('crescimento_estagio1', 'crescimento_estagio2', 'wacc', 'taxa_perpetuidade'):
+            premisas[chave] = parametro_float(parametros, chave, PREMISSAS_TRIAGEM[chave])
+        premisas['anos_estagio1'] = parametro_inteiro(
+            parametros, 'anos_estagio1', PREMISSAS_TRIAGEM['anos_estagio1'], *LIMITES_ANOS_ESTAGIO1
+        )
+
+        try:
+            resultado = self.valuation.fluxo_caixa_descontado(premisas)
+        except ErroPremissas as erro:
+            raise ErroRequisicao(400, str(erro))
+        if resultado is None:
+            raise ErroRequisicao(400, "O WACC deve ser maior que a taxa de perpetuidade")
+        return {'ticker': ticker, 'preco_atual': dados.get('preco_atual'), 'premissas': premisas, 'resultado': resultado}
+
+    def metricas(self):
+        return {
+            'em_andamento': self.em_andamento,
+            'atendidas': self.atendidas,
+            'rejeitadas': self.rejeitadas,
+            'buscas_executadas': self.voo_unico.execucoes,
+            'buscas_coalescidas': self.voo_unico.coalescidas,
+            'cache': self.valuation.dados_client.cache.estatisticas(),
+            'disjuntores': self.valuation.dados_client.protecao.situacao()
+        }
+
+    async def despachar(self, metodo, alvo):
+        """Resolve a rota e devolve (status, corpo)"""
+        if metodo != 'GET':
+            raise ErroRequisicao(405, "Apenas GET é suportado")
+
+        url = urlsplit(alvo)
+        partes = [parte for parte in url.path.split('/') if parte]
+        parametros = parse_qs(url.query)
+
+        if partes == ['saude']:
+            return 200, {'status': 'ok'}
+        if partes == ['metricas']:
+            return 200, self.metricas()
+
+        rotas = {
+            'fundamentos': self.rota_fundamentos,
+            'multiplos': self.rota_multiplos,
+            'gordon': self.rota_gordon,
+            'fcd': self.rota_fcd,
+        }
+        if len(partes) != 3 or partes[0] != 'empresas' or partes[2] not in rotas:
+            raise ErroRequisicao(404, "Rota não encontrada")
+
+        ticker = partes[1].upper()
+        if not PADRAO_TICKER.match(ticker):
+            raise ErroRequisicao(400, f"Ticker inválido: {partes[1]}")
+        return 200, await rotas[partes[2]](ticker, parametros)
+
+    async def responder(self, metodo, alvo):
+        # Backpressure: acima do limite, rejeita na hora em vez de enfileirar sem fim
+        if self.em_andamento >= self.max_em_andamento:
+            self.rejeitadas += 1
+            return 503, {'erro': 'Serviço sobrecarregado, tente novamente'}
+
+        self.em_andamento += 1
+        try:
+            status, corpo = await self.despachar(metodo, alvo)
+            self.atendidas += 1
+            return status, corpo
+        except ErroRequisicao as erro:
+            return erro.status, {'erro': str(erro)}
+        except Exception:
+            # Nenhuma requisição fica sem resposta: o erro vai para o log e o cliente recebe 500
+            log.exception("Erro ao atender %s %s", metodo, alvo)
+            return 500, {'erro': 'Erro interno'}
+        finally:
+            self.em_andamento -= 1
+
+    async def ler_requisicao(self, leitor, linha):
+        """Método, alvo, versão e cabeçalhos; requisição malformada vira erro 400"""
+        partes = linha.decode('latin-1').split()
+        if len(partes) != 3 or not partes[2].startswith('HTTP/'):
+            raise ErroRequisicao(400, "Linha de requisição malformada")
+        metodo, alvo, versao = partes
+
+        cabecalhos = {}
+        while True:
+            cabecalho = await leitor.readline()
+            if cabecalho in (b'\r\n', b'\n', b''):
+                break
+            nome, _, valor = cabecalho.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        try:
+            tamanho_corpo = int(cabecalhos.get('content-length') or 0)
+        except ValueError:
+            raise ErroRequisicao(400, "Cabeçalho Content-Length inválido")
+        if tamanho_corpo < 0:
+            raise ErroRequisicao(400, "Cabeçalho Content-Length inválido")
+        if tamanho_corpo:
+            await leitor.readexactly(tamanho_corpo)
+        return metodo, alvo, versao, cabecalhos
+
+    async def escrever_resposta(self, escritor, status, corpo, manter_conexao):
+        dados = json.dumps(para_json(corpo), ensure_ascii=False).encode('utf-8')
+        resposta = [
+            f"HTTP/1.1 {status} {MOTIVOS_HTTP.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(dados)}",
+            f"Connection: {'keep-alive' if manter_conexao else 'close'}",
+        ]
+        if status == 503:
+            resposta.append("Retry-After: 1")
+        escritor.write(('\r\n'.join(resposta) + '\r\n\r\n').encode('latin-1') + dados)
+        await escritor.drain()
+
+    async def atender_conexao(self, leitor, escritor):
+        """Laço HTTP/1.1 mínimo com keep-alive"""
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                try:
+                    metodo, alvo, versao, cabecalhos = await self.ler_requisicao(leitor, linha)
+                except ErroRequisicao as erro:
+                    # Sem saber onde a requisição termina, a conexão não pode ser reaproveitada
+                    await self.escrever_resposta(escritor, erro.status, {'erro': str(erro)}, False)
+                    break
+
+                status, corpo = await self.responder(metodo, alvo)
+                manter_conexao = versao == 'HTTP/1.1' and cabecalhos.get('connection', '').lower() != 'close'
+                await self.escrever_resposta(escritor, status, corpo, manter_conexao)
+                if not manter_conexao:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: linha além do limite do StreamReader
+            pass
+        finally:
+            escritor.close()
+
+    async def iniciar(self, host='127.0.0.1', porta=8080):
+        return await asyncio.start_server(self.atender_conexao, host, porta)
+
+
+async def servir(servico, host, porta):
+    servidor = await servico.iniciar(host, porta)
+    enderecos = ', '.join(str(socket.getsockname()) for socket in servidor.sockets)
+    print(f"Serviço de valuation em {enderecos}")
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON de valuation")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--max-em-andamento', type=int, default=256)
+    parser.add_argument('--max-threads', type=int, default=32)
+    parser.add_argument('--fonte-local', action='store_true', help='Usa DadosLocais em vez das fontes externas')
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='Latência simulada da fonte local')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    dados_client = (
+        DadosLocais(latencia=args.latencia_ms / 1000, limites_provedores=LIMITES_PROVEDORES)
+        if args.fonte_local
+        else DadosConfiaveis(limites_provedores=LIMITES_PROVEDORES)
+    )
+    servico = ServicoValuation(
+        ValuationEngine(dados_client=dados_client),
+        max_em_andamento=args.max_em_andamento,
+        max_threads=args.max_threads
+    )
+    asyncio.run(servir(servico, args.host, args.porta))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# tests/test_armazem.py
+"""Armazém local: snapshots promovidos ao cache mantêm a idade real da gravação, e gravações concorrentes não se perdem.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from valuation_core import TTL_FONTES, ArmazemLocal, CacheTTL, DadosConfiaveis, ProtecaoFontes
+
+
+class TestArmazem(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.armazem = ArmazemLocal(diretorio=self.diretorio.name)
+        if not self.armazem.disponivel:
+            self.skipTest('pyarrow não instalado')
+        self.dados = DadosConfiaveis(cache=CacheTTL(), armazem=self.armazem, protecao=ProtecaoFontes())
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def gravar_ha(self, segundos, fonte, dados):
+        """Grava o snapshot como se tivesse sido salvo há `segundos`"""
+        with mock.patch('time.time', return_value=time.time() - segundos):
+            self.armazem.gravar_fundamentais('PETR4', fonte, dados)
+
+    def test_snapshot_antigo_vence_pela_idade_da_gravacao(self):
+        self.gravar_ha(TTL_FONTES['fundamentus'] - 0.2, 'fundamentus', {'pl': 5.0})
+        self.dados._carregar_do_armazem('PETR4', ['fundamentus'])
+
+        valor, idade = self.dados.cache.obsoleto('PETR4', 'fundamentus')
+        self.assertEqual(valor, {'pl': 5.0})
+        self.assertGreater(idade, TTL_FONTES['fundamentus'] - 1)
+        self.assertTrue(self.dados.cache.contem('PETR4', 'fundamentus'))
+        time.sleep(0.3)
+        self.assertFalse(self.dados.cache.contem('PETR4', 'fundamentus'))
+
+    def test_snapshot_vencido_nao_e_promovido(self):
+        self.gravar_ha(TTL_FONTES['fundamentus'] + 1, 'fundamentus', {'pl': 5.0})
+        self.dados._carregar_do_armazem('PETR4', ['fundamentus'])
+        self.assertIsNone(self.dados.cache.obsoleto('PETR4', 'fundamentus'))
+
+    def test_gravacoes_concorrentes_guardam_uma_linha_por_fonte(self):
+        fontes = ['fundamentais', 'fundamentus', 'setor']
+        tarefas = [(fonte, rodada) for rodada in range(20) for fonte in fontes]
+        with ThreadPoolExecutor(max_workers=12) as executor:
+            list(executor.map(
+                lambda tarefa: self.armazem.gravar_fundamentais('PETR4', tarefa[0], {'rodada': tarefa[1]}),
+                tarefas
+            ))
+
+        snapshots = self.armazem.ler_tabela('fundamentais', 'PETR4').to_pandas()
+        self.assertEqual(sorted(snapshots['fonte']), fontes)
+        for fonte in fontes:
+            dados, _ = self.armazem.ler_fundamentais('PETR4', fonte)
+            self.assertIn(dados['rodada'], range(20))
+
+    def test_nova_gravacao_substitui_a_da_mesma_fonte(self):
+        self.armazem.gravar_fundamentais('PETR4', 'fundamentus', {'pl': 5.0})
+        self.armazem.gravar_fundamentais('PETR4', 'setor', {'setor': 'Energia'})
+        self.armazem.gravar_fundamentais('PETR4', 'fundamentus', {'pl': 6.0})
+
+        snapshots = self.armazem.ler_tabela('fundamentais', 'PETR4').to_pandas()
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(self.armazem.ler_fundamentais('PETR4', 'fundamentus')[0], {'pl': 6.0})
+        self.assertEqual(self.armazem.ler_fundamentais('PETR4', 'setor')[0], {'setor': 'Energia'})
+
+
+if __name__ == '__main__':
+    unittest.main()
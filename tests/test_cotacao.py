@@ -0,0 +1,70 @@
+# tests/test_cotacao.py
+"""Cotação do Yahoo Finance: cada busca vai à rede, e o cache devolve o preço novo quando o TTL vence.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import time
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from valuation_core import ArmazemLocal, CacheTTL, DadosConfiaveis, ProtecaoFontes
+
+
+class TickerFalso:
+    """yf.Ticker mínimo: history devolve o preço atual da variável `preco` e conta as chamadas"""
+
+    def __init__(self, preco):
+        self.preco = preco
+        self.chamadas = 0
+
+    def history(self, **kwargs):
+        self.chamadas += 1
+        datas = pd.bdate_range(end='2026-10-16', periods=3)
+        return pd.DataFrame({'Close': [self.preco - 2, self.preco - 1, self.preco]}, index=datas)
+
+
+class TestCotacao(unittest.TestCase):
+    def setUp(self):
+        self.acao = TickerFalso(10.0)
+        self.dados = DadosConfiaveis(
+            cache=CacheTTL(ttl_fontes={'preco': 0.05}),
+            armazem=ArmazemLocal(diretorio=None),
+            protecao=ProtecaoFontes()
+        )
+        self.dados._ticker_yf = lambda ticker: self.acao
+
+    def test_cada_chamada_busca_preco_novo(self):
+        self.assertEqual(self.dados.get_preco_atual_b3('PETR4'), 10.0)
+        self.acao.preco = 11.0
+        self.assertEqual(self.dados.get_preco_atual_b3('PETR4'), 11.0)
+        self.assertEqual(self.acao.chamadas, 2)
+
+    def test_preco_novo_depois_do_ttl(self):
+        buscar = self.dados.get_preco_atual_b3
+        self.assertEqual(self.dados._buscar_com_cache('PETR4', 'preco', buscar), 10.0)
+        self.acao.preco = 11.0
+        # Dentro do TTL o cache responde sem ir à rede
+        self.assertEqual(self.dados._buscar_com_cache('PETR4', 'preco', buscar), 10.0)
+        self.assertEqual(self.acao.chamadas, 1)
+        
+        time.sleep(0.1)
+        # Vencido: o obsoleto é servido na hora e a revalidação em segundo plano traz o preço novo
+        self.dados._buscar_com_cache('PETR4', 'preco', buscar)
+        limite = time.monotonic() + 5
+        while self.dados.cache.obsoleto('PETR4', 'preco')[0] != 11.0 and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(self.dados._buscar_com_cache('PETR4', 'preco', buscar), 11.0)
+
+    def test_sem_candles_devolve_none(self):
+        self.acao.history = lambda **kwargs: pd.DataFrame()
+        self.assertIsNone(self.dados.get_preco_atual_b3('PETR4'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# tests/test_disjuntor.py
+"""Disjuntor das fontes: só falhas remotas contam; recusas locais pelo prazo não abrem nem vão ao cache negativo.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from valuation_core import (
+    ArmazemLocal, CacheTTL, ClienteHTTP, DadosConfiaveis, DisjuntorFonte, ErroFonteDados,
+    PrazoInsuficiente, ProtecaoFontes
+)
+
+
+class RespostaAlphaVantage:
+    status_code = 200
+    headers = {}
+
+    def json(self):
+        return {'Symbol': 'X', 'Name': 'X', 'Sector': 'ENERGY', 'EPS': '1', 'PERatio': '10', 'BookValue': '8'}
+
+
+class SoAlphaVantage(DadosConfiaveis):
+    """Alpha Vantage saudável (rede simulada) atrás do limitador real; as demais fontes respondem localmente"""
+
+    def get_preco_atual_b3(self, ticker):
+        return 10.0
+
+    def get_historico(self, ticker):
+        return None
+
+    def get_dados_fundamentus(self, ticker):
+        return None
+
+    def get_setor_yahoo(self, ticker):
+        return None
+
+
+class TestRecusaLocal(unittest.TestCase):
+    def test_prazo_do_limitador_nao_abre_disjuntor(self):
+        http = ClienteHTTP(limites_hosts={'www.alphavantage.co': (5 / 60, 1)})
+        http.sessao.get = lambda url, **kwargs: RespostaAlphaVantage()
+        dados = SoAlphaVantage(
+            cache=CacheTTL(), http=http, armazem=ArmazemLocal(diretorio=None), protecao=ProtecaoFontes()
+        )
+
+        tickers = ['AAAA3', 'BBBB3', 'CCCC3', 'DDDD3', 'EEEE3']
+        resultados = [dados.get_dados_empresa(ticker) for ticker in tickers]
+
+        # Só a primeira cabe no limite de 1 requisição a cada 12 s; as outras são recusadas pelo prazo de 8 s
+        self.assertEqual(resultados[0]['fonte_fundamentais'], 'Alpha Vantage')
+        for resultado in resultados[1:]:
+            self.assertTrue(any(isinstance(erro.causa, PrazoInsuficiente) for erro in resultado['erros']))
+        self.assertEqual(dados.protecao.situacao()['fundamentais']['estado'], 'fechado')
+        self.assertEqual(dados.protecao.situacao()['fundamentais']['falhas_seguidas'], 0)
+        for ticker in tickers[1:]:
+            self.assertFalse(dados.cache.falha_recente(ticker, 'fundamentais')[0])
+
+    def test_falha_remota_abre_disjuntor(self):
+        dados = SoAlphaVantage(armazem=ArmazemLocal(diretorio=None), protecao=ProtecaoFontes())
+
+        def fora_do_ar(ticker):
+            raise ErroFonteDados('fundamentais', ticker, ConnectionError('recusada'))
+        protegida = dados._proteger_fonte('fundamentais', fora_do_ar)
+        for _ in range(3):
+            with self.assertRaises(ErroFonteDados):
+                protegida('PETR4')
+        self.assertEqual(dados.protecao.situacao()['fundamentais']['estado'], 'aberto')
+
+    def test_recusa_no_meio_aberto_libera_nova_tentativa(self):
+        disjuntor = DisjuntorFonte(falhas_para_abrir=1, resfriamento=0.0)
+        disjuntor.registrar_falha()
+        self.assertTrue(disjuntor.permitir())
+        self.assertEqual(disjuntor.estado, 'meio_aberto')
+        disjuntor.registrar_recusa()
+        self.assertTrue(disjuntor.permitir())
+
+
+if __name__ == '__main__':
+    unittest.main()
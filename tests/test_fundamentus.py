@@ -0,0 +1,84 @@
+# tests/test_fundamentus.py
+"""Parse da tabela de resultados do Fundamentus sobre a página salva em benchmarks/fixtures.
+
+    python -m unittest discover tests
+"""
+import importlib.util
+import os
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import numpy as np
+
+from valuation_core import parse_resultado_fundamentus
+
+FIXTURE = os.path.join(RAIZ, 'benchmarks', 'fixtures', 'fundamentus_resultado.html')
+
+PARSERS = ['html.parser'] + (['lxml'] if importlib.util.find_spec('lxml') else [])
+
+
+def ler_fixture():
+    with open(FIXTURE, 'rb') as arquivo:
+        return arquivo.read()
+
+
+class TestParseResultadoFundamentus(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.html = ler_fixture()
+        cls.tabelas = {parser: parse_resultado_fundamentus(cls.html, parser) for parser in PARSERS}
+
+    def test_indice_pelo_ticker(self):
+        for parser, df in self.tabelas.items():
+            with self.subTest(parser=parser):
+                self.assertEqual(df.index.name, 'ticker')
+                self.assertEqual(df.index.tolist(), ['PETR4', 'VALE3', 'ITUB4', 'WEGE3', 'ABEV3'])
+
+    def test_colunas_tipadas_float64(self):
+        for parser, df in self.tabelas.items():
+            with self.subTest(parser=parser):
+                self.assertTrue((df.dtypes == np.float64).all())
+                for campo in ('preco_atual', 'pl', 'pvp', 'dy', 'roe', 'margem_liquida', 'lpa', 'vpa'):
+                    self.assertIn(campo, df.columns)
+
+    def test_numeros_no_formato_brasileiro(self):
+        petr4 = self.tabelas['html.parser'].loc['PETR4']
+        self.assertAlmostEqual(petr4['preco_atual'], 37.12)
+        self.assertAlmostEqual(petr4['pl'], 4.52)
+        self.assertAlmostEqual(petr4['p_capital_giro'], -13.40)
+        self.assertAlmostEqual(petr4['patrimonio_liquido'], 388_232_000_000.0)
+
+    def test_percentuais_em_fracao(self):
+        petr4 = self.tabelas['html.parser'].loc['PETR4']
+        self.assertAlmostEqual(petr4['dy'], 0.1485)
+        self.assertAlmostEqual(petr4['roe'], 0.2742)
+        self.assertAlmostEqual(petr4['margem_liquida'], 0.2170)
+        self.assertAlmostEqual(petr4['margem_ebit'], 0.3764)
+        self.assertAlmostEqual(petr4['crescimento_receita_5a'], 0.1730)
+
+    def test_lpa_vpa_derivados(self):
+        df = self.tabelas['html.parser']
+        np.testing.assert_allclose(df['lpa'], df['preco_atual'] / df['pl'])
+        np.testing.assert_allclose(df['vpa'], df['preco_atual'] / df['pvp'])
+        self.assertAlmostEqual(df.loc['PETR4', 'lpa'], 37.12 / 4.52)
+
+    def test_parsers_concordam(self):
+        if 'lxml' not in self.tabelas:
+            self.skipTest('lxml não instalado')
+        referencia = self.tabelas['html.parser']
+        lxml = self.tabelas['lxml']
+        self.assertEqual(lxml.index.tolist(), referencia.index.tolist())
+        np.testing.assert_allclose(lxml.to_numpy(), referencia.to_numpy(), equal_nan=True)
+
+    def test_sem_tabela_resultado_devolve_vazio(self):
+        html = b'<html><body><table id="outra"><tr><td>PETR4</td></tr></table></body></html>'
+        for parser in PARSERS:
+            with self.subTest(parser=parser):
+                self.assertTrue(parse_resultado_fundamentus(html, parser).empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# tests/test_importacao.py
+"""Módulos sob demanda: o import é leve e a primeira carga aguenta várias threads ao mesmo tempo.
+
+    python -m unittest discover tests
+"""
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Roda em um interpretador novo: no processo dos testes os módulos já podem estar carregados
+SCRIPT = textwrap.dedent("""
+    import sys, threading
+    import valuation_core as vc
+    assert 'pandas' not in sys.modules and 'requests' not in sys.modules, 'import deixou de ser leve'
+    erros = []
+    barreira = threading.Barrier(16)
+    def tocar(modulo, atributo):
+        barreira.wait()
+        try:
+            getattr(modulo, atributo)
+        except Exception as erro:
+            erros.append(repr(erro))
+    alvos = [(vc.requests, 'Session'), (vc.pd, 'DataFrame'), (vc.pa, 'ipc'), (vc.bs4, 'BeautifulSoup')] * 4
+    threads = [threading.Thread(target=tocar, args=alvo) for alvo in alvos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not erros, erros
+    dados = vc.DadosConfiaveis(armazem=vc.ArmazemLocal(diretorio=None))
+    clientes = []
+    barreira_http = threading.Barrier(8)
+    def cliente():
+        barreira_http.wait()
+        clientes.append(id(dados.http))
+    threads = [threading.Thread(target=cliente) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(clientes)) == 1, 'mais de um ClienteHTTP criado'
+""")
+
+
+class TestImportacaoSobDemanda(unittest.TestCase):
+    def test_primeira_carga_concorrente(self):
+        resultado = subprocess.run(
+            [sys.executable, '-c', SCRIPT], cwd=RAIZ, capture_output=True, text=True, timeout=120
+        )
+        self.assertEqual(resultado.returncode, 0, resultado.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
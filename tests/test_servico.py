@@ -0,0 +1,61 @@
+# tests/test_servico.py
+"""Serviço HTTP: requisição malformada e premissas impossíveis recebem 400 com o erro em JSON.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from servico_valuation import ServicoValuation
+from valuation_core import DadosLocais, ProtecaoFontes, ValuationEngine
+
+
+class TestServico(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servico = ServicoValuation(ValuationEngine(dados_client=DadosLocais(protecao=ProtecaoFontes())))
+        self.servidor = await self.servico.iniciar(porta=0)
+        self.porta = self.servidor.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.servidor.close()
+        await self.servidor.wait_closed()
+        self.servico.executor.shutdown()
+
+    async def enviar(self, bruto):
+        """Manda os bytes crus e devolve (status, corpo JSON) da resposta"""
+        leitor, escritor = await asyncio.open_connection('127.0.0.1', self.porta)
+        escritor.write(bruto)
+        await escritor.drain()
+        resposta = await asyncio.wait_for(leitor.read(), 5)
+        escritor.close()
+        cabecalho, _, corpo = resposta.partition(b'\r\n\r\n')
+        return int(cabecalho.split()[1]), json.loads(corpo)
+
+    async def test_linha_malformada_recebe_400(self):
+        for bruto in (b'LIXO\r\n\r\n', b'GET /saude\r\n\r\n', b'GET /saude HTTP/1.1\r\nContent-Length: x\r\n\r\n'):
+            status, corpo = await self.enviar(bruto)
+            self.assertEqual(status, 400)
+            self.assertIn('erro', corpo)
+
+    async def test_gordon_com_retorno_menor_que_crescimento_recebe_400(self):
+        status, corpo = await self.enviar(
+            b'GET /empresas/PETR4/gordon?crescimento=10&retorno=8 HTTP/1.1\r\nConnection: close\r\n\r\n'
+        )
+        self.assertEqual(status, 400)
+        self.assertIn('retorno', corpo['erro'])
+
+        status, corpo = await self.enviar(
+            b'GET /empresas/PETR4/gordon?crescimento=2&retorno=10 HTTP/1.1\r\nConnection: close\r\n\r\n'
+        )
+        self.assertEqual(status, 200)
+        self.assertGreater(corpo['valor_justo'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
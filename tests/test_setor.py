@@ -0,0 +1,80 @@
+# tests/test_setor.py
+"""Setor da empresa: o .info do Yahoo só é consultado quando nenhuma outra fonte traz o setor, e o índice setorial é montado em segundo plano.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from valuation_core import DadosLocais, ProtecaoFontes
+
+
+class SoFundamentus(DadosLocais):
+    """Alpha Vantage fora do ar: os fundamentos vêm do Fundamentus, que não traz o setor"""
+
+    def get_dados_alpha_vantage(self, ticker):
+        self._simular_rede('fundamentais')
+        return None
+
+    def get_dados_fundamentus(self, ticker):
+        return {'pl': 5.0, 'pvp': 1.0, 'roe': 0.2, 'dy': 0.1}
+
+
+class TabelaFundamentus(DadosLocais):
+    """Tabela em lote do Fundamentus montada com os dados pré-definidos; pode segurar a resposta até ser liberada"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.liberar = threading.Event()
+
+    def get_fundamentus_universo(self):
+        self.liberar.wait(5)
+        linhas = {ticker: self.get_dados_realistas(ticker) for ticker in self.acoes_brasileiras}
+        return pd.DataFrame.from_dict(linhas, orient='index').drop(columns='setor')
+
+    def get_dados_fundamentus(self, ticker):
+        linha = self.get_fundamentus_universo().loc[ticker]
+        return {campo: float(valor) for campo, valor in linha.items() if pd.notna(valor)}
+
+
+class TestSetor(unittest.TestCase):
+    def test_alpha_vantage_com_setor_dispensa_yahoo(self):
+        for paralelo in (True, False):
+            dados = DadosLocais(protecao=ProtecaoFontes())
+            resultado = dados.get_dados_empresa('PETR4', paralelo=paralelo)
+            self.assertEqual(resultado['setor'], 'Energy')
+            self.assertEqual(dados.chamadas['setor'], 0)
+
+    def test_sem_setor_busca_no_yahoo_uma_vez(self):
+        for paralelo in (True, False):
+            dados = SoFundamentus(protecao=ProtecaoFontes())
+            resultado = dados.get_dados_empresa('VALE3', paralelo=paralelo)
+            self.assertEqual(resultado['fonte_fundamentais'], 'Fundamentus')
+            self.assertEqual(resultado['setor'], 'Basic Materials')
+            dados.get_dados_empresa('VALE3', paralelo=paralelo)
+            self.assertEqual(dados.chamadas['setor'], 1)
+
+    def test_indice_montado_em_segundo_plano(self):
+        dados = TabelaFundamentus(protecao=ProtecaoFontes())
+        dados.montar_indice_em_segundo_plano()
+        # A chamada volta na hora: o índice fica marcado em construção até a tabela chegar
+        self.assertFalse(dados.indice_setorial.pronto.is_set())
+        self.assertEqual(len(dados.indice_setorial), 0)
+
+        dados.liberar.set()
+        self.assertTrue(dados.indice_setorial.pronto.wait(5))
+        # Os tickers fora da tabela pré-definida ficam sem setor ('N/A') e não entram
+        com_setor = [ticker for ticker in dados.acoes_brasileiras if dados.get_dados_realistas(ticker)['setor'] != 'N/A']
+        self.assertEqual(len(dados.indice_setorial), len(com_setor))
+        self.assertEqual(dados.indice_setorial.agregados('Financial Services')['pl']['n'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# tests/test_universo.py
+"""Download em lote do Yahoo Finance: lote que falha é repetido, e tickers sem candles ficam marcados como falha.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+import valuation_core
+from valuation_core import ArmazemLocal, DadosConfiaveis, ErroFonteDados, ProtecaoFontes, historico_sintetico
+
+
+def download_lote(simbolos):
+    """Resposta do yf.download com group_by='ticker'; ZZZZ3 não vem no lote"""
+    historicos = {
+        simbolo: historico_sintetico(simbolo, 10.0)
+        for simbolo in simbolos if simbolo != 'ZZZZ3.SA'
+    }
+    return pd.concat(historicos, axis=1)
+
+
+class TestUniverso(unittest.TestCase):
+    def setUp(self):
+        self.dados = DadosConfiaveis(armazem=ArmazemLocal(diretorio=None), protecao=ProtecaoFontes())
+        espera = mock.patch.object(valuation_core, 'ESPERA_LOTE_YF', 0)
+        espera.start()
+        self.addCleanup(espera.stop)
+
+    def baixar(self, falhas, tickers):
+        """Roda get_universo com o yf.download levantando cada exceção de `falhas` antes de responder"""
+        falhas = list(falhas)
+
+        def responder(simbolos, **kwargs):
+            if falhas:
+                raise falhas.pop(0)
+            return download_lote(simbolos)
+        download = mock.Mock(side_effect=responder)
+        with mock.patch.object(valuation_core, 'yf', mock.Mock(download=download)):
+            universo = self.dados.get_universo(tickers, tamanho_lote=2)
+        return universo, download
+
+    def test_lote_que_falha_e_repetido(self):
+        universo, download = self.baixar([ConnectionError('reset')], ['PETR4', 'VALE3'])
+        self.assertEqual(download.call_count, 2)
+        self.assertEqual(list(universo.columns), ['PETR4', 'VALE3'])
+        self.assertTrue(self.dados.cache.contem('PETR4', 'historico'))
+
+    def test_lote_perdido_marca_os_tickers_como_falha(self):
+        erros = [ConnectionError('reset')] * valuation_core.TENTATIVAS_LOTE_YF
+        universo, _ = self.baixar(erros, ['PETR4', 'VALE3', 'ITUB4', 'ZZZZ3'])
+
+        self.assertEqual(list(universo.columns), ['ITUB4'])
+        for ticker in ('PETR4', 'VALE3', 'ZZZZ3'):
+            falhou, erro = self.dados.cache.falha_recente(ticker, 'historico')
+            self.assertTrue(falhou)
+            self.assertIsInstance(erro, ErroFonteDados)
+        self.assertIsInstance(self.dados.cache.falha_recente('PETR4', 'historico')[1].causa, ConnectionError)
+
+
+if __name__ == '__main__':
+    unittest.main()
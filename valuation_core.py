@@ -0,0 +1,3000 @@
+# valuation_core.py
+"""Núcleo de valuation sem interface: fontes de dados, cache, armazém local e modelos.
+
+Pode ser importado por jobs em lote e workers sem carregar o Streamlit. As
+dependências pesadas (pandas, yfinance, bs4, requests, pyarrow) só são
+carregadas no primeiro uso, e as falhas viram exceções de ErroValuation em
+vez de mensagens na tela.
+"""
+import bisect
+import importlib
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as PrazoEsgotado
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial, wraps
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+# Serializa a primeira carga dos módulos sob demanda (e a criação de recursos que dependem deles):
+# o LazyLoader do importlib não é thread-safe e várias fontes em paralelo tocam o módulo ao mesmo tempo
+_LOCK_IMPORTACAO = threading.RLock()
+
+
+class ModuloSobDemanda(types.ModuleType):
+    """Representante de um módulo que só é importado no primeiro acesso a um atributo"""
+
+    def __getattr__(self, atributo):
+        # Só chega aqui o que ainda não foi copiado do módulo real
+        with _LOCK_IMPORTACAO:
+            if not self.__dict__.get('_carregado'):
+                modulo = importlib.import_module(self.__name__)
+                self.__dict__.update(modulo.__dict__)
+                self.__dict__['_carregado'] = True
+        if atributo in self.__dict__:
+            return self.__dict__[atributo]
+        # Submódulos importados depois e __getattr__ do próprio módulo (PEP 562)
+        return getattr(sys.modules[self.__name__], atributo)
+
+
+def importar_sob_demanda(nome):
+    """Módulo carregado só no primeiro acesso a um atributo; None se não estiver instalado"""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    if importlib.util.find_spec(nome) is None:
+        return None
+    return ModuloSobDemanda(nome)
+
+
+pd = importar_sob_demanda('pandas')
+yf = importar_sob_demanda('yfinance')
+bs4 = importar_sob_demanda('bs4')
+requests = importar_sob_demanda('requests')
+pa = importar_sob_demanda('pyarrow')
+
+
+class ErroValuation(Exception):
+    """Erro base do núcleo de valuation"""
+
+
+# Nome de exibição de cada fonte de dados
+NOMES_FONTES = {
+    'preco': 'Yahoo Finance (cotação)',
+    'historico': 'Yahoo Finance (histórico)',
+    'historico_longo': 'Yahoo Finance (histórico longo)',
+    'balancos': 'Yahoo Finance (demonstrativos)',
+    'setor': 'Yahoo Finance (setor)',
+    'fundamentais': 'Alpha Vantage',
+    'fundamentus': 'Fundamentus',
+    'status_invest': 'Status Invest',
+}
+
+
+# Provedor externo por trás de cada fonte; limites de concorrência valem por provedor
+PROVEDORES_FONTES = {
+    'preco': 'yahoo',
+    'historico': 'yahoo',
+    'historico_longo': 'yahoo',
+    'balancos': 'yahoo',
+    'setor': 'yahoo',
+    'fundamentais': 'alphavantage',
+    'fundamentus': 'fundamentus',
+    'status_invest': 'statusinvest',
+}
+
+
+class ErroFonteDados(ErroValuation):
+    """Falha ao consultar uma fonte de dados para um ticker"""
+
+    def __init__(self, fonte, ticker, causa):
+        self.fonte = fonte
+        self.ticker = ticker
+        self.causa = causa
+        super().__init__(f"Não foi possível acessar {NOMES_FONTES.get(fonte, fonte)} ({ticker}): {causa}")
+
+    def __reduce__(self):
+        # A causa pode não ser serializável (ex.: exceções do requests) ao cruzar processos
+        return (self.__class__, (self.fonte, self.ticker, str(self.causa)))
+
+
+class FonteSuspensa(ErroFonteDados):
+    """Fonte com o disjuntor aberto: nem chega a ser consultada até o fim do resfriamento"""
+
+
+class ErroPremissas(ErroValuation):
+    """Premissas inválidas ou incompletas para um modelo"""
+
+
+class PrazoInsuficiente(ErroValuation):
+    """A espera pelo limite do host (ou pelo Retry-After) terminaria depois do prazo da busca"""
+
+
+def recusa_local(erro):
+    """A busca nem chegou a ser tentada por decisão local (prazo), sem dizer nada sobre a saúde da fonte"""
+    return isinstance(erro, PrazoInsuficiente) or isinstance(getattr(erro, 'causa', None), PrazoInsuficiente)
+
+
+# Fuso da B3 (sem horário de verão desde 2019)
+FUSO_B3 = timezone(timedelta(hours=-3))
+HORA_FECHAMENTO_B3 = 18
+
+
+def ultimo_fechamento_pregao(agora=None):
+    """Momento do último fechamento de pregão já ocorrido"""
+    agora = agora or datetime.now(FUSO_B3)
+    fechamento = agora.replace(hour=HORA_FECHAMENTO_B3, minute=0, second=0, microsecond=0)
+    if agora < fechamento:
+        fechamento -= timedelta(days=1)
+    while fechamento.weekday() >= 5:
+        fechamento -= timedelta(days=1)
+    return fechamento
+
+
+def segundos_ate_proximo_pregao(agora=None):
+    """Segundos até o fechamento do próximo pregão, quando surge um novo candle diário"""
+    agora = agora or datetime.now(FUSO_B3)
+    fechamento = agora.replace(hour=HORA_FECHAMENTO_B3, minute=0, second=0, microsecond=0)
+    if agora >= fechamento:
+        fechamento += timedelta(days=1)
+    while fechamento.weekday() >= 5:
+        fechamento += timedelta(days=1)
+    return (fechamento - agora).total_seconds()
+
+
+# Validade de cada fonte em segundos (ou função que calcula a validade)
+TTL_FONTES = {
+    'preco': 60,
+    'fundamentais': 6 * 3600,
+    'fundamentus': 6 * 3600,
+    'historico': segundos_ate_proximo_pregao,
+    'historico_longo': segundos_ate_proximo_pregao,
+    'balancos': 6 * 3600,
+    'setor': 30 * 24 * 3600,
+}
+
+
+# Prazo máximo (segundos) de cada fonte na busca concorrente
+PRAZOS_FONTES = {
+    'preco': 5,
+    'fundamentais': 8,
+    'fundamentus': 10,
+    'historico': 10,
+    'setor': 5,
+}
+
+# Por quanto tempo (segundos) uma falha ou resposta vazia de uma fonte é lembrada antes de tentar de novo
+TTL_NEGATIVO = {}
+TTL_NEGATIVO_PADRAO = 60
+
+# Idade máxima (segundos) de um valor vencido que ainda pode ser servido enquanto a fonte é revalidada
+IDADE_MAXIMA_OBSOLETO = {
+    'preco': 3600,
+}
+IDADE_MAXIMA_OBSOLETO_PADRAO = 7 * 24 * 3600
+
+# Disjuntor por fonte: falhas seguidas para abrir e resfriamento inicial/máximo (segundos)
+FALHAS_PARA_ABRIR = 3
+RESFRIAMENTO_DISJUNTOR = 60.0
+RESFRIAMENTO_MAXIMO = 900.0
+
+# Tickers por requisição multi-símbolo do Yahoo Finance
+TAMANHO_LOTE_YF = 50
+# Tentativas de cada lote e pausa (segundos) antes de repetir um lote que falhou
+TENTATIVAS_LOTE_YF = 2
+ESPERA_LOTE_YF = 1.0
+
+# Timeout (conexão, leitura) das requisições HTTP
+TIMEOUT_HTTP = (3.05, 10)
+
+
+URL_FUNDAMENTUS_RESULTADO = "https://www.fundamentus.com.br/resultado.php"
+
+# Colunas da tabela de resultados do Fundamentus -> (campo, é percentual)
+COLUNAS_FUNDAMENTUS = {
+    'Papel': ('ticker', False),
+    'Cotação': ('preco_atual', False),
+    'P/L': ('pl', False),
+    'P/VP': ('pvp', False),
+    'PSR': ('psr', False),
+    'Div.Yield': ('dy', True),
+    'P/Ativo': ('p_ativo', False),
+    'P/Cap.Giro': ('p_capital_giro', False),
+    'P/EBIT': ('p_ebit', False),
+    'P/Ativ Circ.Liq': ('p_ativo_circulante_liq', False),
+    'EV/EBIT': ('ev_ebit', False),
+    'EV/EBITDA': ('ev_ebitda', False),
+    'Mrg Ebit': ('margem_ebit', True),
+    'Mrg. Líq.': ('margem_liquida', True),
+    'Liq. Corr.': ('liquidez_corrente', False),
+    'ROIC': ('roic', True),
+    'ROE': ('roe', True),
+    'Liq.2meses': ('liquidez_2meses', False),
+    'Patrim. Líq': ('patrimonio_liquido', False),
+    'Dív.Brut/ Patrim.': ('divida_bruta_patrimonio', False),
+    'Cresc. Rec.5a': ('crescimento_receita_5a', True),
+}
+
+
+def numero_br(texto):
+    """Converte números no formato brasileiro ('1.234,56' ou '12,3%') para float; vazio vira NaN"""
+    texto = texto.strip().replace('%', '')
+    if not texto or texto == '-':
+        return np.nan
+    try:
+        return float(texto.replace('.', '').replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+# lxml é bem mais rápido que o html.parser; usado quando instalado
+PARSER_HTML = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+
+def celulas_resultado_fundamentus(html, parser):
+    """Cabeçalho e textos das células da tabela #resultado; None se a página não tiver a tabela"""
+    if parser == 'lxml':
+        # Direto no lxml: sem montar a árvore do BeautifulSoup, que domina o tempo em ~1000 linhas
+        from lxml import html as lxml_html
+        tabelas = lxml_html.fromstring(html).xpath('//table[@id="resultado"]')
+        if not tabelas:
+            return None
+        cabecalho = [th.text_content() for th in tabelas[0].xpath('./thead//th')]
+        linhas = [[td.text_content() for td in tr.xpath('./td')] for tr in tabelas[0].xpath('./tbody/tr')]
+        return cabecalho, linhas
+    
+    soup = bs4.BeautifulSoup(html, parser, parse_only=bs4.SoupStrainer('table', id='resultado'))
+    tabela = soup.find('table', id='resultado')
+    if tabela is None:
+        return None
+    cabecalho = [th.get_text() for th in tabela.find('thead').find_all('th')]
+    linhas = [[td.get_text() for td in tr.find_all('td')] for tr in tabela.find('tbody').find_all('tr')]
+    return cabecalho, linhas
+
+
+def parse_resultado_fundamentus(html, parser=None):
+    """Converte a página de resultados do Fundamentus em DataFrame tipado indexado pelo ticker"""
+    celulas = celulas_resultado_fundamentus(html, parser or PARSER_HTML)
+    if celulas is None:
+        return pd.DataFrame()
+    
+    cabecalho, linhas = celulas
+    colunas = [COLUNAS_FUNDAMENTUS.get(' '.join(nome.split())) for nome in cabecalho]
+    
+    registros = []
+    for linha in linhas:
+        registro = {}
+        for coluna, texto in zip(colunas, linha):
+            if coluna is None:
+                continue
+            campo, percentual = coluna
+            if campo == 'ticker':
+                registro[campo] = texto.strip().upper()
+            else:
+                valor = numero_br(texto)
+                registro[campo] = valor / 100 if percentual else valor
+        if registro.get('ticker'):
+            registros.append(registro)
+    
+    if not registros:
+        return pd.DataFrame()
+    
+    df = pd.DataFrame(registros).set_index('ticker').astype('float64')
+    
+    # LPA e VPA implícitos na cotação e nos múltiplos
+    if {'preco_atual', 'pl'} <= set(df.columns):
+        df['lpa'] = df['preco_atual'] / df['pl'].replace(0, np.nan)
+    if {'preco_atual', 'pvp'} <= set(df.columns):
+        df['vpa'] = df['preco_atual'] / df['pvp'].replace(0, np.nan)
+    return df
+
+
+@lru_cache(maxsize=None)
+def filtro_status_invest():
+    """Só os títulos e valores dos cards de indicadores entram na árvore"""
+    return bs4.SoupStrainer(['h3', 'strong'], attrs={'class': re.compile(r'(^|\s)(title|value)(\s|$)')})
+
+# Título do card no Status Invest -> (campo, é percentual)
+INDICADORES_STATUS_INVEST = {
+    'valor atual': ('preco_atual', False),
+    'p/l': ('pl', False),
+    'p/vp': ('pvp', False),
+    'd.y': ('dy', True),
+    'dividend yield': ('dy', True),
+    'roe': ('roe', True),
+    'lpa': ('lpa', False),
+    'vpa': ('vpa', False),
+}
+
+
+def extrair_indicadores_status_invest(html, parser=None):
+    """Extrai preço, P/L, P/VP, DY, ROE, LPA e VPA da página de uma ação no Status Invest"""
+    soup = bs4.BeautifulSoup(html, parser or PARSER_HTML, parse_only=filtro_status_invest())
+    
+    dados = {}
+    titulo = None
+    # Cada card é um <h3 class="title"> seguido do seu <strong class="value">
+    for elemento in soup.find_all(['h3', 'strong']):
+        if elemento.name == 'h3':
+            # Só o texto próprio do título; o ícone de ajuda (<i>) também tem texto
+            titulo = ' '.join(next(elemento.stripped_strings, '').split()).lower()
+            continue
+        
+        indicador = INDICADORES_STATUS_INVEST.get(titulo)
+        titulo = None
+        if indicador is None or indicador[0] in dados:
+            continue
+        
+        campo, percentual = indicador
+        valor = numero_br(elemento.get_text().replace('R$', ''))
+        if not np.isnan(valor):
+            dados[campo] = valor / 100 if percentual else valor
+    
+    return dados
+
+
+# Limite de requisições por host: (requisições por segundo, rajada máxima)
+LIMITES_HOSTS = {
+    'www.alphavantage.co': (5 / 60, 1),
+    'statusinvest.com.br': (1.0, 2),
+    'www.fundamentus.com.br': (1.0, 2),
+}
+LIMITE_HOST_PADRAO = (5.0, 5)
+
+
+class LimitadorTaxa:
+    """Token bucket: libera até `rajada` requisições imediatas e repõe `taxa` fichas por segundo"""
+
+    def __init__(self, taxa, rajada):
+        self.taxa = taxa
+        self.rajada = rajada
+        self._fichas = float(rajada)
+        self._atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self, limite=None):
+        """Reserva uma ficha e dorme o necessário até ela estar disponível; sem reservar, falha se passaria de `limite`"""
+        with self._lock:
+            agora = time.monotonic()
+            self._fichas = min(self.rajada, self._fichas + (agora - self._atualizado_em) * self.taxa)
+            self._atualizado_em = agora
+            espera = (1 - self._fichas) / self.taxa if self._fichas < 1 else 0.0
+            if limite is not None and agora + espera > limite:
+                raise PrazoInsuficiente(f"limite do host exigiria esperar {espera:.1f} s, além do prazo")
+            # A reserva pode deixar o saldo negativo: quem chega depois espera mais
+            self._fichas -= 1
+        if espera:
+            time.sleep(espera)
+
+
+# Prazo das requisições da thread atual; fica fora do ClienteHTTP para não obrigar a criá-lo (e importar requests)
+_PRAZO_THREAD = threading.local()
+
+
+@contextmanager
+def prazo_requisicoes(limite):
+    """Todas as requisições desta thread dentro do bloco terminam até `limite` (time.monotonic())"""
+    anterior = getattr(_PRAZO_THREAD, 'limite', None)
+    _PRAZO_THREAD.limite = limite if anterior is None else min(limite, anterior)
+    try:
+        yield
+    finally:
+        _PRAZO_THREAD.limite = anterior
+
+
+class ClienteHTTP:
+    """Sessão HTTP compartilhada com pool keep-alive, retry com backoff exponencial e jitter e limite por host"""
+
+    STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_tentativas=4, backoff_base=0.5, backoff_max=30.0,
+                 limites_hosts=None, tamanho_pool=16):
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limites_hosts = dict(LIMITES_HOSTS, **(limites_hosts or {}))
+        self.sessao = requests.Session()
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=len(self.limites_hosts) + 4, pool_maxsize=tamanho_pool)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.mount('http://', adaptador)
+        self._limitadores = {}
+        self._lock = threading.Lock()
+
+    def _limitador(self, host):
+        with self._lock:
+            limitador = self._limitadores.get(host)
+            if limitador is None:
+                limitador = self._limitadores[host] = LimitadorTaxa(
+                    *self.limites_hosts.get(host, LIMITE_HOST_PADRAO)
+                )
+            return limitador
+
+    def _espera_retry(self, tentativa, resposta=None):
+        """Backoff exponencial com jitter total, respeitando Retry-After quando informado"""
+        if resposta is not None:
+            retry_after = resposta.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+
+    def _dormir(self, espera, limite):
+        """Dorme antes de retentar, ou falha na hora se a espera terminaria depois do prazo"""
+        if limite is not None and time.monotonic() + espera > limite:
+            raise PrazoInsuficiente(f"nova tentativa exigiria esperar {espera:.1f} s, além do prazo")
+        time.sleep(espera)
+
+    def get(self, url, prazo=None, **kwargs):
+        """GET com retry; a última resposta (mesmo com erro HTTP) é devolvida ao chamador
+
+        `prazo` (time.monotonic()) limita esperas e timeouts; sem ele vale o do bloco `with prazo_requisicoes(...)`.
+        """
+        limite = prazo if prazo is not None else getattr(_PRAZO_THREAD, 'limite', None)
+        timeout = kwargs.pop('timeout', TIMEOUT_HTTP)
+        limitador = self._limitador(urlparse(url).hostname)
+        
+        for tentativa in range(self.max_tentativas):
+            ultima = tentativa == self.max_tentativas - 1
+            limitador.aguardar(limite)
+            if limite is not None:
+                # A conexão e a leitura também não passam do prazo
+                restante = max(limite - time.monotonic(), 0.001)
+                timeout = tuple(min(t, restante) for t in timeout) if isinstance(timeout, tuple) else min(timeout, restante)
+            try:
+                resposta = self.sessao.get(url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if ultima:
+                    raise
+                self._dormir(self._espera_retry(tentativa), limite)
+                continue
+            
+            if resposta.status_code not in self.STATUS_RETENTAVEIS or ultima:
+                return resposta
+            self._dormir(self._espera_retry(tentativa, resposta), limite)
+
+
+# Dias de calendário por período de histórico aceito por atualizar_historico
+PERIODOS_HISTORICO = {
+    '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653
+}
+PERIODO_HISTORICO_PADRAO = '1y'
+# Candles diários pedidos para a cotação: poucos dias cobrem feriados e o pregão em andamento
+PERIODO_COTACAO = '5d'
+
+# Candles já salvos que são baixados de novo para detectar reajustes por proventos
+DIAS_SOBREPOSICAO = 7
+# Variação relativa no fechamento que indica histórico reajustado
+TOLERANCIA_AJUSTE = 1e-4
+
+
+def inicio_periodo(periodo):
+    """Primeira data (sem fuso) coberta por um período como '1y' ou '5y'"""
+    if periodo not in PERIODOS_HISTORICO:
+        raise ValueError(f"Período não suportado: {periodo}")
+    hoje = pd.Timestamp(datetime.now(FUSO_B3).date())
+    return hoje - pd.Timedelta(days=PERIODOS_HISTORICO[periodo])
+
+
+def normalizar_historico(historico):
+    """Indexa pela data do pregão na B3, sem fuso, para mesclar históricos de origens diferentes"""
+    if historico is None or historico.empty:
+        return historico
+    indice = pd.DatetimeIndex(historico.index)
+    if indice.tz is not None:
+        indice = indice.tz_convert('America/Sao_Paulo').tz_localize(None)
+    historico = historico.copy()
+    historico.index = indice.normalize().rename('Date')
+    return historico[~historico.index.duplicated(keep='last')].sort_index()
+
+
+def houve_ajuste(armazenado, recentes, tolerancia=TOLERANCIA_AJUSTE):
+    """Detecta reajuste do histórico (proventos, desdobramentos) nos candles novos ou nos em comum"""
+    if recentes is None or recentes.empty:
+        return False
+    
+    novos = recentes[recentes.index > armazenado.index[-1]]
+    for coluna in ('Dividends', 'Stock Splits'):
+        if coluna in novos.columns and (novos[coluna].fillna(0) != 0).any():
+            return True
+    
+    # O último candle salvo pode ter sido gravado com o pregão ainda aberto
+    comuns = armazenado.index.intersection(recentes.index)
+    comuns = comuns[comuns < armazenado.index[-1]]
+    if comuns.empty:
+        return False
+    variacao = recentes.loc[comuns, 'Close'] / armazenado.loc[comuns, 'Close'] - 1
+    return bool((variacao.abs() > tolerancia).any())
+
+
+def indices_lttb(x, y, n_pontos):
+    """Largest-Triangle-Three-Buckets: índices de n_pontos que preservam a forma visual da série"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_pontos >= n or n_pontos < 3:
+        return np.arange(n)
+    
+    # Primeiro e último pontos fixos; o miolo é dividido em n_pontos - 2 baldes
+    bordas = np.linspace(1, n - 1, n_pontos - 1).astype(int)
+    indices = np.empty(n_pontos, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        proximo_inicio, proximo_fim = (bordas[i + 1], bordas[i + 2]) if i + 2 < len(bordas) else (n - 1, n)
+        media_x = x[proximo_inicio:proximo_fim].mean()
+        media_y = y[proximo_inicio:proximo_fim].mean()
+        # Ponto do balde que forma o maior triângulo com o escolhido antes e a média do balde seguinte
+        area = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(area))
+        indices[i + 1] = anterior
+    return indices
+
+
+def indices_min_max(y, n_pontos):
+    """Mínimo e máximo de cada balde (n_pontos // 2 baldes), mais as pontas: preserva picos e vales"""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_pontos >= n or n_pontos < 4:
+        return np.arange(n)
+    
+    n_baldes = (n_pontos - 2) // 2
+    inicios = np.flatnonzero(np.diff(np.arange(n) * n_baldes // n, prepend=-1))
+    tamanhos = np.diff(np.append(inicios, n))
+    
+    def primeira_ocorrencia(extremos):
+        # Posição do extremo de cada balde: primeira coincidência a partir do início do balde
+        posicoes = np.flatnonzero(y == np.repeat(extremos, tamanhos))
+        return posicoes[np.searchsorted(posicoes, inicios)]
+    
+    minimos = primeira_ocorrencia(np.minimum.reduceat(y, inicios))
+    maximos = primeira_ocorrencia(np.maximum.reduceat(y, inicios))
+    return np.unique(np.concatenate([[0, n - 1], minimos, maximos]))
+
+
+# Métodos de redução de séries para gráficos
+METODOS_REDUCAO = ('lttb', 'min_max')
+
+
+def reduzir_serie(serie, n_pontos, metodo='lttb'):
+    """Reduz uma série (índice numérico ou de datas) a no máximo ~n_pontos para o gráfico"""
+    serie = serie.dropna()
+    if len(serie) <= n_pontos:
+        return serie
+    
+    if metodo == 'lttb':
+        x = serie.index.asi8 if isinstance(serie.index, pd.DatetimeIndex) else serie.index.to_numpy()
+        indices = indices_lttb(x, serie.to_numpy(), n_pontos)
+    elif metodo == 'min_max':
+        indices = indices_min_max(serie.to_numpy(), n_pontos)
+    else:
+        raise ValueError(f"Método de redução desconhecido: {metodo}")
+    return serie.iloc[indices]
+
+
+# Bandas históricas de múltiplos: janelas móveis (anos) sobre um histórico de 5 anos
+JANELAS_BANDAS_ANOS = (1, 3, 5)
+PERIODO_HISTORICO_BANDAS = '5y'
+PREGOES_POR_ANO = 252
+# Dias entre o fim do trimestre e a divulgação do balanço (o as-of usa a divulgação, sem olhar o futuro)
+DIAS_DIVULGACAO_BALANCO = 45
+# Fração mínima de pregões com múltiplo válido para a janela ter média e desvio
+FRACAO_MINIMA_JANELA = 0.5
+MULTIPLOS_BANDAS = (('pl', 'lpa'), ('pvp', 'vpa'))
+
+
+def lpa_vpa_demonstrativos(resultado, balanco, trimestral=False):
+    """LPA (12 meses) e VPA por data de encerramento, a partir dos demonstrativos do Yahoo Finance"""
+    def linha(tabela, nomes):
+        for nome in nomes:
+            if tabela is not None and nome in tabela.index:
+                return pd.to_numeric(tabela.loc[nome], errors='coerce')
+        return pd.Series(dtype=float)
+    
+    acoes = linha(balanco, ('Ordinary Shares Number', 'Share Issued'))
+    lucro = linha(resultado, ('Net Income Common Stockholders', 'Net Income'))
+    lpa = linha(resultado, ('Diluted EPS', 'Basic EPS'))
+    lpa = lpa.combine_first(lucro / acoes.reindex(lucro.index)).sort_index()
+    if trimestral:
+        # Soma de 4 trimestres, só quando os 4 cabem em pouco mais de um ano
+        datas = lpa.index.to_series()
+        consecutivos = (datas - datas.shift(3)) <= pd.Timedelta(days=300)
+        lpa = lpa.rolling(4).sum().where(consecutivos)
+    
+    patrimonio = linha(balanco, ('Stockholders Equity', 'Common Stock Equity'))
+    vpa = patrimonio / acoes.reindex(patrimonio.index)
+    serie = pd.DataFrame({'lpa': lpa, 'vpa': vpa})
+    serie.index = pd.DatetimeIndex(serie.index)
+    return serie.sort_index()
+
+
+def serie_fundamentos(anual, trimestral=None, dias_divulgacao=DIAS_DIVULGACAO_BALANCO):
+    """Junta LPA/VPA anuais e trimestrais (o trimestral prevalece) e data cada ponto pela divulgação"""
+    serie = anual if trimestral is None else trimestral.combine_first(anual)
+    serie = serie[['lpa', 'vpa']].dropna(how='all').sort_index()
+    if serie.empty:
+        return None
+    # Balanço sem um dos campos mantém o último valor conhecido
+    serie = serie.ffill()
+    serie.index = pd.DatetimeIndex(serie.index).tz_localize(None).astype('datetime64[ns]').rename('fim_periodo')
+    serie['data_divulgacao'] = serie.index + pd.Timedelta(days=dias_divulgacao)
+    return serie
+
+
+def estatisticas_moveis(valores, janelas, fracao_minima=FRACAO_MINIMA_JANELA):
+    """Média e desvio móveis de todas as colunas em todas as janelas de uma vez, por somas acumuladas (ignora NaN)"""
+    valores = np.asarray(valores, dtype=float)
+    if valores.ndim == 1:
+        valores = valores[:, None]
+    janelas = np.asarray(janelas, dtype=int)
+    n = len(valores)
+    
+    validos = np.isfinite(valores)
+    contagens = validos.sum(axis=0)
+    # Centralizar evita perda de precisão na soma dos quadrados
+    centro = np.where(validos, valores, 0.0).sum(axis=0) / np.maximum(contagens, 1)
+    desvios_centro = np.where(validos, valores - centro, 0.0)
+    
+    acumulados = np.zeros((3, n + 1, valores.shape[1]))
+    acumulados[0, 1:] = np.cumsum(validos, axis=0)
+    acumulados[1, 1:] = np.cumsum(desvios_centro, axis=0)
+    acumulados[2, 1:] = np.cumsum(desvios_centro ** 2, axis=0)
+    
+    # Somas de cada janela terminando em cada pregão: (estatística, janela, pregão, coluna)
+    fim = np.arange(1, n + 1)
+    inicio = np.maximum(fim[None, :] - janelas[:, None], 0)
+    quantidade, soma, soma_quadrados = acumulados[:, fim][:, None] - acumulados[:, inicio]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media = soma / quantidade
+        variancia = np.maximum(soma_quadrados - soma * media, 0.0) / (quantidade - 1)
+    suficiente = (quantidade >= np.ceil(janelas * fracao_minima)[:, None, None]) & (quantidade >= 2)
+    return np.where(suficiente, media + centro, np.nan), np.where(suficiente, np.sqrt(variancia), np.nan)
+
+
+def bandas_multiplos(historico, fundamentos, janelas_anos=JANELAS_BANDAS_ANOS):
+    """P/L e P/VP diários (preço com o último balanço divulgado) e suas médias e desvios móveis por janela"""
+    precos = historico['Close'].dropna()
+    combinado = pd.merge_asof(
+        pd.DataFrame({'data': precos.index.astype('datetime64[ns]'), 'preco': precos.to_numpy(dtype=float)}),
+        fundamentos[['data_divulgacao', 'lpa', 'vpa']].astype({'data_divulgacao': 'datetime64[ns]'}).sort_values('data_divulgacao'),
+        left_on='data', right_on='data_divulgacao', direction='backward'
+    )
+    
+    preco = combinado['preco'].to_numpy()
+    colunas = {}
+    for multiplo, base in MULTIPLOS_BANDAS:
+        denominador = combinado[base].to_numpy(dtype=float)
+        colunas[base] = denominador
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Lucro ou patrimônio negativo não tem múltiplo com significado
+            colunas[multiplo] = np.where(denominador > 0, preco / denominador, np.nan)
+    
+    nomes = [multiplo for multiplo, _ in MULTIPLOS_BANDAS]
+    medias, desvios = estatisticas_moveis(
+        np.column_stack([colunas[nome] for nome in nomes]),
+        np.asarray(janelas_anos) * PREGOES_POR_ANO
+    )
+    for i, anos in enumerate(janelas_anos):
+        for j, nome in enumerate(nomes):
+            colunas[f'{nome}_media_{anos}a'] = medias[i, :, j]
+            colunas[f'{nome}_desvio_{anos}a'] = desvios[i, :, j]
+    return pd.DataFrame(colunas, index=precos.index)
+
+
+def resumo_bandas(bandas, janelas_anos=JANELAS_BANDAS_ANOS):
+    """Múltiplo atual frente à média ± 1 desvio de cada janela, no último pregão"""
+    ultimo = bandas.iloc[-1]
+    linhas = []
+    for multiplo, _ in MULTIPLOS_BANDAS:
+        for anos in janelas_anos:
+            media, desvio = ultimo[f'{multiplo}_media_{anos}a'], ultimo[f'{multiplo}_desvio_{anos}a']
+            linhas.append({
+                'multiplo': multiplo,
+                'janela_anos': anos,
+                'atual': ultimo[multiplo],
+                'media': media,
+                'desvio': desvio,
+                'inferior': media - desvio,
+                'superior': media + desvio,
+                'desvios_da_media': (ultimo[multiplo] - media) / desvio if desvio else np.nan,
+            })
+    return pd.DataFrame(linhas)
+
+
+def multiplos_historicos(bandas, janelas_anos=JANELAS_BANDAS_ANOS):
+    """Média histórica de cada múltiplo na janela mais longa disponível, usada nos targets 'histórico'"""
+    if bandas is None or bandas.empty:
+        return {}
+    ultimo = bandas.iloc[-1]
+    referencias = {}
+    for multiplo, _ in MULTIPLOS_BANDAS:
+        for anos in sorted(janelas_anos, reverse=True):
+            media = ultimo[f'{multiplo}_media_{anos}a']
+            if np.isfinite(media):
+                referencias[multiplo] = float(media)
+                break
+    return referencias
+
+
+# Diretório do armazém local de histórico e fundamentos (um arquivo Arrow por ticker)
+DIRETORIO_ARMAZEM = os.environ.get(
+    'VALUATION_DADOS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados_locais')
+)
+
+# Fontes persistidas no armazém e a tabela onde cada uma é gravada
+TABELAS_ARMAZEM = {
+    'historico': 'historico',
+    'fundamentais': 'fundamentais',
+    'fundamentus': 'fundamentais',
+    'setor': 'fundamentais',
+}
+
+
+class ArmazemLocal:
+    """Armazém colunar em disco (Arrow IPC, particionado por ticker), lido via memory map sem cópia"""
+
+    def __init__(self, diretorio=DIRETORIO_ARMAZEM):
+        # diretorio=None desliga o armazém (tudo passa a vir da rede/cache)
+        self.diretorio = diretorio
+        self.disponivel = pa is not None and diretorio is not None
+        # Uma trava por (tabela, ticker): ler-mesclar-gravar não pode intercalar entre threads
+        self._travas = {}
+        self._lock = threading.Lock()
+
+    def _trava(self, tabela, ticker):
+        with self._lock:
+            trava = self._travas.get((tabela, ticker))
+            if trava is None:
+                trava = self._travas[(tabela, ticker)] = threading.Lock()
+            return trava
+
+    def _caminho(self, tabela, ticker):
+        return os.path.join(self.diretorio, tabela, f"ticker={ticker}", "dados.arrow")
+
+    def _gravar(self, caminho, tabela_arrow):
+        """Grava em arquivo temporário e troca atomicamente, sem afetar leitores com o mapa aberto"""
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(temporario, 'wb') as destino:
+            with pa.ipc.new_file(destino, tabela_arrow.schema) as escritor:
+                escritor.write_table(tabela_arrow)
+        os.replace(temporario, caminho)
+
+    def ler_tabela(self, tabela, ticker, colunas=None):
+        """Tabela Arrow mapeada em memória (zero-copy), opcionalmente só com as colunas pedidas"""
+        if not self.disponivel:
+            return None
+        caminho = self._caminho(tabela, ticker)
+        if not os.path.exists(caminho):
+            return None
+        with pa.memory_map(caminho, 'r') as fonte:
+            dados = pa.ipc.open_file(fonte).read_all()
+        if colunas is not None:
+            dados = dados.select([coluna for coluna in dados.column_names if coluna in colunas])
+        return dados
+
+    def gravar_historico(self, ticker, historico, inicio_solicitado=None):
+        """Substitui o histórico salvo; inicio_solicitado é a data mais antiga já pedida à fonte"""
+        if not self.disponivel or historico is None or historico.empty:
+            return
+        tabela_arrow = pa.Table.from_pandas(historico, preserve_index=True)
+        metadados = dict(tabela_arrow.schema.metadata or {})
+        metadados[b'gravado_em'] = str(time.time()).encode()
+        inicio_solicitado = inicio_solicitado if inicio_solicitado is not None else historico.index[0]
+        metadados[b'inicio_solicitado'] = pd.Timestamp(inicio_solicitado).isoformat().encode()
+        self._gravar(self._caminho('historico', ticker), tabela_arrow.replace_schema_metadata(metadados))
+
+    def ler_historico(self, ticker, colunas=None):
+        """Histórico salvo como DataFrame e seus metadados (gravado_em em epoch, inicio_solicitado)"""
+        if colunas is not None:
+            colunas = list(colunas) + ['Date', '__index_level_0__']
+        tabela_arrow = self.ler_tabela('historico', ticker, colunas)
+        if tabela_arrow is None:
+            return None, None
+        metadados = tabela_arrow.schema.metadata or {}
+        info = {'gravado_em': float(metadados.get(b'gravado_em', 0)), 'inicio_solicitado': None}
+        if b'inicio_solicitado' in metadados:
+            info['inicio_solicitado'] = pd.Timestamp(metadados[b'inicio_solicitado'].decode())
+        return tabela_arrow.to_pandas(), info
+
+    def mesclar_historico(self, ticker, novo):
+        """Mescla candles ao histórico salvo; se os candles em comum divergirem (reajuste), o salvo é descartado"""
+        novo = normalizar_historico(novo)
+        if not self.disponivel or novo is None or novo.empty:
+            return novo
+        
+        with self._trava('historico', ticker):
+            armazenado, info = self.ler_historico(ticker)
+            if armazenado is None or armazenado.empty or houve_ajuste(armazenado, novo):
+                self.gravar_historico(ticker, novo)
+                return novo
+            
+            combinado = pd.concat([armazenado[~armazenado.index.isin(novo.index)], novo]).sort_index()
+            inicio_solicitado = min(info['inicio_solicitado'] or armazenado.index[0], novo.index[0])
+            self.gravar_historico(ticker, combinado, inicio_solicitado)
+            return combinado
+
+    def gravar_fundamentais(self, ticker, fonte, dados):
+        """Substitui o snapshot dos fundamentos de uma fonte, mantendo o das demais (uma linha por fonte)"""
+        if not self.disponivel or not dados:
+            return
+        snapshot = pd.DataFrame([dict(dados, fonte=fonte, gravado_em=time.time())])
+        with self._trava('fundamentais', ticker):
+            anteriores = self.ler_tabela('fundamentais', ticker)
+            if anteriores is not None:
+                anteriores = anteriores.to_pandas()
+                snapshot = pd.concat([anteriores[anteriores['fonte'] != fonte], snapshot], ignore_index=True)
+            self._gravar(self._caminho('fundamentais', ticker), pa.Table.from_pandas(snapshot, preserve_index=False))
+
+    def ler_fundamentais(self, ticker, fonte):
+        """Último snapshot de uma fonte e o instante da gravação (epoch)"""
+        tabela_arrow = self.ler_tabela('fundamentais', ticker)
+        if tabela_arrow is None:
+            return None, None
+        snapshots = tabela_arrow.to_pandas()
+        snapshots = snapshots[snapshots['fonte'] == fonte]
+        if snapshots.empty:
+            return None, None
+        ultimo = snapshots.iloc[-1].drop('fonte')
+        gravado_em = float(ultimo.pop('gravado_em'))
+        dados = {
+            campo: valor.item() if hasattr(valor, 'item') else valor
+            for campo, valor in ultimo.items() if pd.notna(valor)
+        }
+        return dados, gravado_em
+
+    def ler_obsoleto(self, ticker, fonte):
+        """Último valor salvo de uma fonte, mesmo vencido, e o instante da gravação (epoch)"""
+        if not self.disponivel or fonte not in TABELAS_ARMAZEM:
+            return None, None
+        if fonte == 'historico':
+            valor, info = self.ler_historico(ticker)
+            if valor is None:
+                return None, None
+            return valor[valor.index >= inicio_periodo(PERIODO_HISTORICO_PADRAO)], info['gravado_em']
+        return self.ler_fundamentais(ticker, fonte)
+
+    def ler(self, ticker, fonte):
+        """Valor salvo de uma fonte e o instante da gravação (epoch), desde que ainda esteja dentro da validade"""
+        if not self.disponivel or fonte not in TABELAS_ARMAZEM:
+            return None, None
+        if fonte == 'historico':
+            valor, info = self.ler_historico(ticker)
+            if valor is None:
+                return None, None
+            inicio = inicio_periodo(PERIODO_HISTORICO_PADRAO)
+            valido = (
+                info['gravado_em'] >= ultimo_fechamento_pregao().timestamp()
+                and info['inicio_solicitado'] is not None
+                and info['inicio_solicitado'] <= inicio
+            )
+            return (valor[valor.index >= inicio], info['gravado_em']) if valido else (None, None)
+        else:
+            valor, gravado_em = self.ler_fundamentais(ticker, fonte)
+            valido = gravado_em and time.time() - gravado_em < TTL_FONTES.get(fonte, TTL_FONTES['fundamentais'])
+        return (valor, gravado_em) if valido else (None, None)
+
+    def gravar(self, ticker, fonte, valor):
+        if fonte == 'historico':
+            self.mesclar_historico(ticker, valor)
+        elif fonte in TABELAS_ARMAZEM:
+            self.gravar_fundamentais(ticker, fonte, valor)
+
+
+# Arquivo JSON lines onde o app grava os spans de tempo (uma linha por span); só exporta se VALUATION_TEMPOS for definido
+ARQUIVO_TEMPOS = os.environ.get('VALUATION_TEMPOS') or None
+# Tamanho a partir do qual o arquivo de tempos é rotacionado (uma cópia .1 é mantida)
+MAX_BYTES_TEMPOS = 10 * 1024 * 1024
+# Spans acumulados antes de uma gravação; o restante vai no fim da rodada
+LOTE_EXPORTACAO_TEMPOS = 200
+
+
+class RegistroTempos:
+    """Spans de tempo e contadores de cache da rodada atual, com exportação opcional em JSON lines"""
+
+    def __init__(self, arquivo=None, sessao=None, max_spans=10_000, ativo=True, max_bytes=MAX_BYTES_TEMPOS):
+        self.ativo = ativo
+        self.arquivo = arquivo
+        self.sessao = sessao
+        self.max_bytes = max_bytes
+        self.rodada = 0
+        self.spans = deque(maxlen=max_spans)
+        self.cache = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pendentes = []
+        self._lock_arquivo = threading.Lock()
+
+    def nova_rodada(self):
+        """Começa uma nova rodada (um rerun do app); spans e contadores anteriores são descartados"""
+        self.descarregar()
+        with self._lock:
+            self.rodada += 1
+            self.spans.clear()
+            self.cache.clear()
+            return self.rodada
+
+    def medir(self, nome, **atributos):
+        """Span em torno do bloco; spans aninhados na mesma thread guardam o nome do pai"""
+        if not self.ativo:
+            return nullcontext()
+        return self._span(nome, atributos)
+
+    @contextmanager
+    def _span(self, nome, atributos):
+        pilha = self._local.__dict__.setdefault('pilha', [])
+        span = {'nome': nome, 'pai': pilha[-1] if pilha else None, **atributos}
+        pilha.append(nome)
+        inicio = time.perf_counter()
+        span['inicio'] = time.time()
+        try:
+            yield span
+        except BaseException as erro:
+            span['erro'] = type(erro).__name__
+            raise
+        finally:
+            span['duracao_ms'] = (time.perf_counter() - inicio) * 1000
+            pilha.pop()
+            self._registrar(span)
+
+    def contar_cache(self, fonte, acerto):
+        if not self.ativo:
+            return
+        with self._lock:
+            self.cache[(fonte, 'hits' if acerto else 'misses')] += 1
+
+    def _registrar(self, span):
+        span['thread'] = threading.current_thread().name
+        with self._lock:
+            span['rodada'] = self.rodada
+            if self.sessao is not None:
+                span['sessao'] = self.sessao
+            self.spans.append(span)
+            if not self.arquivo:
+                return
+            self._pendentes.append(span)
+            cheio = len(self._pendentes) >= LOTE_EXPORTACAO_TEMPOS
+        if cheio:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava os spans pendentes no arquivo (aberto e fechado a cada lote), rotacionando-o se passou de max_bytes"""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+        if not pendentes or not self.arquivo:
+            return
+        linhas = ''.join(json.dumps(span, ensure_ascii=False, default=str) + '\n' for span in pendentes)
+        with self._lock_arquivo:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+                if self.max_bytes and os.path.exists(self.arquivo) and os.path.getsize(self.arquivo) >= self.max_bytes:
+                    os.replace(self.arquivo, self.arquivo + '.1')
+                with open(self.arquivo, 'a', encoding='utf-8') as saida:
+                    saida.write(linhas)
+            except OSError:
+                # A exportação é só diagnóstico; falha de disco não pode derrubar o cálculo
+                self.arquivo = None
+
+    def resumo(self):
+        """Tempo por span da rodada: chamadas, total e máximo em ms, do mais caro ao mais barato"""
+        with self._lock:
+            spans = list(self.spans)
+        agregado = {}
+        for span in spans:
+            linha = agregado.setdefault(span['nome'], {'nome': span['nome'], 'chamadas': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'erros': 0})
+            linha['chamadas'] += 1
+            linha['total_ms'] += span['duracao_ms']
+            linha['max_ms'] = max(linha['max_ms'], span['duracao_ms'])
+            linha['erros'] += 'erro' in span
+        return sorted(agregado.values(), key=lambda linha: linha['total_ms'], reverse=True)
+
+    def resumo_cache(self):
+        """Hits e misses por fonte na rodada"""
+        with self._lock:
+            contagens = dict(self.cache)
+        fontes = sorted({fonte for fonte, _ in contagens})
+        return [
+            {'fonte': fonte, 'hits': contagens.get((fonte, 'hits'), 0), 'misses': contagens.get((fonte, 'misses'), 0)}
+            for fonte in fontes
+        ]
+
+    def __getstate__(self):
+        # Só a configuração atravessa processos; spans, lock e arquivo aberto ficam
+        return {
+            'arquivo': self.arquivo, 'sessao': self.sessao, 'max_spans': self.spans.maxlen,
+            'ativo': self.ativo, 'max_bytes': self.max_bytes
+        }
+
+    def __setstate__(self, estado):
+        self.__init__(**estado)
+
+
+def cronometrado(nome):
+    """Mede o método em self.tempos com o nome dado"""
+    def decorador(metodo):
+        @wraps(metodo)
+        def medido(self, *args, **kwargs):
+            if not self.tempos.ativo:
+                # Laços escalares chamam os modelos milhares de vezes: sem registro, custo zero
+                return metodo(self, *args, **kwargs)
+            with self.tempos.medir(nome):
+                return metodo(self, *args, **kwargs)
+        return medido
+    return decorador
+
+
+class DisjuntorFonte:
+    """Circuit breaker de uma fonte: abre após falhas seguidas e libera uma tentativa ao fim do resfriamento"""
+
+    def __init__(self, falhas_para_abrir=FALHAS_PARA_ABRIR, resfriamento=RESFRIAMENTO_DISJUNTOR,
+                 resfriamento_maximo=RESFRIAMENTO_MAXIMO):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.resfriamento_inicial = resfriamento
+        self.resfriamento_maximo = resfriamento_maximo
+        self.resfriamento = resfriamento
+        self.estado = 'fechado'
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.rejeitadas = 0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Se a chamada pode ir à fonte; no meio-aberto só uma tentativa passa por vez"""
+        with self._lock:
+            if self.estado == 'fechado':
+                return True
+            if self.estado == 'aberto' and time.monotonic() >= self.aberto_ate:
+                self.estado = 'meio_aberto'
+                return True
+            self.rejeitadas += 1
+            return False
+
+    def aberto(self):
+        """Consulta sem efeitos colaterais: a fonte ainda está em resfriamento?"""
+        with self._lock:
+            return self.estado != 'fechado' and (self.estado == 'meio_aberto' or time.monotonic() < self.aberto_ate)
+
+    def restante(self):
+        with self._lock:
+            return max(self.aberto_ate - time.monotonic(), 0.0)
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.estado = 'fechado'
+            self.falhas_seguidas = 0
+            self.resfriamento = self.resfriamento_inicial
+
+    def registrar_recusa(self):
+        """A tentativa liberada não foi feita (recusa local): no meio-aberto a próxima chamada pode testar"""
+        with self._lock:
+            if self.estado == 'meio_aberto':
+                self.estado = 'aberto'
+                self.aberto_ate = time.monotonic()
+    
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            if self.estado == 'meio_aberto':
+                # A tentativa de teste falhou: volta a abrir, com resfriamento dobrado
+                self.resfriamento = min(self.resfriamento * 2, self.resfriamento_maximo)
+            elif self.falhas_seguidas < self.falhas_para_abrir:
+                return
+            self.estado = 'aberto'
+            self.aberto_ate = time.monotonic() + self.resfriamento
+
+    def situacao(self):
+        with self._lock:
+            return {
+                'estado': self.estado,
+                'falhas_seguidas': self.falhas_seguidas,
+                'restante_s': max(self.aberto_ate - time.monotonic(), 0.0) if self.estado != 'fechado' else 0.0,
+                'rejeitadas': self.rejeitadas
+            }
+
+
+class ProtecaoFontes:
+    """Disjuntores por fonte e pool de revalidação em segundo plano, compartilhados pelo processo inteiro"""
+
+    def __init__(self, max_revalidacoes=4):
+        self.max_revalidacoes = max_revalidacoes
+        self.disjuntores = {}
+        self._revalidando = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def disjuntor(self, fonte):
+        with self._lock:
+            disjuntor = self.disjuntores.get(fonte)
+            if disjuntor is None:
+                disjuntor = self.disjuntores[fonte] = DisjuntorFonte()
+            return disjuntor
+
+    def revalidar(self, chave, tarefa):
+        """Roda tarefa() no pool, a menos que a mesma chave já esteja sendo revalidada"""
+        with self._lock:
+            if chave in self._revalidando:
+                return False
+            self._revalidando.add(chave)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_revalidacoes, thread_name_prefix='revalidacao')
+        
+        def executar():
+            try:
+                tarefa()
+            finally:
+                with self._lock:
+                    self._revalidando.discard(chave)
+        self._executor.submit(executar)
+        return True
+
+    def situacao(self):
+        with self._lock:
+            disjuntores = dict(self.disjuntores)
+        return {fonte: disjuntor.situacao() for fonte, disjuntor in disjuntores.items()}
+
+
+# Proteção padrão: um disjuntor por fonte para o processo todo, não por sessão ou cliente
+PROTECAO_FONTES = ProtecaoFontes()
+
+
+class CacheTTL:
+    """Cache LRU com expiração por fonte, chaveado por (ticker, fonte); vencidos ficam como valor obsoleto até sair pelo LRU"""
+
+    def __init__(self, ttl_fontes=None, max_itens=512, ttl_negativo=None):
+        self.ttl_fontes = dict(TTL_FONTES, **(ttl_fontes or {}))
+        self.ttl_negativo = dict(TTL_NEGATIVO, **(ttl_negativo or {}))
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        # Cache negativo: (ticker, fonte) -> (erro ou None, expira_em)
+        self._falhas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ttl(self, fonte):
+        ttl = self.ttl_fontes.get(fonte, 300)
+        return ttl() if callable(ttl) else ttl
+
+    def get(self, ticker, fonte):
+        """Retorna o valor em cache ou None se ausente/expirado"""
+        chave = (ticker, fonte)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and item[1] > time.monotonic():
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            return None
+
+    def obsoleto(self, ticker, fonte):
+        """Último valor guardado, mesmo vencido, e sua idade em segundos; None se nunca houve"""
+        with self._lock:
+            item = self._itens.get((ticker, fonte))
+        if item is None:
+            return None
+        return item[0], time.time() - item[2]
+
+    def set(self, ticker, fonte, valor, gravado_em=None):
+        """Armazena o valor, descartando os itens menos usados se o limite for excedido; gravado_em (epoch) desconta a idade do TTL"""
+        chave = (ticker, fonte)
+        ttl = self._ttl(fonte)
+        if gravado_em is not None and not callable(self.ttl_fontes.get(fonte)):
+            # TTL fixo conta a partir da gravação; os calculados (até o próximo pregão) já são absolutos
+            ttl -= max(0.0, time.time() - gravado_em)
+        expira_em = time.monotonic() + ttl
+        with self._lock:
+            self._itens[chave] = (valor, expira_em, gravado_em or time.time())
+            self._falhas.pop(chave, None)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.evictions += 1
+
+    def contem(self, ticker, fonte):
+        """Verifica se há valor válido sem alterar contadores nem a ordem LRU"""
+        with self._lock:
+            item = self._itens.get((ticker, fonte))
+            return item is not None and item[1] > time.monotonic()
+
+    def marcar_falha(self, ticker, fonte, erro=None):
+        """Lembra por pouco tempo que a fonte falhou (erro) ou respondeu sem dados (erro=None)"""
+        expira_em = time.monotonic() + self.ttl_negativo.get(fonte, TTL_NEGATIVO_PADRAO)
+        with self._lock:
+            self._falhas[(ticker, fonte)] = (erro, expira_em)
+
+    def falha_recente(self, ticker, fonte):
+        """(True, erro) se a fonte falhou ou veio vazia há pouco; (False, None) caso contrário"""
+        chave = (ticker, fonte)
+        with self._lock:
+            item = self._falhas.get(chave)
+            if item is None:
+                return False, None
+            if item[1] <= time.monotonic():
+                del self._falhas[chave]
+                return False, None
+            return True, item[0]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._falhas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'itens': len(self._itens),
+                'falhas': len(self._falhas),
+                'taxa_acerto': self.hits / total if total else 0.0
+            }
+
+
+class DadosConfiaveis:
+    def __init__(self, cache=None, http=None, armazem=None, limites_provedores=None, tempos=None,
+                 indice_setorial=None, protecao=None):
+        self.cache = cache if cache is not None else CacheTTL()
+        # Agregados por setor alimentados a cada get_dados_empresa
+        self.indice_setorial = indice_setorial if indice_setorial is not None else IndiceSetorial()
+        self._http = http
+        # Sem registro explícito os spans ficam desligados (jobs em lote, serviço, benchmarks)
+        self.tempos = tempos if tempos is not None else RegistroTempos(ativo=False)
+        # Máximo de chamadas simultâneas por provedor (ex.: {'alphavantage': 1})
+        self._semaforos_provedores = {
+            provedor: threading.BoundedSemaphore(limite)
+            for provedor, limite in (limites_provedores or {}).items()
+        }
+        self.armazem = armazem if armazem is not None else ArmazemLocal()
+        self._tickers_yf = {}
+        self._lock_yf = threading.Lock()
+        # Bandas de múltiplos por ticker, com a versão dos dados de que foram calculadas
+        self._bandas = {}
+        self._lock_bandas = threading.Lock()
+        # Disjuntores e revalidações em segundo plano valem para o processo (um host falho não é testado por sessão)
+        self.protecao = protecao if protecao is not None else PROTECAO_FONTES
+        self.acoes_brasileiras = {
+            'PETR4': 'Petrobras',
+            'VALE3': 'Vale', 
+            'ITUB4': 'Itaú Unibanco',
+            'BBDC4': 'Bradesco',
+            'WEGE3': 'WEG',
+            'MGLU3': 'Magazine Luiza',
+            'BBAS3': 'Banco do Brasil',
+            'ABEV3': 'Ambev',
+            'RENT3': 'Localiza',
+            'B3SA3': 'B3',
+            'RADL3': 'Raia Drogasil',
+            'SUZB3': 'Suzano',
+            'EQTL3': 'Equatorial'
+        }
+    
+    @property
+    def http(self):
+        """Cliente HTTP criado só na primeira requisição (requests é importado sob demanda)"""
+        if self._http is None:
+            with _LOCK_IMPORTACAO:
+                if self._http is None:
+                    self._http = ClienteHTTP()
+        return self._http
+    
+    def _ticker_yf(self, ticker):
+        """Reaproveita um único yf.Ticker (e sua sessão HTTP) por ação"""
+        with self._lock_yf:
+            acao = self._tickers_yf.get(ticker)
+            if acao is None:
+                acao = self._tickers_yf[ticker] = yf.Ticker(f"{ticker}.SA")
+            return acao
+    
+    @staticmethod
+    def _preco_do_historico(historico):
+        """Preço atual a partir do último candle do histórico"""
+        if historico is None or historico.empty:
+            return None
+        return float(historico['Close'].iloc[-1])
+    
+    def get_preco_atual_b3(self, ticker):
+        """Preço atual da B3: últimos candles diários do Yahoo Finance, pedidos de novo a cada chamada
+
+        fast_info não serve: memoiza o preço no yf.Ticker (que é reaproveitado) e baixa um ano de histórico.
+        """
+        try:
+            with self.tempos.medir('yahoo.cotacao', ticker=ticker):
+                recentes = self._ticker_yf(ticker).history(period=PERIODO_COTACAO, interval='1d', auto_adjust=False)
+            if recentes is None or recentes.empty:
+                return None
+            fechamentos = recentes['Close'].dropna()
+            return float(fechamentos.iloc[-1]) if not fechamentos.empty else None
+        except Exception as e:
+            raise ErroFonteDados('preco', ticker, e) from e
+    
+    def get_dados_status_invest(self, ticker):
+        """Busca dados fundamentalistas do Status Invest (mais confiável)"""
+        try:
+            # URL do Status Invest
+            url = f"https://statusinvest.com.br/acoes/{ticker.lower()}"
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+            
+            with self.tempos.medir('http.status_invest', ticker=ticker):
+                response = self.http.get(url, headers=headers)
+            with self.tempos.medir('parse.status_invest', ticker=ticker):
+                dados = extrair_indicadores_status_invest(response.content)
+            
+            return dados or None
+            
+        except Exception as e:
+            raise ErroFonteDados('status_invest', ticker, e) from e
+    
+    def get_fundamentus_universo(self):
+        """Baixa a tabela de resultados do Fundamentus: fundamentos de todas as ações em uma requisição"""
+        tabela = self.cache.get('*', 'fundamentus')
+        if tabela is not None:
+            return tabela
+        
+        try:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            }
+            
+            with self.tempos.medir('http.fundamentus'):
+                response = self.http.get(URL_FUNDAMENTUS_RESULTADO, headers=headers)
+            with self.tempos.medir('parse.fundamentus'):
+                tabela = parse_resultado_fundamentus(response.content)
+            
+        except Exception as e:
+            raise ErroFonteDados('fundamentus', '*', e) from e
+        
+        if tabela.empty:
+            return None
+        self.cache.set('*', 'fundamentus', tabela)
+        return tabela
+    
+    def get_dados_fundamentus(self, ticker):
+        """Busca dados do Fundamentus (alternativa) na tabela de resultados de todo o universo"""
+        tabela = self.get_fundamentus_universo()
+        if tabela is None or ticker not in tabela.index:
+            return None
+        
+        linha = tabela.loc[ticker]
+        return {campo: float(valor) for campo, valor in linha.items() if pd.notna(valor)}
+    
+    def get_dados_alpha_vantage(self, ticker):
+        """Busca dados da Alpha Vantage (API internacional)"""
+        try:
+            API_KEY = "demo"  # Use sua chave gratuita
+            url = f"https://www.alphavantage.co/query"
+            params = {
+                'function': 'OVERVIEW',
+                'symbol': f"{ticker}.SAO",
+                'apikey': API_KEY
+            }
+            
+            with self.tempos.medir('http.alpha_vantage', ticker=ticker):
+                response = self.http.get(url, params=params)
+            data = response.json()
+            
+            # Limite de requisições (ou chave inválida) vem como mensagem, não como erro HTTP
+            aviso = data.get('Note') or data.get('Information')
+            if aviso:
+                raise RuntimeError(aviso)
+            
+            if 'Symbol' in data:
+                return {
+                    'nome': data.get('Name', ''),
+                    'setor': data.get('Sector', ''),
+                    'lpa': float(data.get('EPS', 0)),
+                    'pl': float(data.get('PERatio', 0)),
+                    'pvp': float(data.get('PriceToBookRatio', 0)),
+                    'roe': float(data.get('ReturnOnEquityTTM', 0)) / 100,
+                    'dy': float(data.get('DividendYield', 0)) / 100,
+                    'vpa': float(data.get('BookValue', 0))
+                }
+            return None
+            
+        except Exception as e:
+            raise ErroFonteDados('fundamentais', ticker, e) from e
+    
+    def _guardar(self, ticker, fonte, valor):
+        """Guarda um resultado da rede no cache em memória e no armazém local"""
+        self.cache.set(ticker, fonte, valor)
+        if fonte == 'historico':
+            # atualizar_historico já mantém o histórico salvo em dia
+            return
+        try:
+            self.armazem.gravar(ticker, fonte, valor)
+        except Exception:
+            # O armazém é só uma otimização; falha de disco não pode derrubar a busca
+            pass
+    
+    def _carregar_do_armazem(self, ticker, fontes):
+        """Promove ao cache em memória o que o armazém local já tem de válido"""
+        for fonte in fontes:
+            if self.cache.contem(ticker, fonte):
+                continue
+            try:
+                valor, gravado_em = self.armazem.ler(ticker, fonte)
+            except Exception:
+                valor = None
+            if valor is not None:
+                # Mantém a idade real do snapshot: vence no cache quando venceria no armazém
+                self.cache.set(ticker, fonte, valor, gravado_em=gravado_em)
+    
+    def _do_cache(self, ticker, fonte):
+        """Consulta o cache contando o hit ou miss da fonte na rodada"""
+        valor = self.cache.get(ticker, fonte)
+        self.tempos.contar_cache(fonte, valor is not None)
+        return valor
+    
+    def _disjuntor(self, fonte):
+        return self.protecao.disjuntor(fonte)
+    
+    def _proteger_fonte(self, fonte, funcao):
+        """Envolve a busca no disjuntor da fonte: com ele aberto, falha na hora sem ir à rede"""
+        disjuntor = self._disjuntor(fonte)
+        
+        def protegida(ticker):
+            if not disjuntor.permitir():
+                raise FonteSuspensa(
+                    fonte, ticker, f"fonte suspensa após falhas seguidas, nova tentativa em {disjuntor.restante():.0f} s"
+                )
+            try:
+                valor = funcao(ticker)
+            except Exception as erro:
+                # Só erros remotos e timeouts abrem o disjuntor; recusa pelo prazo não é falha da fonte
+                if recusa_local(erro):
+                    disjuntor.registrar_recusa()
+                else:
+                    disjuntor.registrar_falha()
+                raise
+            disjuntor.registrar_sucesso()
+            return valor
+        return protegida
+    
+    def _obsoleto(self, ticker, fonte):
+        """Último valor bom da fonte, mesmo vencido (cache, depois armazém), e sua idade em segundos"""
+        guardado = self.cache.obsoleto(ticker, fonte)
+        if guardado is None:
+            try:
+                valor, gravado_em = self.armazem.ler_obsoleto(ticker, fonte)
+            except Exception:
+                valor = None
+            if valor is not None:
+                guardado = (valor, time.time() - gravado_em)
+        if guardado is None or guardado[1] > IDADE_MAXIMA_OBSOLETO.get(fonte, IDADE_MAXIMA_OBSOLETO_PADRAO):
+            return None
+        return guardado
+    
+    def _revalidar(self, ticker, fonte, funcao):
+        """Busca a fonte em segundo plano para substituir o valor obsoleto; uma por (ticker, fonte) de cada vez"""
+        def tarefa():
+            try:
+                self._registrar_resultado(ticker, fonte, funcao(ticker))
+            except Exception as erro:
+                # O disjuntor já contou a falha; o valor obsoleto continua sendo servido
+                self._registrar_resultado(ticker, fonte, None, erro)
+        self.protecao.revalidar((ticker, fonte), tarefa)
+    
+    def _servir_obsoleto(self, ticker, fonte, funcao, idades):
+        """Stale-while-revalidate: devolve o último valor bom (anotando a idade) e dispara a revalidação"""
+        guardado = self._obsoleto(ticker, fonte)
+        if guardado is None:
+            return None
+        valor, idade = guardado
+        if idades is not None:
+            idades[fonte] = idade
+        # Falha recente ou disjuntor aberto: serve o obsoleto sem voltar à rede a cada rerun
+        if not self._disjuntor(fonte).aberto() and not self.cache.falha_recente(ticker, fonte)[0]:
+            self._revalidar(ticker, fonte, funcao)
+        return valor
+    
+    def _buscar_com_cache(self, ticker, fonte, funcao, erros=None, idades=None):
+        """Consulta o cache antes de acessar a fonte; só armazena resultados válidos"""
+        valor = self._do_cache(ticker, fonte)
+        if valor is None:
+            valor = self._servir_obsoleto(ticker, fonte, funcao, idades)
+        if valor is not None:
+            return valor
+        
+        falhou, erro = self.cache.falha_recente(ticker, fonte)
+        if not falhou:
+            try:
+                valor = funcao(ticker)
+            except ErroFonteDados as e:
+                erro = e
+            self._registrar_resultado(ticker, fonte, valor, erro)
+        if erro is not None:
+            if erros is None:
+                raise erro
+            erros.append(erro)
+        return valor
+    
+    def _registrar_resultado(self, ticker, fonte, valor, erro=None):
+        """Valor bom vai para o cache; falha ou resposta vazia entra no cache negativo"""
+        if recusa_local(erro):
+            # Recusada pelo prazo: a próxima busca tenta de novo
+            return
+        if erro is not None or valor is None:
+            self.cache.marcar_falha(ticker, fonte, erro)
+        else:
+            self._guardar(ticker, fonte, valor)
+    
+    def atualizar_historico(self, ticker, periodo=PERIODO_HISTORICO_PADRAO):
+        """Mantém o histórico salvo em dia baixando só os candles que faltam e devolve o recorte do período"""
+        acao = self._ticker_yf(ticker)
+        inicio = inicio_periodo(periodo)
+        with self.tempos.medir('armazem.ler_historico', ticker=ticker):
+            armazenado, info = self.armazem.ler_historico(ticker)
+        
+        def baixar(**periodo_yf):
+            with self.tempos.medir('yahoo.history', ticker=ticker):
+                return normalizar_historico(acao.history(**periodo_yf))
+        
+        if armazenado is None or armazenado.empty:
+            historico = baixar(start=inicio.date())
+            self.armazem.gravar_historico(ticker, historico, inicio)
+            return historico
+        
+        primeira, ultima = armazenado.index[0], armazenado.index[-1]
+        inicio_solicitado = info['inicio_solicitado'] or primeira
+        
+        # 1. Candles novos, com alguns dias de sobreposição para detectar reajustes
+        recentes = baixar(start=(ultima - pd.Timedelta(days=DIAS_SOBREPOSICAO)).date())
+        if houve_ajuste(armazenado, recentes):
+            # Proventos e desdobramentos reajustam todo o passado: baixa de novo só este ticker
+            inicio_completo = min(inicio, inicio_solicitado)
+            historico = baixar(start=inicio_completo.date())
+            self.armazem.gravar_historico(ticker, historico, inicio_completo)
+            return historico[historico.index >= inicio]
+        
+        historico = armazenado
+        if recentes is not None and not recentes.empty:
+            historico = pd.concat([armazenado[armazenado.index < recentes.index[0]], recentes])
+        
+        # 2. Período mais longo que o já pedido: baixa só o trecho anterior ao salvo
+        if inicio < inicio_solicitado:
+            antigos = baixar(start=inicio.date(), end=primeira.date())
+            if antigos is not None and not antigos.empty:
+                historico = pd.concat([antigos[antigos.index < primeira], historico])
+            inicio_solicitado = inicio
+        
+        self.armazem.gravar_historico(ticker, historico, inicio_solicitado)
+        return historico[historico.index >= inicio]
+    
+    def get_historico(self, ticker):
+        """Histórico de preços de 1 ano (Yahoo Finance), atualizado de forma incremental"""
+        try:
+            return self.atualizar_historico(ticker)
+        except Exception as e:
+            raise ErroFonteDados('historico', ticker, e) from e
+    
+    def get_historico_longo(self, ticker):
+        """Histórico de 5 anos para as bandas de múltiplos; o armazém só baixa o trecho que falta"""
+        try:
+            return self.atualizar_historico(ticker, PERIODO_HISTORICO_BANDAS)
+        except Exception as e:
+            raise ErroFonteDados('historico_longo', ticker, e) from e
+    
+    def get_setor_yahoo(self, ticker):
+        """Setor da empresa no Yahoo Finance (mesma classificação da Alpha Vantage), para quem vem do Fundamentus"""
+        try:
+            with self.tempos.medir('yahoo.info', ticker=ticker):
+                setor = self._ticker_yf(ticker).info.get('sector')
+            return {'setor': setor} if setor else None
+        except Exception as e:
+            raise ErroFonteDados('setor', ticker, e) from e
+    
+    def get_serie_fundamentos(self, ticker):
+        """LPA e VPA de cada balanço divulgado (demonstrativos anuais e trimestrais do Yahoo Finance)"""
+        try:
+            acao = self._ticker_yf(ticker)
+            with self.tempos.medir('yahoo.demonstrativos', ticker=ticker):
+                anual = lpa_vpa_demonstrativos(acao.income_stmt, acao.balance_sheet)
+                trimestral = lpa_vpa_demonstrativos(
+                    acao.quarterly_income_stmt, acao.quarterly_balance_sheet, trimestral=True
+                )
+            return serie_fundamentos(anual, trimestral)
+        except Exception as e:
+            raise ErroFonteDados('balancos', ticker, e) from e
+    
+    @cronometrado('dados.get_bandas_multiplos')
+    def get_bandas_multiplos(self, ticker):
+        """Bandas de P/L e P/VP; só são recalculadas quando chega candle ou balanço novo"""
+        historico = self._buscar_com_cache(
+            ticker, 'historico_longo', self._proteger_fonte('historico_longo', self.get_historico_longo)
+        )
+        fundamentos = self._buscar_com_cache(
+            ticker, 'balancos', self._proteger_fonte('balancos', self.get_serie_fundamentos)
+        )
+        if historico is None or historico.empty or fundamentos is None:
+            return None
+        
+        versao = (
+            len(historico), historico.index[-1], float(historico['Close'].iloc[-1]),
+            len(fundamentos), fundamentos['data_divulgacao'].iloc[-1]
+        )
+        with self._lock_bandas:
+            guardado = self._bandas.get(ticker)
+        if guardado is not None and guardado[0] == versao:
+            self.tempos.contar_cache('bandas', True)
+            return guardado[1]
+        
+        self.tempos.contar_cache('bandas', False)
+        with self.tempos.medir('calculo.bandas_multiplos', ticker=ticker):
+            bandas = bandas_multiplos(historico, fundamentos)
+        with self._lock_bandas:
+            self._bandas[ticker] = (versao, bandas)
+        return bandas
+    
+    @cronometrado('dados.get_universo')
+    def get_universo(self, tickers=None, period="1y", tamanho_lote=TAMANHO_LOTE_YF):
+        """Baixa o histórico de vários tickers em lotes e retorna os fechamentos alinhados (datas × tickers)"""
+        tickers = list(tickers or self.acoes_brasileiras)
+        fechamentos = []
+        
+        for inicio in range(0, len(tickers), tamanho_lote):
+            lote = tickers[inicio:inicio + tamanho_lote]
+            simbolos = [f"{ticker}.SA" for ticker in lote]
+            dados, erro = None, None
+            for tentativa in range(TENTATIVAS_LOTE_YF):
+                if tentativa:
+                    time.sleep(ESPERA_LOTE_YF)
+                try:
+                    with self.tempos.medir('yahoo.download_lote', tickers=len(lote), tentativa=tentativa + 1):
+                        dados = yf.download(
+                            simbolos, period=period, group_by='ticker', auto_adjust=True,
+                            actions=True, threads=True, progress=False
+                        )
+                    break
+                except Exception as e:
+                    erro = e
+            
+            for ticker, simbolo in zip(lote, simbolos):
+                historico = None
+                if dados is not None:
+                    if not isinstance(dados.columns, pd.MultiIndex):
+                        historico = dados
+                    elif simbolo in dados.columns.get_level_values(0):
+                        historico = dados[simbolo]
+                if historico is not None:
+                    historico = normalizar_historico(historico.dropna(how='all'))
+                if historico is None or historico.empty:
+                    # Fica no cache negativo com o motivo: get_dados_empresa o mostra em 'erros' sem repetir a chamada
+                    causa = erro if dados is None else "sem candles no download em lote"
+                    self.cache.marcar_falha(ticker, 'historico', ErroFonteDados('historico', ticker, causa))
+                    continue
+                fechamentos.append(self._guardar_do_lote(ticker, historico, period)['Close'].rename(ticker))
+        
+        if not fechamentos:
+            return pd.DataFrame()
+        return pd.concat(fechamentos, axis=1).sort_index()
+    
+    def _guardar_do_lote(self, ticker, historico, period):
+        """Grava o histórico baixado em lote e aquece o cache com o mesmo recorte de get_historico(_longo)"""
+        try:
+            self.armazem.mesclar_historico(ticker, historico)
+        except Exception:
+            pass
+        
+        if period == PERIODO_HISTORICO_BANDAS:
+            self.cache.set(ticker, 'historico_longo', historico)
+            historico = historico[historico.index >= inicio_periodo(PERIODO_HISTORICO_PADRAO)]
+        if period in (PERIODO_HISTORICO_PADRAO, PERIODO_HISTORICO_BANDAS):
+            self.cache.set(ticker, 'historico', historico)
+            self.cache.set(ticker, 'preco', self._preco_do_historico(historico))
+        return historico
+    
+    def _medir_fonte(self, fonte, funcao):
+        """Envolve a busca em um span 'fonte.<nome>', incluindo a espera pelo provedor"""
+        def medida(ticker):
+            with self.tempos.medir(f'fonte.{fonte}', ticker=ticker):
+                return funcao(ticker)
+        return medida
+    
+    def _limitar_provedor(self, fonte, funcao):
+        """Envolve a busca no semáforo do provedor da fonte, se houver limite configurado"""
+        semaforo = self._semaforos_provedores.get(PROVEDORES_FONTES.get(fonte))
+        if semaforo is None:
+            return funcao
+        
+        def limitada(ticker):
+            with semaforo:
+                return funcao(ticker)
+        return limitada
+    
+    def _fontes_empresa(self):
+        """Fontes consultadas por get_dados_empresa, na ordem de prioridade"""
+        fontes = {
+            'preco': self.get_preco_atual_b3,
+            'fundamentais': self.get_dados_alpha_vantage,
+            'fundamentus': self.get_dados_fundamentus,
+            'historico': self.get_historico,
+            'setor': self.get_setor_yahoo,
+        }
+        # Disjuntor antes do semáforo: fonte suspensa não ocupa vaga do provedor
+        return {
+            fonte: self._medir_fonte(fonte, self._proteger_fonte(fonte, self._limitar_provedor(fonte, funcao)))
+            for fonte, funcao in fontes.items()
+        }
+    
+    def _buscar_paralelo(self, ticker, fontes, prazos=None, erros=None, idades=None):
+        """Busca as fontes concorrentemente, cada uma com seu próprio prazo; falhas vão para `erros`"""
+        erros = erros if erros is not None else []
+        prazos = dict(PRAZOS_FONTES, **(prazos or {}))
+        resultados = {}
+        pendentes = {}
+        for fonte, funcao in fontes.items():
+            valor = self._do_cache(ticker, fonte)
+            if valor is None:
+                valor = self._servir_obsoleto(ticker, fonte, funcao, idades)
+            if valor is not None:
+                resultados[fonte] = valor
+                continue
+            falhou, erro = self.cache.falha_recente(ticker, fonte)
+            if falhou:
+                # Falhou há pouco: não repete a chamada (nem a espera) a cada rerun
+                resultados[fonte] = None
+                if erro is not None:
+                    erros.append(erro)
+            else:
+                pendentes[fonte] = funcao
+        
+        if not pendentes:
+            return resultados
+        
+        # Sem "with": uma fonte travada não pode prender a resposta até terminar
+        executor = ThreadPoolExecutor(max_workers=len(pendentes), thread_name_prefix='fonte')
+        inicio = time.monotonic()
+        futuros = {}
+        for fonte, funcao in pendentes.items():
+            # O prazo da fonte vale também dentro dela: o ClienteHTTP não dorme além dele
+            limite = inicio + prazos.get(fonte, TIMEOUT_HTTP[1])
+            futuro = executor.submit(self._no_prazo(funcao, limite), ticker)
+            # Respostas que chegam após o prazo ainda aquecem o cache do próximo rerun
+            futuro.add_done_callback(self._armazenar_resultado(ticker, fonte))
+            futuros[fonte] = futuro
+        executor.shutdown(wait=False)
+        
+        for fonte, futuro in futuros.items():
+            restante = max(prazos.get(fonte, TIMEOUT_HTTP[1]) - (time.monotonic() - inicio), 0)
+            # Prazo esgotado ou falha na fonte: cai no fallback da consolidação
+            try:
+                resultados[fonte] = futuro.result(timeout=restante)
+            except PrazoEsgotado:
+                resultados[fonte] = None
+                erros.append(ErroFonteDados(fonte, ticker, f"prazo de {prazos.get(fonte)} s esgotado"))
+            except ErroFonteDados as erro:
+                resultados[fonte] = None
+                erros.append(erro)
+            except Exception as e:
+                resultados[fonte] = None
+                erros.append(ErroFonteDados(fonte, ticker, e))
+        
+        return resultados
+    
+    def _no_prazo(self, funcao, limite):
+        def com_prazo(ticker):
+            with prazo_requisicoes(limite):
+                return funcao(ticker)
+        return com_prazo
+    
+    def _armazenar_resultado(self, ticker, fonte):
+        def callback(futuro):
+            if futuro.cancelled():
+                return
+            erro = futuro.exception()
+            if erro is not None and not isinstance(erro, ErroFonteDados):
+                erro = ErroFonteDados(fonte, ticker, erro)
+            self._registrar_resultado(ticker, fonte, None if erro else futuro.result(), erro)
+        return callback
+    
+    @cronometrado('dados.get_dados_empresa')
+    def get_dados_empresa(self, ticker, paralelo=True, prazos=None, bandas=False):
+        """Busca dados de múltiplas fontes e consolida; falhas das fontes ficam em dados['erros']"""
+        erros = []
+        # Fontes servidas com valor obsoleto (revalidando em segundo plano) e a idade de cada uma
+        idades = {}
+        fontes = self._fontes_empresa()
+        # Armazém local antes da rede
+        with self.tempos.medir('armazem.carregar', ticker=ticker):
+            self._carregar_do_armazem(ticker, fontes)
+        # O setor do Yahoo (.info, a chamada mais pesada) só é buscado se nenhuma outra fonte o trouxer
+        fonte_setor = fontes.pop('setor')
+        # Sem histórico algum, o preço sai do último candle: uma só ida ao Yahoo
+        buscar_historico = (
+            not self.cache.contem(ticker, 'historico')
+            and self._obsoleto(ticker, 'historico') is None
+            and not self.cache.falha_recente(ticker, 'historico')[0]
+        )
+        if buscar_historico:
+            fontes.pop('preco')
+        
+        if paralelo:
+            resultados = self._buscar_paralelo(ticker, fontes, prazos, erros, idades)
+        else:
+            resultados = {
+                fonte: self._buscar_com_cache(ticker, fonte, funcao, erros, idades)
+                for fonte, funcao in fontes.items()
+            }
+        
+        dados_consolidados = {
+            'ticker': ticker,
+            'nome': self.acoes_brasileiras.get(ticker, ticker),
+            'fonte': 'Múltiplas fontes',
+            'erros': erros,
+            'idade_fontes': idades
+        }
+        
+        # 1. Preço atual (Yahoo Finance - único dado razoavelmente confiável)
+        preco_atual = resultados.get('preco')
+        if buscar_historico:
+            preco_atual = self._preco_do_historico(resultados.get('historico'))
+            if preco_atual:
+                self.cache.set(ticker, 'preco', preco_atual)
+        if not preco_atual:
+            # Cotação indisponível: o último candle conhecido é melhor que nada
+            preco_atual = self._preco_do_historico(resultados.get('historico'))
+        if preco_atual:
+            dados_consolidados['preco_atual'] = preco_atual
+        
+        # 2. Dados fundamentalistas (Alpha Vantage como fallback)
+        dados_av = resultados.get('fundamentais')
+        if dados_av:
+            dados_consolidados.update(dados_av)
+            dados_consolidados['fonte_fundamentais'] = 'Alpha Vantage'
+        
+        # 3. Fundamentus (uma tabela para todo o universo); o preço do Yahoo tem prioridade
+        dados_fundamentus = resultados.get('fundamentus')
+        if not dados_av and dados_fundamentus:
+            dados_fundamentus = dict(dados_fundamentus)
+            if preco_atual:
+                dados_fundamentus.pop('preco_atual', None)
+            dados_consolidados.update(dados_fundamentus)
+            # O Fundamentus não traz o setor: Yahoo Finance, depois a tabela pré-definida
+            if paralelo:
+                setor_yahoo = self._buscar_paralelo(ticker, {'setor': fonte_setor}, prazos, erros, idades).get('setor')
+            else:
+                setor_yahoo = self._buscar_com_cache(ticker, 'setor', fonte_setor, erros, idades)
+            dados_consolidados['setor'] = (
+                setor_yahoo['setor'] if setor_yahoo else self.get_dados_realistas(ticker)['setor']
+            )
+            dados_consolidados['fonte_fundamentais'] = 'Fundamentus'
+        
+        # 4. Se nenhuma fonte funcionar, usar dados realistas pré-definidos
+        if not dados_av and not dados_fundamentus:
+            dados_consolidados.update(self.get_dados_realistas(ticker))
+            dados_consolidados['fonte_fundamentais'] = 'Dados realistas pré-definidos'
+        
+        # 5. Histórico de preços (Yahoo Finance)
+        dados_consolidados['historico'] = resultados.get('historico')
+        
+        # 6. Índice setorial: só fundamentos vindos de fontes reais, nunca os pré-definidos
+        if dados_av or dados_fundamentus:
+            self.indice_setorial.atualizar(ticker, dados_consolidados)
+        
+        # 7. Bandas de P/L e P/VP (histórico de 5 anos + balanços), base dos targets por múltiplo histórico
+        if bandas:
+            try:
+                dados_consolidados['bandas_multiplos'] = self.get_bandas_multiplos(ticker)
+            except ErroFonteDados as erro:
+                dados_consolidados['bandas_multiplos'] = None
+                erros.append(erro)
+            dados_consolidados['multiplos_historicos'] = multiplos_historicos(dados_consolidados['bandas_multiplos'])
+        
+        return dados_consolidados
+    
+    def get_dados_universo(self, tickers=None, max_threads=8, bandas=False):
+        """Dados de várias empresas: históricos e Fundamentus em lote, o restante por ticker em threads"""
+        return list(self.iterar_dados_universo(tickers, max_threads, bandas))
+    
+    def iterar_dados_universo(self, tickers=None, max_threads=8, bandas=False):
+        """Como get_dados_universo, mas entrega cada empresa assim que fica pronta, na ordem dos tickers"""
+        tickers = list(tickers or self.acoes_brasileiras)
+        self.get_universo(tickers, period=PERIODO_HISTORICO_BANDAS if bandas else PERIODO_HISTORICO_PADRAO)
+        try:
+            self.get_fundamentus_universo()
+        except ErroFonteDados:
+            # Sem a tabela em lote, cada ticker cai no fallback da consolidação
+            pass
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            buscar = partial(self.get_dados_empresa, bandas=bandas)
+            yield from (dados for dados in executor.map(buscar, tickers) if dados)
+    
+    @cronometrado('dados.montar_indice_setorial')
+    def montar_indice_setorial(self, tickers=None, max_threads=8):
+        """Preenche o índice setorial com a tabela em lote do Fundamentus; o setor vem do armazém, do Yahoo ou da tabela pré-definida"""
+        tickers = list(tickers or self.acoes_brasileiras)
+        tabela = self.get_fundamentus_universo()
+        if tabela is None:
+            return 0
+        # Tickers já buscados por get_dados_empresa mantêm os fundamentos que trouxeram
+        tickers = [ticker for ticker in tickers if ticker in tabela.index and ticker not in self.indice_setorial]
+        fonte_setor = self._fontes_empresa()['setor']
+        
+        def incluir(ticker):
+            self._carregar_do_armazem(ticker, ['setor'])
+            try:
+                setor = self._buscar_com_cache(ticker, 'setor', fonte_setor)
+            except ErroFonteDados:
+                setor = None
+            setor = setor['setor'] if setor else self.get_dados_realistas(ticker)['setor']
+            self.indice_setorial.atualizar(ticker, dict(self.get_dados_fundamentus(ticker), setor=setor))
+        
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            list(executor.map(incluir, tickers))
+        return len(tickers)
+    
+    def montar_indice_em_segundo_plano(self, tickers=None, max_threads=8):
+        """Roda montar_indice_setorial numa thread; indice_setorial.pronto fica limpo até ela terminar"""
+        self.indice_setorial.pronto.clear()
+        
+        def montar():
+            try:
+                self.montar_indice_setorial(tickers, max_threads)
+            except ErroFonteDados:
+                # Sem a tabela em lote o índice segue sendo alimentado pelos tickers buscados
+                pass
+            finally:
+                self.indice_setorial.pronto.set()
+        threading.Thread(target=montar, name='indice_setorial', daemon=True).start()
+    
+    def get_universo_compacto(self, tickers=None, max_threads=8, bandas=False):
+        """Como get_dados_universo, mas guardado em colunas direto da busca: nenhuma lista de dicts por empresa é montada"""
+        return UniversoCompacto.de_empresas(self.iterar_dados_universo(tickers, max_threads, bandas))
+    
+    def get_dados_realistas(self, ticker):
+        """Dados realistas pré-definidos baseados em relatórios recentes"""
+        dados_realistas = {
+            'PETR4': {
+                'setor': 'Energy', 'pl': 4.5, 'pvp': 0.9, 'dy': 0.1768, 
+                'roe': 0.28, 'lpa': 8.20, 'vpa': 30.97, 'margem_liquida': 0.18
+            },
+            'VALE3': {
+                'setor': 'Basic Materials', 'pl': 6.2, 'pvp': 1.1, 'dy': 0.089,
+                'roe': 0.22, 'lpa': 12.50, 'vpa': 45.20, 'margem_liquida': 0.25
+            },
+            'ITUB4': {
+                'setor': 'Financial Services', 'pl': 9.8, 'pvp': 1.3, 'dy': 0.065,
+                'roe': 0.16, 'lpa': 2.10, 'vpa': 18.50, 'margem_liquida': 0.22
+            },
+            'BBDC4': {
+                'setor': 'Financial Services', 'pl': 8.5, 'pvp': 0.9, 'dy': 0.071,
+                'roe': 0.14, 'lpa': 1.80, 'vpa': 16.80, 'margem_liquida': 0.18
+            },
+            'WEGE3': {
+                'setor': 'Industrials', 'pl': 28.5, 'pvp': 6.2, 'dy': 0.012,
+                'roe': 0.24, 'lpa': 1.45, 'vpa': 8.90, 'margem_liquida': 0.14
+            },
+            'MGLU3': {
+                'setor': 'Consumer Cyclical', 'pl': -15.2, 'pvp': 0.8, 'dy': 0.000,
+                'roe': -0.08, 'lpa': -0.32, 'vpa': 3.45, 'margem_liquida': -0.03
+            },
+            'BBAS3': {
+                'setor': 'Financial Services', 'pl': 7.2, 'pvp': 0.8, 'dy': 0.068,
+                'roe': 0.17, 'lpa': 4.50, 'vpa': 32.10, 'margem_liquida': 0.20
+            },
+            'ABEV3': {
+                'setor': 'Consumer Defensive', 'pl': 18.5, 'pvp': 2.1, 'dy': 0.035,
+                'roe': 0.12, 'lpa': 0.95, 'vpa': 8.20, 'margem_liquida': 0.13
+            }
+        }
+        
+        return dados_realistas.get(ticker, {
+            'setor': 'N/A', 'pl': 10.0, 'pvp': 1.2, 'dy': 0.05,
+            'roe': 0.15, 'lpa': 5.0, 'vpa': 20.0, 'margem_liquida': 0.12
+        })
+
+def historico_sintetico(ticker, preco_final, dias=252, volatilidade=0.02):
+    """Passeio aleatório determinístico por ticker que termina em preco_final"""
+    rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+    log_precos = np.cumsum(rng.normal(0, volatilidade, dias))
+    fechamentos = preco_final * np.exp(log_precos - log_precos[-1])
+    datas = pd.bdate_range(end=pd.Timestamp(datetime.now(FUSO_B3).date()), periods=dias, name='Date')
+    return pd.DataFrame({
+        'Open': fechamentos,
+        'High': fechamentos,
+        'Low': fechamentos,
+        'Close': fechamentos,
+        'Volume': rng.integers(1_000_000, 50_000_000, dias),
+        'Dividends': 0.0,
+        'Stock Splits': 0.0
+    }, index=datas)
+
+
+def fundamentos_sinteticos(ticker, lpa_final, vpa_final, anos=5, crescimento=0.08, volatilidade=0.1):
+    """LPA/VPA trimestrais determinísticos por ticker, crescendo até os valores atuais"""
+    rng = np.random.default_rng(zlib.crc32(f"{ticker}:balancos".encode()))
+    hoje = pd.Timestamp(datetime.now(FUSO_B3).date())
+    fins = pd.date_range(end=hoje - pd.Timedelta(days=DIAS_DIVULGACAO_BALANCO), periods=anos * 4, freq='QE')
+    # Trimestres até hoje, do mais antigo (fator < 1) ao mais recente (fator 1)
+    fator = (1 + crescimento) ** (np.arange(len(fins)) / 4 - (len(fins) - 1) / 4)
+    ruido = np.exp(rng.normal(0, volatilidade, len(fins)))
+    ruido[-1] = 1.0
+    return serie_fundamentos(pd.DataFrame({'lpa': lpa_final * fator * ruido, 'vpa': vpa_final * fator}, index=fins))
+
+
+class DadosLocais(DadosConfiaveis):
+    """Fonte substituta sem rede: dados pré-definidos e histórico sintético, com latência simulada"""
+
+    def __init__(self, latencia=0.0, **kwargs):
+        kwargs.setdefault('armazem', ArmazemLocal(diretorio=None))
+        super().__init__(**kwargs)
+        self.latencia = latencia
+        self.chamadas = {'preco': 0, 'fundamentais': 0, 'historico': 0, 'balancos': 0, 'setor': 0}
+        self._lock_chamadas = threading.Lock()
+
+    def _simular_rede(self, fonte):
+        with self._lock_chamadas:
+            self.chamadas[fonte] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _preco_local(self, ticker):
+        dados = self.get_dados_realistas(ticker)
+        return round(dados['vpa'] * dados['pvp'], 2)
+
+    def get_preco_atual_b3(self, ticker):
+        self._simular_rede('preco')
+        return self._preco_local(ticker)
+
+    def get_dados_alpha_vantage(self, ticker):
+        self._simular_rede('fundamentais')
+        return dict(self.get_dados_realistas(ticker), nome=self.acoes_brasileiras.get(ticker, ticker))
+
+    def get_dados_fundamentus(self, ticker):
+        return None
+
+    def get_historico(self, ticker):
+        self._simular_rede('historico')
+        return historico_sintetico(ticker, self._preco_local(ticker))
+
+    def get_universo(self, tickers=None, period="1y", tamanho_lote=TAMANHO_LOTE_YF):
+        """Fechamentos do histórico sintético no lugar do yf.download: uma latência simulada por lote"""
+        tickers = list(tickers or self.acoes_brasileiras)
+        dias = PREGOES_POR_ANO * 5 if period == PERIODO_HISTORICO_BANDAS else PREGOES_POR_ANO
+        fechamentos = []
+        for inicio in range(0, len(tickers), tamanho_lote):
+            self._simular_rede('historico')
+            for ticker in tickers[inicio:inicio + tamanho_lote]:
+                historico = historico_sintetico(ticker, self._preco_local(ticker), dias=dias)
+                fechamentos.append(self._guardar_do_lote(ticker, historico, period)['Close'].rename(ticker))
+        if not fechamentos:
+            return pd.DataFrame()
+        return pd.concat(fechamentos, axis=1).sort_index()
+
+    def get_setor_yahoo(self, ticker):
+        self._simular_rede('setor')
+        setor = self.get_dados_realistas(ticker)['setor']
+        return {'setor': setor} if normalizar_setor(setor) else None
+
+    def get_historico_longo(self, ticker):
+        self._simular_rede('historico')
+        return historico_sintetico(ticker, self._preco_local(ticker), dias=PREGOES_POR_ANO * 5)
+
+    def get_serie_fundamentos(self, ticker):
+        self._simular_rede('balancos')
+        dados = self.get_dados_realistas(ticker)
+        return fundamentos_sinteticos(ticker, dados['lpa'], dados['vpa'])
+
+
+def amostrar_distribuicao(rng, especificacao, n):
+    """Sorteia n valores: escalar (constante), ('normal', média, desvio), ('uniforme', mín, máx) ou ('triangular', mín, moda, máx)"""
+    if np.isscalar(especificacao):
+        return np.full(n, float(especificacao))
+    
+    tipo, *parametros = especificacao
+    if tipo == 'normal':
+        return rng.normal(parametros[0], parametros[1], n)
+    if tipo == 'uniforme':
+        return rng.uniform(parametros[0], parametros[1], n)
+    if tipo == 'triangular':
+        return rng.triangular(parametros[0], parametros[1], parametros[2], n)
+    raise ValueError(f"Distribuição desconhecida: {tipo}")
+
+
+class AcumuladorDistribuicao:
+    """Estatísticas em streaming: média/variância combinadas por bloco e histograma de faixa fixa"""
+
+    def __init__(self, limite_inferior, limite_superior, n_bins=2000):
+        self.bordas = np.linspace(limite_inferior, limite_superior, n_bins + 1)
+        self.contagens = np.zeros(n_bins, dtype=np.int64)
+        self.abaixo = 0
+        self.acima = 0
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+
+    def adicionar(self, valores):
+        """Incorpora um bloco de valores finitos sem guardá-los"""
+        if valores.size == 0:
+            return
+        
+        # Combinação de Chan et al. para média e soma dos quadrados dos desvios
+        media_bloco = valores.mean()
+        m2_bloco = ((valores - media_bloco) ** 2).sum()
+        delta = media_bloco - self.media
+        total = self.n + valores.size
+        self.media += delta * valores.size / total
+        self.m2 += m2_bloco + delta ** 2 * self.n * valores.size / total
+        self.n = total
+        
+        self.contagens += np.histogram(valores, bins=self.bordas)[0]
+        self.abaixo += int((valores < self.bordas[0]).sum())
+        self.acima += int((valores > self.bordas[-1]).sum())
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+
+    @property
+    def desvio(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def histograma(self, max_barras):
+        """Bordas e contagens com bins vizinhos somados até no máximo max_barras barras"""
+        passo = -(-len(self.contagens) // max_barras)
+        if passo <= 1:
+            return self.bordas, self.contagens
+        inicios = np.arange(0, len(self.contagens), passo)
+        return np.append(self.bordas[inicios], self.bordas[-1]), np.add.reduceat(self.contagens, inicios)
+
+    def percentis(self, qs):
+        """Percentis (0-100) interpolados no histograma; caudas fora da faixa ficam presas às bordas"""
+        acumulado = self.abaixo + np.concatenate([[0], np.cumsum(self.contagens)])
+        valores = np.interp(np.asarray(qs, dtype=float) / 100 * self.n, acumulado, self.bordas)
+        return np.clip(valores, self.minimo, self.maximo)
+
+
+# Situação de cada solução implícita
+STATUS_IMPLICITO = ('ok', 'fora_do_intervalo', 'nao_convergiu', 'dados_invalidos')
+
+
+def bissecao_vetorizada(funcao, alvo, inferior, superior, tolerancia=1e-6, max_iteracoes=100):
+    """Resolve funcao(x) = alvo elemento a elemento, com funcao monótona no intervalo; devolve (raízes, status)"""
+    alvo = np.asarray(alvo, dtype=float)
+    inferior = np.array(np.broadcast_to(inferior, alvo.shape), dtype=float)
+    superior = np.array(np.broadcast_to(superior, alvo.shape), dtype=float)
+    
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        f_inferior = funcao(inferior) - alvo
+        f_superior = funcao(superior) - alvo
+    validos = np.isfinite(alvo) & np.isfinite(f_inferior) & np.isfinite(f_superior)
+    # Sem troca de sinal nas pontas o preço não é atingível dentro do intervalo
+    no_intervalo = validos & (np.sign(f_inferior) * np.sign(f_superior) <= 0)
+    crescente = f_superior > f_inferior
+    
+    ativos = no_intervalo.copy()
+    for _ in range(max_iteracoes):
+        if not ativos.any():
+            break
+        meio = (inferior + superior) / 2
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            f_meio = funcao(meio) - alvo
+        # A raiz está acima do meio quando o sinal do meio é o da ponta inferior
+        acima = ((f_meio < 0) == crescente) & ativos
+        abaixo = ~acima & ativos
+        inferior = np.where(acima, meio, inferior)
+        superior = np.where(abaixo, meio, superior)
+        ativos &= (superior - inferior) > tolerancia
+    
+    convergiu = no_intervalo & ~ativos
+    status = np.select(
+        [~validos, ~no_intervalo, ~convergiu],
+        ['dados_invalidos', 'fora_do_intervalo', 'nao_convergiu'],
+        default='ok'
+    )
+    return np.where(convergiu, (inferior + superior) / 2, np.nan), status
+
+
+# Múltiplos de referência do setor enquanto não há agregados calculados
+DADOS_SETOR_PADRAO = {'pl': 10, 'pvp': 1.2, 'roe': 0.15}
+
+METODOS_MULTIPLOS = [
+    ('pl_historico', 'P/L Histórico'),
+    ('pl_setor', 'P/L Setor'),
+    ('pvp_historico', 'P/VP Histórico'),
+    ('pvp_setor', 'P/VP Setor'),
+    ('ev_ebitda_setor', 'EV/EBITDA Setor')
+]
+
+# Indicadores agregados por setor; múltiplos só entram quando positivos
+CAMPOS_SETORIAIS = ('pl', 'pvp', 'roe', 'dy')
+CAMPOS_SETORIAIS_POSITIVOS = {'pl', 'pvp'}
+# Abaixo disso o agregado do setor não é representativo e vale a referência padrão
+MIN_EMPRESAS_SETOR = 3
+# Fração descartada em cada cauda na média aparada
+CORTE_MEDIA_APARADA = 0.1
+
+
+def normalizar_setor(setor):
+    """Mesma chave para 'ENERGY' (Alpha Vantage) e 'Energy' (dados pré-definidos)"""
+    if not setor or not str(setor).strip() or str(setor).strip() == 'N/A':
+        return None
+    return str(setor).strip().title()
+
+
+def percentil_ordenado(valores, q):
+    """Percentil (0-100) com interpolação linear de uma lista já ordenada"""
+    posicao = q / 100 * (len(valores) - 1)
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(valores) - 1)
+    return valores[baixo] + (valores[alto] - valores[baixo]) * (posicao - baixo)
+
+
+class IndiceSetorial:
+    """Agregados de múltiplos por setor mantidos em listas ordenadas: atualizar um ticker só mexe no setor dele"""
+
+    def __init__(self, min_empresas=MIN_EMPRESAS_SETOR):
+        self.min_empresas = min_empresas
+        self._valores = {}
+        self._empresas = {}
+        self._agregados = {}
+        self._lock = threading.Lock()
+        # Limpo enquanto a montagem inicial roda em segundo plano (montar_indice_em_segundo_plano)
+        self.pronto = threading.Event()
+        self.pronto.set()
+
+    @staticmethod
+    def _valores_validos(dados):
+        valores = {}
+        for campo in CAMPOS_SETORIAIS:
+            valor = dados.get(campo)
+            if valor is None:
+                continue
+            valor = float(valor)
+            if not np.isfinite(valor) or (campo in CAMPOS_SETORIAIS_POSITIVOS and valor <= 0):
+                continue
+            valores[campo] = valor
+        return valores
+
+    def _retirar(self, ticker):
+        anterior = self._empresas.pop(ticker, None)
+        if anterior is None:
+            return
+        setor, valores = anterior
+        for campo, valor in valores.items():
+            lista = self._valores[setor][campo]
+            del lista[bisect.bisect_left(lista, valor)]
+        self._agregados.pop(setor, None)
+
+    def atualizar(self, ticker, dados):
+        """Substitui os fundamentos do ticker: O(log n) para achar a posição em cada lista do setor"""
+        setor = normalizar_setor(dados.get('setor'))
+        valores = self._valores_validos(dados)
+        with self._lock:
+            self._retirar(ticker)
+            if setor is None or not valores:
+                return
+            listas = self._valores.setdefault(setor, {campo: [] for campo in CAMPOS_SETORIAIS})
+            for campo, valor in valores.items():
+                bisect.insort(listas[campo], valor)
+            self._empresas[ticker] = (setor, valores)
+            self._agregados.pop(setor, None)
+
+    def remover(self, ticker):
+        with self._lock:
+            self._retirar(ticker)
+
+    def agregados(self, setor):
+        """Mediana, média aparada, percentis e contagem de cada indicador do setor (recalculados só se o setor mudou)"""
+        setor = normalizar_setor(setor)
+        with self._lock:
+            if setor in self._agregados:
+                return self._agregados[setor]
+            resultado = {}
+            for campo, lista in self._valores.get(setor, {}).items():
+                if not lista:
+                    continue
+                corte = int(len(lista) * CORTE_MEDIA_APARADA)
+                aparada = lista[corte:len(lista) - corte]
+                resultado[campo] = {
+                    'n': len(lista),
+                    'mediana': percentil_ordenado(lista, 50),
+                    'media_aparada': sum(aparada) / len(aparada),
+                    'p25': percentil_ordenado(lista, 25),
+                    'p75': percentil_ordenado(lista, 75),
+                }
+            self._agregados[setor] = resultado
+            return resultado
+
+    def dados_setor(self, setor):
+        """Medianas do setor no formato de DADOS_SETOR_PADRAO; indicadores com poucas empresas usam a referência padrão"""
+        dados = dict(DADOS_SETOR_PADRAO)
+        for campo, agregado in self.agregados(setor).items():
+            if agregado['n'] >= self.min_empresas:
+                dados[campo] = agregado['mediana']
+        return dados
+
+    def setores(self):
+        with self._lock:
+            return {setor: sum(1 for s, _ in self._empresas.values() if s == setor) for setor in self._valores}
+
+    def __len__(self):
+        return len(self._empresas)
+
+    def __contains__(self, ticker):
+        return ticker in self._empresas
+
+# Colunas numéricas do universo compacto (float64, NaN = ausente) e colunas de texto (codificadas)
+CAMPOS_COMPACTOS = ('preco_atual', 'pl', 'pvp', 'dy', 'roe', 'lpa', 'vpa', 'margem_liquida')
+TEXTOS_COMPACTOS = ('nome', 'setor', 'fonte_fundamentais')
+
+
+class VisaoEmpresa(Mapping):
+    """Linha do UniversoCompacto vista como o dict dados_empresa: só as chaves com valor, histórico montado sob demanda"""
+
+    __slots__ = ('universo', 'posicao')
+
+    def __init__(self, universo, posicao):
+        self.universo = universo
+        self.posicao = posicao
+
+    def _valor(self, chave):
+        universo, i = self.universo, self.posicao
+        if chave == 'ticker':
+            return universo.tickers[i]
+        if chave in universo.colunas:
+            valor = universo.colunas[chave][i]
+            return float(valor) if np.isfinite(valor) else None
+        if chave in universo.textos:
+            codigo = universo.textos[chave][i]
+            return universo.categorias[chave][codigo] if codigo >= 0 else None
+        if chave == 'multiplos_historicos':
+            historicos = {
+                multiplo: float(universo.colunas_historicas[multiplo][i])
+                for multiplo, _ in MULTIPLOS_BANDAS if np.isfinite(universo.colunas_historicas[multiplo][i])
+            }
+            return historicos or None
+        if chave == 'historico':
+            return universo.historico(i)
+        return None
+
+    def __getitem__(self, chave):
+        valor = self._valor(chave)
+        if valor is None:
+            raise KeyError(chave)
+        return valor
+
+    def __iter__(self):
+        chaves = ('ticker',) + CAMPOS_COMPACTOS + TEXTOS_COMPACTOS + ('multiplos_historicos',)
+        yield from (chave for chave in chaves if self._valor(chave) is not None)
+        # Presença do histórico sem montar o DataFrame
+        if len(self.universo.datas) and np.isfinite(self.universo.precos[:, self.posicao]).any():
+            yield 'historico'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        # Entre processos vai só a linha, não o universo inteiro
+        return (dict, (dict(self),))
+
+    def __repr__(self):
+        return f"VisaoEmpresa({self.universo.tickers[self.posicao]!r})"
+
+
+class UniversoCompacto:
+    """Universo em colunas: um array NumPy por indicador e uma matriz de fechamentos (datas × tickers) alinhada"""
+
+    def __init__(self, tickers, colunas, textos, categorias, colunas_historicas, datas, precos):
+        self.tickers = list(tickers)
+        self.colunas = colunas
+        self.textos = textos
+        self.categorias = categorias
+        self.colunas_historicas = colunas_historicas
+        self.datas = datas
+        self.precos = precos
+        self._posicoes = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def de_empresas(cls, empresas, dtype_precos=np.float64, com_precos=True):
+        """Monta o universo a partir de dicts dados_empresa em uma passada: cada dict é reduzido e descartado ao chegar"""
+        tickers = []
+        valores = {campo: [] for campo in CAMPOS_COMPACTOS}
+        historicos = {multiplo: [] for multiplo, _ in MULTIPLOS_BANDAS}
+        textos_brutos = {campo: [] for campo in TEXTOS_COMPACTOS}
+        # Só datas e fechamentos de cada histórico ficam até o alinhamento, não o DataFrame OHLCV
+        fechamentos = []
+        for i, dados in enumerate(empresas):
+            tickers.append(dados.get('ticker'))
+            for campo in CAMPOS_COMPACTOS:
+                valor = dados.get(campo)
+                if valor is None and campo == 'dy':
+                    valor = dados.get('dividend_yield')
+                valores[campo].append(np.nan if valor is None else valor)
+            multiplos = dados.get('multiplos_historicos') or {}
+            for multiplo in historicos:
+                valor = multiplos.get(multiplo)
+                historicos[multiplo].append(np.nan if valor is None else valor)
+            for campo in TEXTOS_COMPACTOS:
+                textos_brutos[campo].append(dados.get(campo) or None)
+            historico = dados.get('historico')
+            if com_precos and historico is not None and not historico.empty:
+                fechamentos.append((i, historico.index, historico['Close'].to_numpy(dtype=dtype_precos, copy=True)))
+        
+        n = len(tickers)
+        colunas = {campo: np.array(lista, dtype=float) for campo, lista in valores.items()}
+        colunas_historicas = {multiplo: np.array(lista, dtype=float) for multiplo, lista in historicos.items()}
+        
+        # Textos repetidos (setor, fonte) guardados uma vez: código por empresa, -1 = ausente
+        textos, categorias = {}, {}
+        for campo, lista in textos_brutos.items():
+            categorias[campo] = sorted({valor for valor in lista if valor is not None})
+            codigos = {valor: codigo for codigo, valor in enumerate(categorias[campo])}
+            textos[campo] = np.array([codigos.get(valor, -1) for valor in lista], dtype=np.int32)
+        
+        if fechamentos:
+            datas = fechamentos[0][1]
+            for _, indice, _ in fechamentos[1:]:
+                datas = datas.union(indice)
+            precos = np.full((len(datas), n), np.nan, dtype=dtype_precos)
+            for i, indice, fechamento in fechamentos:
+                precos[datas.get_indexer(indice), i] = fechamento
+        else:
+            datas = pd.DatetimeIndex([], name='Date')
+            precos = np.empty((0, n), dtype=dtype_precos)
+        return cls(tickers, colunas, textos, categorias, colunas_historicas, datas, precos)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self._posicoes
+
+    def __getitem__(self, ticker):
+        return VisaoEmpresa(self, self._posicoes[ticker])
+
+    def __iter__(self):
+        return (VisaoEmpresa(self, i) for i in range(len(self.tickers)))
+
+    def coluna(self, campo):
+        """Indicador de todas as empresas (sem cópia); NaN onde faltar"""
+        if campo in self.colunas:
+            return self.colunas[campo]
+        return self.colunas_historicas[campo.removesuffix('_historico')]
+
+    def coluna_texto(self, campo):
+        """Texto de todas as empresas (None onde faltar), decodificado das categorias"""
+        categorias = self.categorias[campo]
+        return [categorias[codigo] if codigo >= 0 else None for codigo in self.textos[campo]]
+    
+    def historico(self, posicao):
+        """Fechamentos de uma empresa como DataFrame com coluna 'Close', no formato do histórico do Yahoo"""
+        if not len(self.datas):
+            return None
+        fechamentos = pd.Series(self.precos[:, posicao], index=self.datas, dtype=float).dropna()
+        return fechamentos.to_frame('Close') if not fechamentos.empty else None
+
+    def registros(self):
+        """Um dict só com escalares por empresa (entrada de avaliar_empresa, barato de serializar)"""
+        return [{chave: visao[chave] for chave in visao if chave != 'historico'} for visao in self]
+
+    def filtrar(self, mascara):
+        """Novo universo só com as empresas da máscara booleana (ex.: universo.coluna('pl') < 10)"""
+        indices = np.flatnonzero(mascara)
+        return UniversoCompacto(
+            [self.tickers[i] for i in indices],
+            {campo: valores[indices] for campo, valores in self.colunas.items()},
+            {campo: codigos[indices] for campo, codigos in self.textos.items()},
+            self.categorias,
+            {multiplo: valores[indices] for multiplo, valores in self.colunas_historicas.items()},
+            self.datas,
+            self.precos[:, indices]
+        )
+
+    def para_dataframe(self):
+        """Indicadores e textos em um DataFrame indexado por ticker"""
+        tabela = pd.DataFrame(self.colunas, index=pd.Index(self.tickers, name='ticker'))
+        for campo, codigos in self.textos.items():
+            tabela[campo] = pd.Categorical.from_codes(codigos, self.categorias[campo])
+        return tabela
+
+    def memoria_bytes(self):
+        """Bytes ocupados pelos arrays do universo"""
+        arrays = [*self.colunas.values(), *self.textos.values(), *self.colunas_historicas.values(), self.precos]
+        return sum(array.nbytes for array in arrays) + self.datas.nbytes
+
+
+# Premissas padrão da triagem; no FCD o LPA serve de FCFF por ação (numero_acoes = 1)
+PREMISSAS_TRIAGEM = {
+    'crescimento_gordon': 0.025,
+    'retorno_gordon': 0.10,
+    'crescimento_estagio1': 8.0,
+    'crescimento_estagio2': 2.5,
+    'anos_estagio1': 5,
+    'wacc': 10.0,
+    'taxa_perpetuidade': 2.0
+}
+
+# Métodos que não entram no upside médio: EV/EBITDA ainda é um placeholder (preço + 10%) e só enviesaria a média
+METODOS_FORA_DA_MEDIA = {'ev_ebitda_setor'}
+
+
+class ValuationEngine:
+    def __init__(self, cache=None, http=None, dados_client=None, tempos=None, indice_setorial=None, protecao=None):
+        self.dados_client = dados_client if dados_client is not None else DadosConfiaveis(
+            cache=cache, http=http, tempos=tempos, indice_setorial=indice_setorial, protecao=protecao
+        )
+        self.tempos = tempos if tempos is not None else self.dados_client.tempos
+    
+    @cronometrado('motor.calcular_target_multiplos')
+    def calcular_target_multiplos(self, dados_empresa, metodo, dados_setor=None):
+        """Calcula target price por múltiplos"""
+        lpa = dados_empresa.get('lpa')
+        vpa = dados_empresa.get('vpa')
+        preco_atual = dados_empresa.get('preco_atual')
+        
+        if not preco_atual:
+            return None
+        
+        # Médias históricas vêm das bandas (get_dados_empresa com bandas=True); sem elas não há target
+        historicos = dados_empresa.get('multiplos_historicos') or {}
+        
+        if metodo == 'pl_historico' and lpa and historicos.get('pl'):
+            return lpa * historicos['pl']
+            
+        elif metodo == 'pl_setor' and lpa and dados_setor:
+            pl_setor = dados_setor.get('pl', 10)
+            return lpa * pl_setor
+            
+        elif metodo == 'pvp_historico' and vpa and historicos.get('pvp'):
+            return vpa * historicos['pvp']
+            
+        elif metodo == 'pvp_setor' and vpa and dados_setor:
+            pvp_setor = dados_setor.get('pvp', 1.2)
+            return vpa * pvp_setor
+            
+        elif metodo == 'ev_ebitda_setor':
+            ev_ebitda_setor = 6
+            return preco_atual * 1.1  # Simplificação
+        
+        return None
+    
+    @cronometrado('motor.modelo_gordon')
+    def modelo_gordon(self, dados_empresa, taxa_crescimento, taxa_retorno_requerida):
+        """Modelo de Gordon para valuation por dividendos"""
+        dy = dados_empresa.get('dy') or dados_empresa.get('dividend_yield')
+        preco_atual = dados_empresa.get('preco_atual')
+        
+        if not dy or not preco_atual or taxa_retorno_requerida <= taxa_crescimento:
+            return None
+        
+        dividendo_anual = preco_atual * dy
+        valor_justo = dividendo_anual / (taxa_retorno_requerida - taxa_crescimento)
+        return valor_justo
+    
+    @cronometrado('motor.fluxo_caixa_descontado')
+    def fluxo_caixa_descontado(self, premisas):
+        """Modelo de Fluxo de Caixa Descontado"""
+        try:
+            fcff_ano0 = premisas['fcff_inicial']
+            crescimento_estagio1 = premisas['crescimento_estagio1'] / 100
+            crescimento_estagio2 = premisas['crescimento_estagio2'] / 100
+            anos_estagio1 = premisas['anos_estagio1']
+            wacc = premisas['wacc'] / 100
+            taxa_perpetuidade = premisas['taxa_perpetuidade'] / 100
+            
+            if wacc <= taxa_perpetuidade:
+                return None
+            
+            # Calcular FCFF para cada ano
+            fluxos_estagio1 = []
+            fcff_atual = fcff_ano0
+            
+            for ano in range(1, anos_estagio1 + 1):
+                fcff_atual *= (1 + crescimento_estagio1)
+                valor_presente = fcff_atual / ((1 + wacc) ** ano)
+                fluxos_estagio1.append({
+                    'ano': ano,
+                    'fcff': fcff_atual,
+                    'vp': valor_presente
+                })
+            
+            # Calcular valor terminal
+            fcff_terminal = fcff_atual * (1 + crescimento_estagio2)
+            valor_terminal = fcff_terminal / (wacc - taxa_perpetuidade)
+            valor_presente_terminal = valor_terminal / ((1 + wacc) ** anos_estagio1)
+            
+            # Soma todos os valores presentes
+            vp_fluxos = sum([f['vp'] for f in fluxos_estagio1])
+            valor_empresa = vp_fluxos + valor_presente_terminal
+            
+            numero_acoes = premisas.get('numero_acoes', 1)
+            valor_por_acao = valor_empresa / numero_acoes
+            
+            return {
+                'valor_por_acao': valor_por_acao,
+                'valor_empresa': valor_empresa,
+                'fluxos_estagio1': fluxos_estagio1,
+                'valor_terminal': valor_terminal
+            }
+            
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            raise ErroPremissas(f"Erro no cálculo FCD: {e}") from e
+    
+    @cronometrado('motor.fluxo_caixa_descontado_fechado')
+    def fluxo_caixa_descontado_fechado(self, premisas):
+        """FCD em forma fechada com as derivadas analíticas do valor por ação (taxas por p.p., FCFF por R$)"""
+        try:
+            fcff_ano0 = float(premisas['fcff_inicial'])
+            crescimento_estagio1 = premisas['crescimento_estagio1'] / 100
+            crescimento_estagio2 = premisas['crescimento_estagio2'] / 100
+            anos_estagio1 = int(premisas['anos_estagio1'])
+            wacc = premisas['wacc'] / 100
+            taxa_perpetuidade = premisas['taxa_perpetuidade'] / 100
+            numero_acoes = premisas.get('numero_acoes', 1)
+            
+            if wacc <= taxa_perpetuidade:
+                return None
+            
+            # Fator de desconto líquido do crescimento: VP do estágio 1 = FCFF0 · Σ q^t, t = 1..N
+            q = (1 + crescimento_estagio1) / (1 + wacc)
+            q_n = q ** anos_estagio1
+            if abs(1 - q) < 1e-9:
+                soma = float(anos_estagio1)
+                d_soma = anos_estagio1 * (anos_estagio1 + 1) / 2
+            else:
+                soma = q * (1 - q_n) / (1 - q)
+                d_soma = (1 - (anos_estagio1 + 1) * q_n + anos_estagio1 * q_n * q) / (1 - q) ** 2
+            
+            spread = wacc - taxa_perpetuidade
+            terminal = q_n * (1 + crescimento_estagio2) / spread
+            d_terminal_q = anos_estagio1 * q ** (anos_estagio1 - 1) * (1 + crescimento_estagio2) / spread if anos_estagio1 else 0.0
+            
+            escala = fcff_ano0 / numero_acoes
+            valor_empresa = fcff_ano0 * (soma + terminal)
+            valor_por_acao = valor_empresa / numero_acoes
+            
+            # Regra da cadeia por q; o WACC também aparece explicitamente no spread do valor terminal
+            d_q = escala * (d_soma + d_terminal_q)
+            derivadas = {
+                'fcff_inicial': (soma + terminal) / numero_acoes,
+                'crescimento_estagio1': d_q / (1 + wacc) / 100,
+                'wacc': (-d_q * q / (1 + wacc) - escala * terminal / spread) / 100,
+                'crescimento_estagio2': escala * q_n / spread / 100,
+                'taxa_perpetuidade': escala * terminal / spread / 100,
+            }
+            
+            return {
+                'valor_por_acao': valor_por_acao,
+                'valor_empresa': valor_empresa,
+                'valor_terminal': fcff_ano0 * (1 + crescimento_estagio1) ** anos_estagio1 * (1 + crescimento_estagio2) / spread,
+                'derivadas': derivadas,
+                # Elasticidade: variação % do valor por variação % da premissa
+                'elasticidades': {
+                    chave: derivada * premisas[chave] / valor_por_acao if valor_por_acao else 0.0
+                    for chave, derivada in derivadas.items()
+                }
+            }
+            
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            raise ErroPremissas(f"Erro no cálculo FCD: {e}") from e
+    
+    def validar_derivadas_fcd(self, premisas, passo=1e-4):
+        """Compara as derivadas analíticas com diferenças finitas centrais do fluxo_caixa_descontado"""
+        fechado = self.fluxo_caixa_descontado_fechado(premisas)
+        if fechado is None:
+            return None
+        
+        validacao = {}
+        for chave, analitica in fechado['derivadas'].items():
+            # Passo relativo para o FCFF (em R$) e absoluto para as taxas (em p.p.)
+            h = passo * max(abs(premisas[chave]), 1.0) if chave == 'fcff_inicial' else passo
+            acima = self.fluxo_caixa_descontado(dict(premisas, **{chave: premisas[chave] + h}))
+            abaixo = self.fluxo_caixa_descontado(dict(premisas, **{chave: premisas[chave] - h}))
+            if acima is None or abaixo is None:
+                continue
+            numerica = (acima['valor_por_acao'] - abaixo['valor_por_acao']) / (2 * h)
+            validacao[chave] = {
+                'analitica': analitica,
+                'numerica': numerica,
+                'erro_relativo': abs(analitica - numerica) / max(abs(numerica), 1e-12)
+            }
+        return validacao
+    
+    @cronometrado('motor.fluxo_caixa_descontado_lote')
+    def fluxo_caixa_descontado_lote(self, premisas):
+        """FCD vetorizado: cada premissa pode ser escalar ou array, nas mesmas unidades de fluxo_caixa_descontado"""
+        fcff_ano0, crescimento_estagio1, crescimento_estagio2, anos_estagio1, wacc, taxa_perpetuidade, numero_acoes = np.broadcast_arrays(
+            np.asarray(premisas['fcff_inicial'], dtype=float),
+            np.asarray(premisas['crescimento_estagio1'], dtype=float) / 100,
+            np.asarray(premisas['crescimento_estagio2'], dtype=float) / 100,
+            np.asarray(premisas['anos_estagio1'], dtype=int),
+            np.asarray(premisas['wacc'], dtype=float) / 100,
+            np.asarray(premisas['taxa_perpetuidade'], dtype=float) / 100,
+            np.asarray(premisas.get('numero_acoes', 1), dtype=float)
+        )
+        
+        # Grade de anos até o maior horizonte; anos além de anos_estagio1 são mascarados
+        anos = np.arange(1, anos_estagio1.max(initial=0) + 1)
+        fcff = fcff_ano0[..., None] * (1 + crescimento_estagio1[..., None]) ** anos
+        valor_presente = fcff / (1 + wacc[..., None]) ** anos
+        vp_fluxos = np.where(anos <= anos_estagio1[..., None], valor_presente, 0.0).sum(axis=-1)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fcff_terminal = fcff_ano0 * (1 + crescimento_estagio1) ** anos_estagio1 * (1 + crescimento_estagio2)
+            valor_terminal = fcff_terminal / (wacc - taxa_perpetuidade)
+            valor_presente_terminal = valor_terminal / (1 + wacc) ** anos_estagio1
+            valor_empresa = vp_fluxos + valor_presente_terminal
+            valor_por_acao = valor_empresa / numero_acoes
+        
+        valido = wacc > taxa_perpetuidade
+        return {
+            'valor_por_acao': np.where(valido, valor_por_acao, np.nan),
+            'valor_empresa': np.where(valido, valor_empresa, np.nan),
+            'valor_terminal': np.where(valido, valor_terminal, np.nan),
+            'vp_fluxos': vp_fluxos,
+            'valido': valido
+        }
+    
+    @cronometrado('motor.superficie_gordon')
+    def superficie_gordon(self, dados_empresa, crescimentos, retornos):
+        """Valor justo de Gordon na grade crescimento × retorno requerido (decimais); NaN onde r <= g"""
+        dy = dados_empresa.get('dy') or dados_empresa.get('dividend_yield')
+        preco_atual = dados_empresa.get('preco_atual')
+        if not dy or not preco_atual:
+            return None
+        
+        crescimento = np.asarray(crescimentos, dtype=float)[:, None]
+        retorno = np.asarray(retornos, dtype=float)[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            valor_justo = preco_atual * dy / (retorno - crescimento)
+        return np.where(retorno > crescimento, valor_justo, np.nan)
+    
+    @cronometrado('motor.superficie_fcd')
+    def superficie_fcd(self, premisas, waccs, taxas_perpetuidade):
+        """Valor por ação do FCD na grade WACC × crescimento perpétuo (em %); NaN onde WACC <= g"""
+        grade = dict(
+            premisas,
+            wacc=np.asarray(waccs, dtype=float)[:, None],
+            taxa_perpetuidade=np.asarray(taxas_perpetuidade, dtype=float)[None, :]
+        )
+        return self.fluxo_caixa_descontado_lote(grade)['valor_por_acao']
+    
+    @cronometrado('motor.triagem_universo')
+    def triagem_universo(self, tickers=None, max_threads=8, dados_setor=None, premissas=None):
+        """Avalia todo o universo: buscas em threads (I/O) e cálculos vetorizados no processo; retorna ranking por upside"""
+        cliente = self.dados_client
+        universo = cliente.get_universo_compacto(tickers, max_threads, bandas=True)
+        if not len(universo):
+            return pd.DataFrame()
+        
+        # Sem referência explícita, cada empresa é comparada às medianas do próprio setor
+        if dados_setor:
+            setores = [dados_setor] * len(universo)
+        else:
+            setores = [cliente.indice_setorial.dados_setor(setor) for setor in universo.coluna_texto('setor')]
+        
+        ranking = self.avaliar_universo(universo, setores, premissas)
+        # Expectativas implícitas no preço: uma passada vetorizada para o universo inteiro
+        ranking = ranking.join(self.expectativas_implicitas(universo, premissas))
+        return ranking.sort_values('upside_medio', ascending=False, na_position='last')
+    
+    @cronometrado('motor.avaliar_universo')
+    def avaliar_universo(self, universo, setores, premissas=None):
+        """avaliar_empresa em colunas: os mesmos targets e upsides para o universo inteiro, sem laço por empresa"""
+        premissas = dict(PREMISSAS_TRIAGEM, **(premissas or {}))
+        setores = [dados_setor or DADOS_SETOR_PADRAO for dados_setor in setores]
+        
+        def coluna(campo):
+            # Ausente, NaN e zero valem como "sem dado", como no teste de verdade do caminho por empresa
+            valores = universo.coluna(campo)
+            return np.where(np.isfinite(valores) & (valores != 0), valores, np.nan)
+        
+        preco_atual = coluna('preco_atual')
+        lpa, vpa, dy = coluna('lpa'), coluna('vpa'), coluna('dy')
+        
+        valores = {
+            'pl_historico': lpa * coluna('pl_historico'),
+            'pl_setor': lpa * np.array([dados_setor.get('pl', 10) for dados_setor in setores], dtype=float),
+            'pvp_historico': vpa * coluna('pvp_historico'),
+            'pvp_setor': vpa * np.array([dados_setor.get('pvp', 1.2) for dados_setor in setores], dtype=float),
+            'ev_ebitda_setor': preco_atual * 1.1  # Simplificação, como em calcular_target_multiplos
+        }
+        
+        crescimento, retorno = premissas['crescimento_gordon'], premissas['retorno_gordon']
+        valores['gordon'] = preco_atual * dy / (retorno - crescimento) if retorno > crescimento else np.full(len(universo), np.nan)
+        
+        fcd = self.fluxo_caixa_descontado_lote({
+            'fcff_inicial': np.where(lpa > 0, lpa, np.nan),
+            'crescimento_estagio1': premissas['crescimento_estagio1'],
+            'crescimento_estagio2': premissas['crescimento_estagio2'],
+            'anos_estagio1': premissas['anos_estagio1'],
+            'wacc': premissas['wacc'],
+            'taxa_perpetuidade': premissas['taxa_perpetuidade']
+        })
+        valores['fcd'] = fcd['valor_por_acao']
+        
+        ranking = pd.DataFrame({
+            'ticker': universo.tickers,
+            'nome': universo.coluna_texto('nome'),
+            'preco_atual': preco_atual
+        })
+        upsides = {}
+        with np.errstate(invalid='ignore'):
+            for metodo, valor in valores.items():
+                valor = np.where(np.isfinite(valor) & np.isfinite(preco_atual), valor, np.nan)
+                ranking[f'target_{metodo}'] = valor
+                ranking[f'upside_{metodo}'] = upsides[metodo] = np.where(valor > 0, valor / preco_atual - 1, np.nan)
+        
+        na_media = np.column_stack([upside for metodo, upside in upsides.items() if metodo not in METODOS_FORA_DA_MEDIA])
+        contagem = np.isfinite(na_media).sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            ranking['upside_medio'] = np.nansum(na_media, axis=1) / np.where(contagem, contagem, np.nan)
+        return ranking.set_index('ticker')
+    
+    @cronometrado('motor.expectativas_implicitas')
+    def expectativas_implicitas(self, empresas, premissas=None, limites_crescimento=(-50.0, 100.0), wacc_maximo=100.0):
+        """Crescimento do estágio 1 e custo de capital (em %) que o preço atual implica, para todas as empresas de uma vez"""
+        premissas = dict(PREMISSAS_TRIAGEM, **(premissas or {}))
+        universo = empresas if isinstance(empresas, UniversoCompacto) else UniversoCompacto.de_empresas(empresas, com_precos=False)
+        tickers = universo.tickers
+        
+        def coluna(campo):
+            # Zero conta como ausente, como o `or` dos dicts
+            valores = universo.coluna(campo)
+            return np.where(valores != 0, valores, np.nan)
+        
+        preco = coluna('preco_atual')
+        lpa = coluna('lpa')
+        dy = coluna('dy')
+        
+        # Mesmo FCD da triagem: LPA como fluxo inicial; sem lucro positivo o FCD não se aplica
+        base = {
+            'fcff_inicial': np.where(lpa > 0, lpa, np.nan),
+            'crescimento_estagio1': premissas['crescimento_estagio1'],
+            'crescimento_estagio2': premissas['crescimento_estagio2'],
+            'anos_estagio1': premissas['anos_estagio1'],
+            'wacc': premissas['wacc'],
+            'taxa_perpetuidade': premissas['taxa_perpetuidade'],
+            'numero_acoes': 1
+        }
+        
+        def valor_por_acao(premissa):
+            return lambda x: self.fluxo_caixa_descontado_lote(dict(base, **{premissa: x}))['valor_por_acao']
+        
+        crescimento, status_crescimento = bissecao_vetorizada(
+            valor_por_acao('crescimento_estagio1'), preco, *limites_crescimento
+        )
+        # O valor cresce sem limite quando o WACC se aproxima da perpetuidade
+        wacc, status_wacc = bissecao_vetorizada(
+            valor_por_acao('wacc'), preco, premissas['taxa_perpetuidade'] + 0.01, wacc_maximo
+        )
+        
+        # Gordon: preço = preço · dy / (r - g)  =>  r = dy + g
+        gordon_valido = (dy > 0) & np.isfinite(preco)
+        retorno_gordon = np.where(gordon_valido, (dy + premissas['crescimento_gordon']) * 100, np.nan)
+        
+        return pd.DataFrame({
+            'crescimento_implicito': crescimento,
+            'status_crescimento_implicito': status_crescimento,
+            'wacc_implicito': wacc,
+            'status_wacc_implicito': status_wacc,
+            'retorno_gordon_implicito': retorno_gordon,
+            'status_retorno_gordon_implicito': np.where(gordon_valido, 'ok', 'dados_invalidos')
+        }, index=pd.Index(tickers, name='ticker'))
+    
+    @cronometrado('motor.monte_carlo_fcd')
+    def monte_carlo_fcd(self, premisas, distribuicoes, n_caminhos=1_000_000,
+                        tamanho_bloco=100_000, semente=None, n_bins=2000):
+        """Simulação Monte Carlo do FCD em blocos, com memória constante em relação a n_caminhos"""
+        rng = np.random.default_rng(semente)
+        acumulador = None
+        descartados = 0
+        
+        for inicio in range(0, n_caminhos, tamanho_bloco):
+            n = min(tamanho_bloco, n_caminhos - inicio)
+            bloco = dict(premisas)
+            for chave, especificacao in distribuicoes.items():
+                bloco[chave] = amostrar_distribuicao(rng, especificacao, n)
+            
+            valores = self.fluxo_caixa_descontado_lote(bloco)['valor_por_acao']
+            validos = valores[np.isfinite(valores)]
+            descartados += n - validos.size
+            
+            # A faixa do histograma é fixada pelo primeiro bloco com caminhos válidos
+            if acumulador is None and validos.size:
+                limite_inferior, limite_superior = np.percentile(validos, [0.1, 99.9])
+                margem = (limite_superior - limite_inferior) * 0.5 or abs(limite_superior) or 1.0
+                acumulador = AcumuladorDistribuicao(
+                    limite_inferior - margem, limite_superior + margem, n_bins
+                )
+            if acumulador is not None:
+                acumulador.adicionar(validos)
+        
+        if acumulador is None:
+            return None
+        
+        p5, p50, p95 = acumulador.percentis([5, 50, 95])
+        return {
+            'acumulador': acumulador,
+            'n_caminhos': n_caminhos,
+            'descartados': descartados,
+            'media': acumulador.media,
+            'desvio': acumulador.desvio,
+            'p5': p5,
+            'p50': p50,
+            'p95': p95
+        }
+
+
+def avaliar_empresa(dados_empresa, dados_setor=None, premissas=None, valuation=None):
+    """Roda todos os métodos de valuation para uma empresa (a triagem usa a versão em colunas, avaliar_universo)"""
+    premissas = dict(PREMISSAS_TRIAGEM, **(premissas or {}))
+    dados_setor = dados_setor or DADOS_SETOR_PADRAO
+    valuation = valuation or ValuationEngine()
+    preco_atual = dados_empresa.get('preco_atual')
+    
+    linha = {
+        'ticker': dados_empresa.get('ticker'),
+        'nome': dados_empresa.get('nome'),
+        'preco_atual': preco_atual
+    }
+    valores = {}
+    
+    for metodo, _ in METODOS_MULTIPLOS:
+        valores[metodo] = valuation.calcular_target_multiplos(dados_empresa, metodo, dados_setor)
+    
+    valores['gordon'] = valuation.modelo_gordon(
+        dados_empresa, premissas['crescimento_gordon'], premissas['retorno_gordon']
+    )
+    
+    lpa = dados_empresa.get('lpa')
+    valores['fcd'] = None
+    if lpa and lpa > 0:
+        resultado_fcd = valuation.fluxo_caixa_descontado({
+            'fcff_inicial': lpa,
+            'crescimento_estagio1': premissas['crescimento_estagio1'],
+            'crescimento_estagio2': premissas['crescimento_estagio2'],
+            'anos_estagio1': premissas['anos_estagio1'],
+            'wacc': premissas['wacc'],
+            'taxa_perpetuidade': premissas['taxa_perpetuidade'],
+            'numero_acoes': 1
+        })
+        if resultado_fcd:
+            valores['fcd'] = resultado_fcd['valor_por_acao']
+    
+    upsides = []
+    for metodo, valor in valores.items():
+        upside = None
+        if valor and valor > 0 and preco_atual:
+            upside = (valor / preco_atual) - 1
+            if metodo not in METODOS_FORA_DA_MEDIA:
+                upsides.append(upside)
+        linha[f'target_{metodo}'] = valor
+        linha[f'upside_{metodo}'] = upside
+    
+    linha['upside_medio'] = float(np.mean(upsides)) if upsides else None
+    return linha
+
+
+def avaliar_ticker(ticker, valuation=None, dados_setor=None, premissas=None):
+    """Busca os dados de um ticker e roda todos os métodos de valuation, sem interface"""
+    valuation = valuation or ValuationEngine()
+    dados_empresa = valuation.dados_client.get_dados_empresa(ticker, bandas=True)
+    dados_setor = dados_setor or valuation.dados_client.indice_setorial.dados_setor(dados_empresa.get('setor'))
+    linha = avaliar_empresa(dados_empresa, dados_setor, premissas, valuation)
+    linha['erros'] = [str(erro) for erro in dados_empresa['erros']]
+    return linha